@@ -0,0 +1,151 @@
+"""
+Benchmark the chat routing LLM calls: separate prompts vs combined prompt.
+
+  separate: intent.txt, then transfer_extractor.txt for transfers (2 calls)
+  combined: intent_transfer.txt (1 call)
+
+Reports latency (p50/p95/mean), upstream calls, intent accuracy and transfer
+entity accuracy for each mode. The local fast-path classifier is bypassed so
+both modes always hit the LLM.
+
+Usage:
+    python benchmark_combined_intent.py [--runs 3] [--dataset cases.jsonl]
+
+A dataset file has one JSON object per line:
+    {"text": "...", "intent": "Transfer", "account_number": "123", "amount": 100000}
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(__file__))
+from hyperclovax import detect_intent_with_llm, extract_transfer_details, detect_intent_and_transfer_details
+
+DEFAULT_CASES = [
+    {"text": "Please send 500,000 VND to account 1234567890 for my monthly rent payment.",
+     "intent": "Transfer", "account_number": "1234567890", "amount": 500000},
+    {"text": "Tôi muốn chuyển 200,000 đồng cho tài khoản 9876543210 tiền ăn trưa",
+     "intent": "Transfer", "account_number": "9876543210", "amount": 200000},
+    {"text": "chuyển khoản 1.500.000đ vào stk 0011223344 nhé",
+     "intent": "Transfer", "account_number": "0011223344", "amount": 1500000},
+    {"text": "50,000원을 계좌 5550001111으로 송금해줘",
+     "intent": "Transfer", "account_number": "5550001111", "amount": 50000},
+    {"text": "Can you help me transfer money?",
+     "intent": "Transfer", "account_number": None, "amount": None},
+    {"text": "Is this email legit or phishing? 'Your account is locked, click here to verify'",
+     "intent": "Scam Check"},
+    {"text": "tin nhắn này có phải lừa đảo không: 'Bạn đã trúng thưởng 100 triệu, nhấn vào link'",
+     "intent": "Scam Check"},
+    {"text": "이 링크 안전한가요? 피싱인가요?",
+     "intent": "Scam Check"},
+    {"text": "Tell me how transformers work.",
+     "intent": "Normal"},
+    {"text": "giải thích giúp mình cách tiết kiệm tiền hiệu quả",
+     "intent": "Normal"},
+]
+
+
+def load_cases(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def normalize_account(value):
+    return "".join(ch for ch in str(value) if ch.isdigit()) if value else None
+
+
+def normalize_amount(value):
+    if value is None:
+        return None
+    try:
+        return int(str(value).replace(",", "").replace(".", ""))
+    except ValueError:
+        return None
+
+
+def entities_match(case: dict, details: dict) -> bool:
+    return (
+        normalize_account(details.get("account_number")) == normalize_account(case.get("account_number"))
+        and normalize_amount(details.get("amount")) == normalize_amount(case.get("amount"))
+    )
+
+
+async def run_separate(text: str):
+    calls = 1
+    intent = await detect_intent_with_llm(text) or "Normal"
+    details = {}
+    if intent == "Transfer":
+        calls += 1
+        details = await extract_transfer_details(text)
+    return intent, details, calls
+
+
+async def run_combined(text: str):
+    result = await detect_intent_and_transfer_details(text)
+    if result is None:
+        # Mirrors chat_endpoint: a failed combined call falls back to the two prompts
+        intent, details, calls = await run_separate(text)
+        return intent, details, calls + 1
+    return result["intent"], result["transfer_details"], 1
+
+
+async def benchmark(mode: str, runner, cases: list, runs: int) -> dict:
+    latencies, calls = [], 0
+    intent_correct = entity_total = entity_correct = 0
+    for _ in range(runs):
+        for case in cases:
+            started = time.perf_counter()
+            intent, details, n_calls = await runner(case["text"])
+            latencies.append((time.perf_counter() - started) * 1000)
+            calls += n_calls
+            intent_correct += intent == case["intent"]
+            if case["intent"] == "Transfer":
+                entity_total += 1
+                entity_correct += intent == "Transfer" and entities_match(case, details)
+
+    total = len(cases) * runs
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": total,
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 1),
+        "mean_ms": round(statistics.mean(latencies), 1),
+        "upstream_calls": calls,
+        "intent_accuracy": round(intent_correct / total, 3),
+        "entity_accuracy": round(entity_correct / entity_total, 3) if entity_total else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark separate vs combined intent+entities calls")
+    parser.add_argument("--runs", type=int, default=3, help="Passes over the dataset per mode")
+    parser.add_argument("--dataset", help="JSONL file with labelled cases (default: built-in set)")
+    args = parser.parse_args()
+
+    cases = load_cases(args.dataset) if args.dataset else DEFAULT_CASES
+    print(f"📊 Benchmarking {len(cases)} cases x {args.runs} runs per mode...")
+
+    results = [
+        await benchmark("separate", run_separate, cases, args.runs),
+        await benchmark("combined", run_combined, cases, args.runs),
+    ]
+
+    print()
+    header = f"{'mode':<10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'calls':>8}{'intent acc':>12}{'entity acc':>12}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        entity_acc = "n/a" if r["entity_accuracy"] is None else f"{r['entity_accuracy']:.3f}"
+        print(
+            f"{r['mode']:<10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['mean_ms']:>10}"
+            f"{r['upstream_calls']:>8}{r['intent_accuracy']:>12.3f}{entity_acc:>12}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
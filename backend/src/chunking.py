@@ -0,0 +1,143 @@
+"""
+Sentence-aware chunking for the RAG knowledge base.
+
+MilvusRAGDB.build used to embed each .txt file whole and store the entire
+file in the metadata VARCHAR; long articles went past the embedding model's
+useful context and every hit shipped the whole document for callers to slice
+[:400]. Documents are now split into chunks of about CHUNK_SIZE_CHARS that
+end on sentence boundaries, with about CHUNK_OVERLAP_CHARS of whole sentences
+repeated between neighbours. Each chunk is a separate row whose metadata keeps
+its source, position and character offsets in the original file, so search
+hits are passages and can be folded back per document when needed.
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+CHUNK_SIZE_CHARS = int(os.getenv("CHUNK_SIZE_CHARS", "400"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("CHUNK_OVERLAP_CHARS", "80"))
+
+# Sentence ends: terminal punctuation (optionally closed by quotes/brackets) followed by
+# whitespace, or a line break. Covers Vietnamese, English and Korean text.
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…。])[\"'”’)\]]*\s+|\n+")
+
+
+@dataclass
+class Chunk:
+    text: str
+    start: int  # Character offsets in the original document
+    end: int
+    index: int
+
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the non-blank sentences in text."""
+    spans = []
+    position = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        spans.append((position, match.start()))
+        position = match.end()
+    spans.append((position, len(text)))
+    return [(start, end) for start, end in spans if text[start:end].strip()]
+
+
+def _split_long(text: str, start: int, end: int, size: int) -> List[Tuple[int, int]]:
+    """Cut a sentence longer than size at whitespace (or hard, if there is none)."""
+    pieces = []
+    while end - start > size:
+        cut = text.rfind(" ", start + 1, start + size)
+        cut = cut if cut > start else start + size
+        pieces.append((start, cut))
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    if start < end:
+        pieces.append((start, end))
+    return pieces
+
+
+def chunk_text(text: str, size: int = CHUNK_SIZE_CHARS, overlap: int = CHUNK_OVERLAP_CHARS) -> List[Chunk]:
+    """
+    Split a document into sentence-aligned chunks.
+
+    Args:
+        text: The document
+        size: Target maximum chunk length in characters
+        overlap: Characters of trailing whole sentences repeated at the start of the next chunk
+
+    Returns:
+        Chunks in document order, with offsets into text
+    """
+    size = max(1, size)
+    overlap = max(0, min(overlap, size // 2))
+    sentences = []
+    for start, end in split_sentences(text):
+        sentences.extend(_split_long(text, start, end, size))
+
+    chunks: List[Chunk] = []
+    i = 0
+    while i < len(sentences):
+        j = i
+        while j + 1 < len(sentences) and sentences[j + 1][1] - sentences[i][0] <= size:
+            j += 1
+        start, end = sentences[i][0], sentences[j][1]
+        chunks.append(Chunk(text=text[start:end].strip(), start=start, end=end, index=len(chunks)))
+        if j + 1 >= len(sentences):
+            break
+        # Start the next chunk on the earliest sentence inside the overlap window, as long as the
+        # next chunk still fits its first new sentence (otherwise it would repeat this one's tail only)
+        next_i = j + 1
+        new_end = sentences[j + 1][1]
+        while (next_i - 1 > i and end - sentences[next_i - 1][0] <= overlap
+               and new_end - sentences[next_i - 1][0] <= size):
+            next_i -= 1
+        i = next_i
+    return chunks
+
+
+def chunk_metadata(source: str, chunk: Chunk, chunk_count: int) -> dict:
+    """Metadata stored with a chunk row (source and text keep the shape callers already read)."""
+    return {
+        "source": source,
+        "text": chunk.text,
+        "chunk_index": chunk.index,
+        "chunk_count": chunk_count,
+        "char_start": chunk.start,
+        "char_end": chunk.end,
+    }
+
+
+def aggregate_by_document(hits: List[dict], top_k: int) -> List[dict]:
+    """
+    Fold chunk-level hits back into one hit per source document.
+
+    The document scores as its best chunk (COSINE: higher is closer); its text is the
+    matched chunks joined in document order, and the chunk hits are kept under "chunks".
+    """
+    documents = {}
+    for hit in hits:
+        source = hit["metadata"].get("source")
+        document = documents.get(source)
+        if document is None:
+            documents[source] = {"id": hit["id"], "distance": hit["distance"], "chunks": [hit]}
+        else:
+            document["chunks"].append(hit)
+            if hit["distance"] > document["distance"]:
+                document["id"], document["distance"] = hit["id"], hit["distance"]
+
+    results = []
+    for source, document in documents.items():
+        ordered = sorted(document["chunks"], key=lambda h: h["metadata"].get("chunk_index", 0))
+        results.append({
+            "id": document["id"],
+            "distance": document["distance"],
+            "metadata": {
+                "source": source,
+                "text": "\n...\n".join(h["metadata"]["text"] for h in ordered),
+                "chunk_count": ordered[0]["metadata"].get("chunk_count", 1),
+            },
+            "chunks": ordered,
+        })
+    results.sort(key=lambda r: r["distance"], reverse=True)
+    return results[:top_k]
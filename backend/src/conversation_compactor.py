@@ -0,0 +1,209 @@
+"""
+Token-budgeted compaction of chat histories before they are sent to HCX-005.
+
+The web client sends the whole conversation (including every earlier base64
+image) on every turn. Before formatting, the history is compacted to the
+endpoint's token budget:
+
+- system messages are always kept
+- only the newest CHAT_IMAGES_AS_PIXELS distinct images are forwarded; older
+  ones and repeats become a short placeholder (see image_store)
+- the newest turns are kept while they fit, the current turn always
+- older turns are folded into an extractive summary note appended to the
+  system prompt
+
+Token counts are approximate (script-aware character heuristics), which is
+enough to keep prompt size bounded without a tokenizer dependency.
+"""
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from image_store import image_of, request_image_store
+
+CONTEXT_TOKEN_BUDGETS = {
+    "chat": int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000")),
+    "chat_with_rag": int(os.getenv("CHAT_RAG_CONTEXT_TOKEN_BUDGET", "6000")),
+}
+CONTEXT_IMAGE_TOKENS = int(os.getenv("CONTEXT_IMAGE_TOKENS", "1200"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "300"))
+
+SUMMARY_HEADER = "Summary of earlier conversation (older turns omitted):"
+SUMMARY_SNIPPET_CHARS = 160
+# Per-message role/formatting overhead
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Hangul, CJK and kana are roughly one token per character
+_DENSE_SCRIPT_RE = re.compile(r"[\u1100-\u11ff\u3040-\u30ff\u3130-\u318f\u4e00-\u9fff\uac00-\ud7af]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count for mixed Vietnamese/English/Korean text."""
+    if not text:
+        return 0
+    dense = len(_DENSE_SCRIPT_RE.findall(text))
+    return dense + math.ceil((len(text) - dense) / 3)
+
+
+def _text_of(msg: dict) -> str:
+    return msg.get("content") or msg.get("text") or ""
+
+
+def _has_image(msg: dict) -> bool:
+    return image_of(msg) is not None
+
+
+def message_tokens(msg: dict) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(_text_of(msg))
+    if _has_image(msg):
+        tokens += CONTEXT_IMAGE_TOKENS
+    return tokens
+
+
+@dataclass
+class CompactionReport:
+    tokens_before: int
+    tokens_after: int
+    messages_dropped: int
+    images_replaced: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+def _without_image(msg: dict, placeholder: str) -> dict:
+    text = _text_of(msg)
+    stripped = {k: v for k, v in msg.items() if k not in ("image_data", "image_url", "text")}
+    stripped["content"] = f"{text}\n{placeholder}" if text else placeholder
+    return stripped
+
+
+def _summarize(dropped: List[dict], max_tokens: int) -> str:
+    """Extractive summary: the start of each dropped turn, newest first until the budget is spent."""
+    lines = []
+    used = estimate_tokens(SUMMARY_HEADER)
+    for msg in reversed(dropped):
+        snippet = _WHITESPACE_RE.sub(" ", _text_of(msg)).strip()
+        if not snippet:
+            continue
+        if len(snippet) > SUMMARY_SNIPPET_CHARS:
+            snippet = snippet[:SUMMARY_SNIPPET_CHARS].rstrip() + "..."
+        line = f"- {msg.get('role', 'user').capitalize()}: {snippet}"
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return ""
+    return "\n".join([SUMMARY_HEADER] + list(reversed(lines)))
+
+
+class ConversationCompactor:
+    def __init__(self, budgets: Dict[str, int] = None, summary_max_tokens: int = CONTEXT_SUMMARY_MAX_TOKENS):
+        self.budgets = budgets or CONTEXT_TOKEN_BUDGETS
+        self.summary_max_tokens = summary_max_tokens
+        self._stats: Dict[str, dict] = {}
+
+    def compact(self, messages: List[dict], endpoint: str) -> Tuple[List[dict], CompactionReport]:
+        """
+        Compact a ChatRequest-style message list to the endpoint's token budget.
+
+        Args:
+            messages: Message dicts (role, content/text, image_data/image_url); not modified
+            endpoint: Budget name ("chat" or "chat_with_rag")
+
+        Returns:
+            (compacted messages, report)
+        """
+        budget = self.budgets.get(endpoint, self.budgets["chat"])
+        tokens_before = sum(message_tokens(m) for m in messages)
+
+        # Only the newest distinct images are forwarded as pixels
+        images = request_image_store()
+        pixel_images = images.pixel_images(messages)
+        kept_digests = {images.digest(image_of(messages[i])) for i in pixel_images}
+        images_replaced = 0
+        working = []
+        for i, msg in enumerate(messages):
+            if _has_image(msg) and i not in pixel_images:
+                working.append(_without_image(msg, images.placeholder_for(image_of(msg), kept_digests)))
+                images_replaced += 1
+            else:
+                working.append(msg)
+
+        system = [m for m in working if m.get("role") == "system"]
+        turns = [m for m in working if m.get("role") != "system"]
+
+        remaining = budget - sum(message_tokens(m) for m in system)
+        kept: List[dict] = []
+        if sum(message_tokens(m) for m in turns) > remaining:
+            remaining -= self.summary_max_tokens
+        for msg in reversed(turns):
+            cost = message_tokens(msg)
+            if kept and cost > remaining:
+                break
+            kept.append(msg)
+            remaining -= cost
+        kept.reverse()
+        # Don't start the kept history with an orphaned assistant reply
+        while len(kept) > 1 and kept[0].get("role") == "assistant":
+            kept.pop(0)
+        dropped = turns[:len(turns) - len(kept)]
+
+        if dropped:
+            summary = _summarize(dropped, self.summary_max_tokens)
+            if summary:
+                if system:
+                    first = dict(system[0])
+                    first["content"] = f"{_text_of(first)}\n\n{summary}"
+                    first.pop("text", None)
+                    system = [first] + system[1:]
+                else:
+                    system = [{"role": "system", "content": summary}]
+
+        compacted = system + kept
+        report = CompactionReport(
+            tokens_before=tokens_before,
+            tokens_after=sum(message_tokens(m) for m in compacted),
+            messages_dropped=len(dropped),
+            images_replaced=images_replaced,
+        )
+        self._record(endpoint, report)
+        if report.messages_dropped or report.images_replaced:
+            print(
+                f"✂️ Compacted {endpoint} history: ~{report.tokens_before} -> ~{report.tokens_after} tokens "
+                f"({report.messages_dropped} turns summarized, {report.images_replaced} images replaced)"
+            )
+        return compacted, report
+
+    def _record(self, endpoint: str, report: CompactionReport):
+        stats = self._stats.setdefault(endpoint, {
+            "requests": 0, "compacted": 0, "tokens_before": 0, "tokens_saved": 0,
+            "messages_dropped": 0, "images_replaced": 0,
+        })
+        stats["requests"] += 1
+        stats["compacted"] += bool(report.tokens_saved > 0)
+        stats["tokens_before"] += report.tokens_before
+        stats["tokens_saved"] += report.tokens_saved
+        stats["messages_dropped"] += report.messages_dropped
+        stats["images_replaced"] += report.images_replaced
+
+    def stats(self) -> dict:
+        return {
+            "budgets": self.budgets,
+            "endpoints": {
+                name: {
+                    **s,
+                    "avg_tokens_saved": round(s["tokens_saved"] / s["requests"], 1) if s["requests"] else 0.0,
+                }
+                for name, s in self._stats.items()
+            },
+        }
+
+
+conversation_compactor = ConversationCompactor()
@@ -0,0 +1,248 @@
+"""
+Two-tier embedding cache for MilvusRAGDB.
+
+Every rag_db.search re-embedded its query and every knowledge-base rebuild
+re-embedded every document, even when the text had not changed. Vectors are
+now cached under a hash of the model name and the normalized text:
+
+- memory tier: LRU of float32 vectors bounded by entry count and bytes
+- disk tier: SQLite table of float32 blobs that survives restarts, pruned to
+  EMBEDDING_CACHE_DISK_MAX_ENTRIES least-recently-used rows
+
+Disk hits are promoted to memory. SQLite work runs in the default executor so
+it never blocks the event loop. Set EMBEDDING_CACHE_DB to an empty string to
+keep the memory tier only.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Rough per-entry bookkeeping overhead (key, OrderedDict node, array header)
+_ENTRY_OVERHEAD_BYTES = 200
+
+# Prune the disk tier after this many inserts
+_PRUNE_EVERY = 1000
+
+_DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.db")
+
+
+def normalize_for_embedding(text: str) -> str:
+    """Unicode and whitespace normalization only: case and punctuation can change the embedding."""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+class EmbeddingCache:
+    def __init__(self, memory_max_entries: int = 20000, memory_max_bytes: int = 128 * 1024 * 1024,
+                 db_path: Optional[str] = _DEFAULT_DB_PATH, disk_max_entries: int = 500000):
+        self.memory_max_entries = memory_max_entries
+        self.memory_max_bytes = memory_max_bytes
+        self.db_path = db_path or None
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._inserts_since_prune = 0
+        # Refreshed by the executor after each disk write, so stats() never touches SQLite
+        self._disk_bytes: Optional[int] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.disk_errors = 0
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache":
+        return cls(
+            memory_max_entries=int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "20000")),
+            memory_max_bytes=int(os.getenv("EMBEDDING_CACHE_MEMORY_BYTES", str(128 * 1024 * 1024))),
+            db_path=os.getenv("EMBEDDING_CACHE_DB", _DEFAULT_DB_PATH),
+            disk_max_entries=int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ENTRIES", "500000")),
+        )
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        raw = "\x1f".join([model, normalize_for_embedding(text)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- Memory tier ---
+    def _memory_get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+            return vector
+
+    def _memory_put(self, key: str, vector: np.ndarray):
+        if self.memory_max_entries <= 0:
+            return
+        size = vector.nbytes + _ENTRY_OVERHEAD_BYTES
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old.nbytes + _ENTRY_OVERHEAD_BYTES
+            self._memory[key] = vector
+            self._memory_bytes += size
+            while len(self._memory) > self.memory_max_entries or self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes + _ENTRY_OVERHEAD_BYTES
+                self.evictions += 1
+
+    # --- Disk tier (called from the executor) ---
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self.db_path is None:
+            return None
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, "
+                "vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._db.commit()
+            self._refresh_disk_bytes(self._db)
+            print(f"✅ Embedding cache disk tier: {self.db_path}")
+        return self._db
+
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        try:
+            with self._db_lock:
+                db = self._connection()
+                if db is None or not keys:
+                    return found
+                # Stay under SQLite's bound-parameter limit
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk)
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float32).copy()
+                if found:
+                    now = time.time()
+                    db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+                    db.commit()
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"⚠️ Embedding cache disk read failed: {e}")
+        return found
+
+    def _disk_put_many(self, model: str, items: List[tuple]):
+        try:
+            with self._db_lock:
+                db = self._connection()
+                if db is None or not items:
+                    return
+                now = time.time()
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                    [(key, model, int(vector.shape[0]), vector.tobytes(), now) for key, vector in items],
+                )
+                self._inserts_since_prune += len(items)
+                if self._inserts_since_prune >= _PRUNE_EVERY:
+                    self._inserts_since_prune = 0
+                    db.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used ASC "
+                        "LIMIT max(0, (SELECT COUNT(*) FROM embeddings) - ?))",
+                        (self.disk_max_entries,),
+                    )
+                db.commit()
+                self._refresh_disk_bytes(db)
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"⚠️ Embedding cache disk write failed: {e}")
+
+    def _refresh_disk_bytes(self, db: sqlite3.Connection):
+        """Record the database size (caller holds _db_lock)."""
+        page_count = db.execute("PRAGMA page_count").fetchone()[0]
+        page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        self._disk_bytes = page_count * page_size
+
+    # --- Public API ---
+    async def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look texts up in memory, then on disk.
+
+        Returns:
+            Vectors aligned with texts (None for misses)
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        results: List[Optional[np.ndarray]] = [self._memory_get(key) for key in keys]
+        self.memory_hits += sum(1 for vector in results if vector is not None)
+        missing = list({keys[i] for i, vector in enumerate(results) if vector is None})
+        if missing and self.db_path is not None:
+            loop = asyncio.get_event_loop()
+            found = await loop.run_in_executor(None, self._disk_get_many, missing)
+            for key, vector in found.items():
+                self._memory_put(key, vector)
+            for i, key in enumerate(keys):
+                if results[i] is None and key in found:
+                    results[i] = found[key]
+                    self.disk_hits += 1
+        self.misses += sum(1 for vector in results if vector is None)
+        return results
+
+    async def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        return (await self.get_many(model, [text]))[0]
+
+    async def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Optional[np.ndarray]]):
+        """Store vectors in both tiers (None entries are skipped)."""
+        items = []
+        for text, vector in zip(texts, vectors):
+            if vector is None or len(vector) == 0:
+                continue
+            vector = np.asarray(vector, dtype=np.float32)
+            key = self.make_key(model, text)
+            self._memory_put(key, vector)
+            items.append((key, vector))
+        self.stores += len(items)
+        if items and self.db_path is not None:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._disk_put_many, model, items)
+
+    async def put(self, model: str, text: str, vector: np.ndarray):
+        await self.put_many(model, [text], [vector])
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_max_entries": self.memory_max_entries,
+            "memory_max_bytes": self.memory_max_bytes,
+            "disk_path": self.db_path,
+            "disk_bytes": self._disk_bytes,
+            "disk_max_entries": self.disk_max_entries,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "disk_errors": self.disk_errors,
+        }
+
+
+embedding_cache = EmbeddingCache.from_env()
@@ -0,0 +1,131 @@
+"""
+Embedding providers for MilvusRAGDB.
+
+MilvusRAGDB used to POST every query to EMBEDDING_API_URL, which defaults to
+this same app's /api/embeddings: each RAG search made the worker call itself
+over HTTP, spent a second request slot and shipped a 1024-float JSON vector
+back and forth. Providers hide where embeddings come from:
+
+- InProcessEmbeddingProvider calls the embedding model through llm_client, the
+  same call /api/embeddings makes, without the loopback hop
+- HttpEmbeddingProvider posts to a remote embedding service's /api/embeddings
+
+Both return float32 NumPy vectors. EMBEDDING_PROVIDER picks one: "auto" uses
+HTTP only when EMBEDDING_API_URL points somewhere explicitly.
+"""
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+
+import llm_client
+from http_clients import http_clients
+from resilience import upstreams
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "auto").lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "bge-m3")
+EMBEDDING_API_BASE_URL = os.getenv("EMBEDDING_API_URL")
+
+
+class EmbeddingProvider(ABC):
+    name = "base"
+    model = EMBEDDING_MODEL
+
+    @abstractmethod
+    async def embed(self, text: str) -> np.ndarray:
+        """
+        Embed one text.
+
+        Args:
+            text: The text to generate embeddings for
+
+        Returns:
+            1-D float32 vector
+
+        Raises:
+            Exception if the embedding backend fails
+        """
+
+    @abstractmethod
+    async def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Embed several texts in one upstream request.
+
+        Returns:
+            float32 vectors aligned with texts
+
+        Raises:
+            Exception if the request fails (no partial results)
+        """
+
+
+class InProcessEmbeddingProvider(EmbeddingProvider):
+    name = "inprocess"
+
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        self.model = model
+
+    async def embed(self, text: str) -> np.ndarray:
+        # llm_client applies the embedding upstream's deadline, retries and breaker
+        response = await llm_client.create_embeddings(model=self.model, input=text, encoding_format="float")
+        return np.asarray(response.data[0].embedding, dtype=np.float32)
+
+    async def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        response = await llm_client.create_embeddings(model=self.model, input=texts, encoding_format="float")
+        ordered = sorted(response.data, key=lambda item: item.index)
+        if len(ordered) != len(texts):
+            raise Exception(f"Embedding API returned {len(ordered)} vectors for {len(texts)} inputs")
+        return [np.asarray(item.embedding, dtype=np.float32) for item in ordered]
+
+
+class HttpEmbeddingProvider(EmbeddingProvider):
+    name = "http"
+
+    def __init__(self, base_url: str, model: str = EMBEDDING_MODEL):
+        self.endpoint = f"{base_url.rstrip('/')}/api/embeddings"
+        self.model = model
+
+    async def _post(self, text) -> dict:
+        embedding_upstream = upstreams["embedding"]
+        # Don't queue behind a dead embedding upstream; the endpoint itself retries under the breaker
+        embedding_upstream.fail_fast()
+        response = await http_clients.post(
+            "embedding",
+            self.endpoint,
+            json={"text": text, "model": self.model},
+            timeout=embedding_upstream.policy.timeout * (embedding_upstream.policy.max_retries + 1)
+        )
+        response.raise_for_status()
+
+        data = response.json()
+        if not data.get("success"):
+            raise Exception(f"API Error: {data.get('error', 'Unknown error')}")
+        return data
+
+    async def embed(self, text: str) -> np.ndarray:
+        data = await self._post(text)
+        return np.asarray(data.get("embedding"), dtype=np.float32)
+
+    async def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        # /api/embeddings answers a list of texts with "embeddings" in input order
+        data = await self._post(texts)
+        embeddings = data.get("embeddings") or []
+        if len(embeddings) != len(texts):
+            raise Exception(f"Embedding API returned {len(embeddings)} vectors for {len(texts)} inputs")
+        return [np.asarray(embedding, dtype=np.float32) for embedding in embeddings]
+
+
+def make_embedding_provider(kind: Optional[str] = None) -> EmbeddingProvider:
+    """Build the provider selected by EMBEDDING_PROVIDER (auto | inprocess | http)."""
+    kind = (kind or EMBEDDING_PROVIDER).lower()
+    if kind == "auto":
+        kind = "http" if EMBEDDING_API_BASE_URL else "inprocess"
+    if kind == "http":
+        provider = HttpEmbeddingProvider(EMBEDDING_API_BASE_URL or "http://localhost:6011")
+        print(f"✅ Embedding provider: HTTP ({provider.endpoint})")
+        return provider
+    if kind != "inprocess":
+        print(f"⚠️ Unknown EMBEDDING_PROVIDER '{kind}', embedding in-process")
+    print(f"✅ Embedding provider: in-process ({EMBEDDING_MODEL})")
+    return InProcessEmbeddingProvider()
@@ -0,0 +1,159 @@
+"""
+Shared outbound HTTP clients for the non-LLM upstreams (OCR, speech, embedding).
+
+Each upstream gets one long-lived httpx.AsyncClient with its own keep-alive
+pool, so consecutive calls reuse TCP/TLS connections instead of handshaking
+per request. The clients are opened at app startup and closed at shutdown;
+outside the app (e.g. `python rag_db.py`) they are created on first use.
+
+HTTP/2 is negotiated for upstreams that enable it when the `h2` package is
+installed (HTTP/2 needs TLS, so plain-http upstreams stay on HTTP/1.1).
+In-flight requests and pool connections are exported for /api/admin/metrics.
+The LLM client keeps its own pool in llm_client.py.
+"""
+import importlib.util
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import httpx
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@dataclass
+class PoolConfig:
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    http2: bool
+
+    @classmethod
+    def from_env(cls, name: str, max_connections: int, max_keepalive: int, http2: bool) -> "PoolConfig":
+        prefix = f"HTTP_{name.upper()}_"
+        return cls(
+            max_connections=int(os.getenv(prefix + "MAX_CONNECTIONS", str(max_connections))),
+            max_keepalive_connections=int(os.getenv(prefix + "MAX_KEEPALIVE", str(max_keepalive))),
+            keepalive_expiry=float(os.getenv(prefix + "KEEPALIVE_EXPIRY", "60")),
+            http2=os.getenv(prefix + "HTTP2", "true" if http2 else "false").lower() == "true",
+        )
+
+
+POOL_CONFIGS = {
+    # Clova OCR / Speech are HTTPS endpoints that speak HTTP/2
+    "ocr": PoolConfig.from_env("ocr", max_connections=20, max_keepalive=10, http2=True),
+    "speech": PoolConfig.from_env("speech", max_connections=20, max_keepalive=10, http2=True),
+    # The embedding server is usually a plain-http service next to the backend
+    "embedding": PoolConfig.from_env("embedding", max_connections=64, max_keepalive=32, http2=False),
+}
+
+
+class PoolStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_seconds = 0.0
+
+
+class HttpClientRegistry:
+    def __init__(self, configs: Dict[str, PoolConfig]):
+        self.configs = configs
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats = {name: PoolStats() for name in configs}
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        config = self.configs[name]
+        http2 = config.http2 and HTTP2_AVAILABLE
+        if config.http2 and not HTTP2_AVAILABLE:
+            print(f"⚠️ HTTP/2 requested for '{name}' but the h2 package is not installed, using HTTP/1.1")
+        client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        )
+        print(f"✅ HTTP client '{name}' ready (pool: {config.max_connections} connections, "
+              f"{config.max_keepalive_connections} keep-alive, http2={http2})")
+        return client
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """The pooled client for an upstream, created on first use."""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._create(name)
+        return client
+
+    def start(self):
+        """Open every upstream's pool (app startup)."""
+        for name in self.configs:
+            self.get(name)
+
+    async def aclose(self):
+        """Close every pool (app shutdown)."""
+        for name, client in list(self._clients.items()):
+            await client.aclose()
+            print(f"🔌 HTTP client '{name}' closed")
+        self._clients.clear()
+
+    async def post(self, name: str, url: str, **kwargs) -> httpx.Response:
+        """
+        POST through an upstream's pooled client, tracking in-flight requests.
+
+        Args:
+            name: Upstream name ("ocr", "speech", "embedding")
+            url: Request URL
+            **kwargs: Passed to httpx.AsyncClient.post (headers, json, data, params, timeout)
+
+        Returns:
+            The response (the body is read before the connection returns to the pool)
+        """
+        stats = self._stats[name]
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        started = time.monotonic()
+        try:
+            return await self.get(name).post(url, **kwargs)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+            stats.total_seconds += time.monotonic() - started
+
+    def _pool_connections(self, name: str) -> Optional[dict]:
+        """Open/idle connection counts from the httpcore pool (best effort, not a public httpx API)."""
+        client = self._clients.get(name)
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is None:
+            return None
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+    def stats(self) -> dict:
+        result = {"http2_available": HTTP2_AVAILABLE, "pools": {}}
+        for name, config in self.configs.items():
+            stats = self._stats[name]
+            result["pools"][name] = {
+                "open": name in self._clients and not self._clients[name].is_closed,
+                "http2": config.http2 and HTTP2_AVAILABLE,
+                "max_connections": config.max_connections,
+                "max_keepalive_connections": config.max_keepalive_connections,
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "in_flight": stats.in_flight,
+                "peak_in_flight": stats.peak_in_flight,
+                "utilization": round(stats.in_flight / config.max_connections, 4) if config.max_connections else 0.0,
+                "mean_latency_ms": round(stats.total_seconds / stats.requests * 1000, 1) if stats.requests else None,
+                "connections": self._pool_connections(name),
+            }
+        return result
+
+
+http_clients = HttpClientRegistry(POOL_CONFIGS)
@@ -2,13 +2,29 @@ import asyncio
 import os
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, status, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field, EmailStr, field_validator
-from typing import List, Optional
-from openai import OpenAI
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, field_validator
+from typing import List, Literal, Optional, Union
 from dotenv import load_dotenv
 from rag_db import MilvusRAGDB
+import llm_client
+from llm_governor import governor as llm_governor, LLMOverloadedError
+from verdict_cache import verdict_cache
+from intent_classifier import intent_classifier
+from speculation import speculator
+from prompt_registry import prompt_registry
+from sse_stream import coalesce_sse, collect_deltas, text_frames, stream_metrics
+from conversation_compactor import conversation_compactor
+from resilience import upstreams, upstream_health, UpstreamUnavailableError
+from http_clients import http_clients
+from llm_telemetry import llm_telemetry, EndpointContextMiddleware
+from scam_prescreen import scam_prescreener
+from image_store import ImageStoreMiddleware, image_of, image_stats, request_image_store
+from structured_output import extract_structured, stream_structured_prefix, StructuredOutputError
+from ocr_layout import OcrLayout, extract_receipt, extract_transfer, ocr_extraction_stats, parse_amount
+from semantic_cache import answer_cache
+from embedding_cache import embedding_cache
 from datetime import datetime, timedelta, timezone
 from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Float, create_engine
 from sqlalchemy.ext.declarative import declarative_base
@@ -17,8 +33,10 @@ from sqlalchemy.sql import func
 import bcrypt
 from jose import JWTError, jwt
 import uuid      
+import hashlib
 import time      
 import json      
+import math
 import httpx     
 import re
 import secrets
@@ -26,6 +44,7 @@ import base64
 
 import joblib
 import pandas as pd
+import numpy as np
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__)))
 try:
@@ -137,17 +156,23 @@ app = FastAPI(
 milvus_host = os.getenv("MILVUS_HOST", "10.0.1.8")
 milvus_port = os.getenv("MILVUS_PORT", "6030")
 milvus_collection_name = os.getenv("MILVUS_COLLECTION_NAME", "scam_check_db")
+# Set to false to run without a vector DB (e.g. offline against stub_servers.py); RAG features are skipped
+MILVUS_ENABLED = os.getenv("MILVUS_ENABLED", "true").lower() in ("1", "true", "yes")
 
-try:
-    rag_db = MilvusRAGDB(
-        host=milvus_host,
-        port=milvus_port,
-        collection_name=milvus_collection_name
-    )
-    print("✅ Milvus RAG Database initialized successfully")
-except Exception as e:
-    print(f"⚠️ Warning: Could not initialize Milvus RAG Database: {e}")
-    rag_db = None
+rag_db = None
+if MILVUS_ENABLED:
+    try:
+        rag_db = MilvusRAGDB(
+            host=milvus_host,
+            port=milvus_port,
+            collection_name=milvus_collection_name
+        )
+        print("✅ Milvus RAG Database initialized successfully")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not initialize Milvus RAG Database: {e}")
+        rag_db = None
+else:
+    print("⏭️ MILVUS_ENABLED=false, running without the RAG database")
 
 origins = ["*"]
 
@@ -158,17 +183,75 @@ app.add_middleware(
     allow_methods=["*"],  
     allow_headers=["*"],  
 )
+# Labels LLM telemetry with the endpoint that triggered each call
+app.add_middleware(EndpointContextMiddleware)
+# Encodes each chat image once per request, shared by intent/extraction/chat sub-calls
+app.add_middleware(ImageStoreMiddleware)
 
 
-client = OpenAI(
-    api_key="nv-a851d08d11b84ff18525aa7cd38d138dxBoj",
-    base_url="https://clovastudio.stream.ntruss.com/v1/openai",
-)
+@app.on_event("startup")
+async def load_prompts():
+    """Load and validate all system prompts once, before serving AI requests"""
+    prompt_registry.load_all()
+
+
+@app.on_event("startup")
+async def open_http_clients():
+    """Open the keep-alive pools for the OCR, speech and embedding upstreams"""
+    http_clients.start()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    """Release the shared LLM connection pool"""
+    await llm_client.aclose()
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Release the OCR, speech and embedding connection pools"""
+    await http_clients.aclose()
+
+
+@app.on_event("shutdown")
+async def close_embedding_cache():
+    """Close the embedding cache's SQLite tier"""
+    embedding_cache.close()
+
+
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded_handler(request, exc: LLMOverloadedError):
+    """Shed load with 429 + Retry-After when the LLM governor refuses a call"""
+    print(f"🚦 Shedding {request.url.path} (task={exc.task}): {exc.reason}")
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "AI service is busy, please retry shortly.", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(UpstreamUnavailableError)
+async def upstream_unavailable_handler(request, exc: UpstreamUnavailableError):
+    """Fail fast with 503 + Retry-After while an upstream's circuit breaker is open"""
+    print(f"🔌 Upstream {exc.upstream} unavailable for {request.url.path}: {exc.reason}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": f"{exc.upstream} service is temporarily unavailable, please retry shortly.", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 CLOVA_OCR_API_URL = os.getenv("CLOVA_OCR_API_URL")
 CLOVA_OCR_SECRET_KEY = os.getenv("CLOVA_OCR_SECRET_KEY")
 CLOVA_SPEECH_INVOKE_URL = os.getenv("CLOVA_SPEECH_INVOKE_URL")
 CLOVA_SPEECH_SECRET_KEY = os.getenv("CLOVA_SPEECH_SECRET_KEY")
+# One HCX-005 call returning intent + transfer entities instead of intent.txt then transfer_extractor.txt
+CHAT_COMBINED_INTENT = os.getenv("CHAT_COMBINED_INTENT", "false").lower() == "true"
+# /api/scam-check/batch limits
+SCAM_BATCH_MAX_ITEMS = int(os.getenv("SCAM_BATCH_MAX_ITEMS", "500"))
+SCAM_BATCH_CONCURRENCY = int(os.getenv("SCAM_BATCH_CONCURRENCY", "8"))              # Completions in flight per batch
+SCAM_BATCH_SHED_RETRIES = int(os.getenv("SCAM_BATCH_SHED_RETRIES", "3"))            # Retries when the governor sheds an item
+# /api/embeddings limits: inputs accepted by one call (forwarded as a single upstream request)
+EMBEDDING_REQUEST_MAX_INPUTS = int(os.getenv("EMBEDDING_REQUEST_MAX_INPUTS", "256"))
 
 class User(Base):
     """User model for authentication"""
@@ -559,23 +642,34 @@ class ChatRequest(BaseModel):
     messages: List[Message]
 
 class EmbeddingRequest(BaseModel):
-    text: str = Field(..., description="Text to generate embeddings for")
+    text: Union[str, List[str]] = Field(..., description="Text, or list of texts, to generate embeddings for")
     model: str = Field(default="bge-m3", description="Model to use for embeddings")
 
+    @field_validator('text')
+    @classmethod
+    def check_batch_size(cls, v):
+        if isinstance(v, list) and not 1 <= len(v) <= EMBEDDING_REQUEST_MAX_INPUTS:
+            raise ValueError(f"text must contain between 1 and {EMBEDDING_REQUEST_MAX_INPUTS} inputs")
+        return v
+
 class EmbeddingResponse(BaseModel):
     success: bool
     embedding: List[float] = None
+    embeddings: List[List[float]] = None  # Set instead of embedding when a list of texts was sent
     error: str = None
 
 class SearchRequest(BaseModel):
     query: str = Field(..., description="The search query")
     top_k: int = Field(default=5, description="Number of top results to return")
+    per_document: bool = Field(default=False, description="One result per source document instead of per chunk")
 
 class SearchResultItem(BaseModel):
     id: int
     distance: float
     source: str
     text: str
+    chunk_index: Optional[int] = None  # Position of the chunk in its document (chunk-level results)
+    chunk_count: Optional[int] = None
 
 class SearchResponse(BaseModel):
     success: bool
@@ -590,6 +684,9 @@ class ScamCheckResponse(BaseModel):
     verdict: str = None  # "This is a scam" or "This is not a scam"
     error: str = None
 
+class ScamCheckBatchRequest(BaseModel):
+    inputs: List[str] = Field(..., min_length=1, max_length=SCAM_BATCH_MAX_ITEMS, description="Messages to check")
+
 class SafetyCheckRequest(BaseModel):
     sender_account_id: int
     amount: float
@@ -711,10 +808,90 @@ class TransferResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# One number: plain digits or consistent 3-digit groups, optionally followed by a 1-2 digit
+# decimal part whose separator differs from the grouping one ("150000.00", "1.250.000,5", "500,000")
+_LLM_AMOUNT_RE = re.compile(r"^(?:\d+|\d{1,3}([.,])\d{3}(?:\1\d{3})*)(?:(?!\1)[.,]\d{1,2})?$")
+
+
+def _coerce_llm_amount(value):
+    """
+    Accept amounts the model returns as strings like "500,000", "150000.00", "500000đ" or "200k".
+
+    Returns:
+        The amount rounded to a whole unit, or None when the value is missing or ambiguous
+        (several numbers, irregular digit groups such as "1,23,45" or "1.234.5678")
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(round(value)) if math.isfinite(value) else None
+    numbers = re.findall(r"\d[\d.,]*", str(value))
+    if len(numbers) != 1 or not _LLM_AMOUNT_RE.match(numbers[0].rstrip(".,")):
+        return None
+    return parse_amount(str(value))
+
+
 class TransferDetailsResponse(BaseModel):
     account_number: Optional[str] = None
     amount: Optional[int] = None
     description: Optional[str] = None
+    bank: Optional[str] = None  # Only filled when read from a transfer screenshot's layout
+
+    @field_validator('account_number', 'description', 'bank', mode='before')
+    @classmethod
+    def coerce_text(cls, v):
+        return None if v is None else str(v)
+
+    @field_validator('amount', mode='before')
+    @classmethod
+    def coerce_amount(cls, v):
+        return _coerce_llm_amount(v)
+
+
+# --- Structured LLM output schemas (validated by structured_output.extract_structured) ---
+class IntentTransferExtraction(TransferDetailsResponse):
+    intent: str
+
+
+class ReceiptExtraction(BaseModel):
+    transaction_type: Literal["income", "expense"]
+    amount: int
+    description: str
+    transaction_date: Optional[str] = None
+
+    @field_validator('amount', mode='before')
+    @classmethod
+    def coerce_amount(cls, v):
+        return _coerce_llm_amount(v)
+
+
+class BillExtraction(ReceiptExtraction):
+    """unified_analyze's BILL path: a partial answer keeps the old defaults, a missing amount is reported"""
+    transaction_type: Literal["income", "expense"] = "expense"
+    amount: Optional[int] = None
+    description: str = "Uploaded Receipt"
+
+    @field_validator('transaction_type', mode='before')
+    @classmethod
+    def default_transaction_type(cls, v):
+        return v or "expense"
+
+    @field_validator('description', mode='before')
+    @classmethod
+    def default_description(cls, v):
+        return str(v) if v else "Uploaded Receipt"
+
+
+class VoiceNLUResult(BaseModel):
+    """voice_nlu.txt output: an intent plus intent-specific entities"""
+    model_config = ConfigDict(extra="allow")
+    intent: str
+
+
+class UnifiedIntentResult(BaseModel):
+    intent: str = "CHAT"
 
 
 # --- Savings Goals Pydantic Models ---
@@ -775,7 +952,12 @@ def format_messages_with_images(messages_list: list) -> list:
     """
     formatted_messages = []
     
-    for msg in messages_list:
+    # Only the newest CHAT_IMAGES_AS_PIXELS distinct images are sent; each is encoded once per request
+    images = request_image_store()
+    pixel_images = images.pixel_images(messages_list)
+    kept_digests = {images.digest(image_of(messages_list[i])) for i in pixel_images}
+    
+    for i, msg in enumerate(messages_list):
         formatted_msg = {"role": msg.get("role", "user")}
         content_list = []
         
@@ -788,18 +970,12 @@ def format_messages_with_images(messages_list: list) -> list:
             })
         
         # Add image content if present
-        image_data = msg.get("image_data") or msg.get("image_url")
+        image_data = image_of(msg)
         if image_data:
-            # Ensure the image data is in the correct format
-            if not image_data.startswith("data:"):
-                image_data = f"data:image/png;base64,{image_data}"
-            
-            content_list.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": image_data
-                }
-            })
+            if i in pixel_images:
+                content_list.append(images.image_part(image_data))
+            else:
+                content_list.append({"type": "text", "text": images.placeholder_for(image_data, kept_digests)})
         
         # Set content as list if we have content, otherwise use empty list
         formatted_msg["content"] = content_list if content_list else [{"type": "text", "text": ""}]
@@ -808,10 +984,11 @@ def format_messages_with_images(messages_list: list) -> list:
     return formatted_messages
 
 # --- Streaming Generator Function ---
-async def stream_generator(messages_list: list):
+async def stream_generator(messages_list: list, on_complete=None):
     """
     This is a generator function that yields data chunks from the AI service.
     Supports both text and image content in messages.
+    on_complete, if given, receives the full reply once it has streamed without error.
     """
     try:
         # Format messages to include images if present
@@ -820,99 +997,243 @@ async def stream_generator(messages_list: list):
         print(f"📨 Sending {len(formatted_messages)} formatted messages to HyperClovaX")
         
         # Request a streaming response from the OpenAI-compatible API
-        stream = client.chat.completions.create(
+        stream = llm_client.stream_chat_completion(
+            task="chat",
             model="HCX-005",
             messages=formatted_messages,
             top_p=0.7,
             temperature=0.5,
             max_tokens=500,  # Limit response tokens
-            stream=True,  # <-- THIS IS THE KEY CHANGE
         )
 
-        # Iterate through the chunks in the stream
-        for chunk in stream:
-            content = chunk.choices[0].delta.content
-            if content is not None:
-                # Yield the content in Server-Sent Event (SSE) format
-                yield f"data: {content}\n\n"
-                await asyncio.sleep(0.01) # Small delay to ensure chunks are sent timely
-
+        reply_parts = []
+        # Coalesce the deltas into Server-Sent Event (SSE) frames
+        async for frame in coalesce_sse(collect_deltas(stream, reply_parts), "chat"):
+            yield frame
+        if on_complete is not None:
+            on_complete("".join(reply_parts))
+
+    except LLMOverloadedError as e:
+        print(f"🚦 Chat stream shed: {e.reason}")
+        yield f"data: [ERROR] The assistant is busy, please retry in {e.retry_after}s.\n\n"
+    except UpstreamUnavailableError as e:
+        print(f"🔌 Chat stream failed fast: {e}")
+        yield f"data: [ERROR] The assistant is temporarily unavailable, please retry in {e.retry_after}s.\n\n"
     except Exception as e:
         print(f"An error occurred during streaming: {e}")
         # Yield an error message in SSE format
         yield f"data: [ERROR] Sorry, an internal error occurred.\n\n"
 
 
-async def stream_scam_check(user_input: str):
+def scam_verdict_cache_key(user_input: str, prompt_version: str) -> str:
+    """Cache key for a scam verdict: normalized input + prompt version + KB version."""
+    kb_version = rag_db.kb_version if rag_db and rag_db.kb_version else "no-kb"
+    return verdict_cache.make_key(user_input, prompt_version, kb_version)
+
+
+# Line 1 of scamcheck.txt's format for each verdict
+SCAM_VERDICT_LINES = {"scam": "This is a scam.", "not_scam": "This is not a scam."}
+
+
+def is_valid_scam_verdict(verdict: str) -> bool:
+    return "This is a scam" in verdict or "This is not a scam" in verdict
+
+
+def detect_scam_verdict(text: str) -> Optional[str]:
+    """
+    Read the verdict from the opening of a scam check response (line 1 of scamcheck.txt's format).
+    
+    Returns:
+        "scam", "not_scam", or None while the verdict hasn't been streamed yet
+    """
+    opening = text.lstrip()[:80].lower()
+    if "this is not a scam" in opening:
+        return "not_scam"
+    if "this is a scam" in opening:
+        return "scam"
+    return None
+
+
+def scam_verdict_frame(verdict: str, search_results: Optional[list] = None, cached: bool = False,
+                       prescreen=None) -> str:
+    """
+    Build the structured verdict SSE event sent ahead of the explanation.
+    
+    Confidence is a heuristic on the closest knowledge-base match (COSINE similarity
+    of known scam patterns): a close match supports "scam", no close match supports "not_scam".
+    
+    Args:
+        verdict: "scam" or "not_scam"
+        search_results: rag_db.search results the verdict was based on
+        cached: The verdict was replayed from the verdict cache
+        prescreen: PrescreenResult when the verdict came from the zero-LLM pre-screen
+    """
+    # Hits are chunks: list each source document once, at its best similarity
+    best = {}
+    for result in search_results or []:
+        source = result.get("metadata", {}).get("source")
+        if source:
+            similarity = round(float(result.get("distance", 0.0)), 3)
+            best[source] = max(similarity, best.get(source, similarity))
+    sources = [{"source": source, "similarity": similarity}
+               for source, similarity in sorted(best.items(), key=lambda item: item[1], reverse=True)]
+    kb_support = max((s["similarity"] for s in sources), default=0.0)
+    kb_support = min(max(kb_support, 0.0), 1.0)
+    confidence = 0.5 + 0.5 * (kb_support if verdict == "scam" else 1.0 - kb_support)
+    if prescreen is not None:
+        confidence = prescreen.confidence
+    payload = {
+        "verdict": verdict,
+        "confidence": round(confidence, 2),
+        "sources": sources,
+        "cached": cached,
+        "prescreen": prescreen is not None,
+    }
+    return f"data: <<<SCAM_VERDICT>>>{json.dumps(payload)}<<<END_SCAM_VERDICT>>>\n\n"
+
+
+def scam_check_rag_context(search_results: Optional[list]) -> str:
+    """Knowledge base context appended to the scam check input"""
+    if not search_results:
+        return ""
+    rag_context = "\n\nKNOWLEDGE BASE CONTEXT:\n"
+    for i, result in enumerate(search_results, 1):
+        rag_context += f"\n{i}. Source: {result['metadata']['source']}\n"
+        rag_context += f"   Information: {result['metadata']['text'][:400]}\n"
+    return rag_context
+
+
+def scam_check_messages(user_input: str, scam_prompt, search_results: Optional[list]) -> list:
+    return [
+        scam_prompt.system_message,
+        {"role": "user", "content": [{"type": "text", "text": user_input + scam_check_rag_context(search_results)}]}
+    ]
+
+
+async def complete_scam_check(user_input: str, scam_prompt, search_results: Optional[list], task: str = "scam_check") -> str:
+    """
+    Run the (non-streaming) scam check completion.
+    
+    Returns:
+        The verdict text
+    """
+    response = await llm_client.chat_completion(
+        task=task,
+        model="HCX-005",
+        messages=scam_check_messages(user_input, scam_prompt, search_results),
+        top_p=0.1,  # Lower temperature for more deterministic results
+        temperature=0.1,
+    )
+    return response.choices[0].message.content.strip()
+
+
+async def stream_scam_check(user_input: str, retrieval: Optional[asyncio.Task] = None):
     """
     Stream scam check verdict and explanation using RAG context.
+    Cached verdicts are replayed without touching RAG or the LLM.
+    
+    Args:
+        user_input: The text to check
+        retrieval: Optional already-running rag_db.search task (speculative routing)
     """
     try:
         print(f"🔍 Scam Check with RAG: {user_input[:100]}")
         
         # Load the scam check prompt
-        prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "scamcheck.txt")
-        if not os.path.exists(prompt_path):
+        scam_prompt = prompt_registry.get("scamcheck")
+        if scam_prompt is None:
             yield f"data: Error: Scam check prompt file not found\n\n"
             return
         
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            system_prompt = f.read()
+        cache_key = scam_verdict_cache_key(user_input, scam_prompt.version)
+        cached_verdict = verdict_cache.get(cache_key)
+        if cached_verdict:
+            print("⚡ Scam verdict cache hit (stream)")
+            if retrieval is not None:
+                retrieval.cancel()
+            early_verdict = detect_scam_verdict(cached_verdict)
+            if early_verdict:
+                yield scam_verdict_frame(early_verdict, cached=True)
+            for frame in text_frames(cached_verdict):
+                yield frame
+            return
+        
+        # Clear-cut scams are answered without RAG or the LLM
+        prescreen = scam_prescreener.screen(user_input)
+        if prescreen is not None:
+            if retrieval is not None:
+                retrieval.cancel()
+            yield scam_verdict_frame(prescreen.tier, prescreen=prescreen)
+            for frame in text_frames(prescreen.verdict_text()):
+                yield frame
+            return
         
         # Retrieve relevant knowledge base context using RAG
-        rag_context = ""
+        search_results = []
         if rag_db:
             try:
                 print(f"📚 Retrieving knowledge base context...")
-                search_results = await rag_db.search(user_input, top_k=3)
+                if retrieval is not None:
+                    search_results = await retrieval
+                else:
+                    search_results = await rag_db.search(user_input, top_k=3)
                 
                 if search_results:
-                    rag_context = "\n\nKNOWLEDGE BASE CONTEXT:\n"
-                    for i, result in enumerate(search_results, 1):
-                        rag_context += f"\n{i}. Source: {result['metadata']['source']}\n"
-                        rag_context += f"   Information: {result['metadata']['text'][:400]}\n"
-                    
                     print(f"✅ Retrieved {len(search_results)} knowledge base documents")
             except Exception as e:
                 print(f"⚠️ Warning: Could not retrieve RAG context: {e}")
         
         # Prepare messages with RAG context
-        user_message = user_input + rag_context if rag_context else user_input
-        
-        messages = [
-            {"role": "system", "content": [{"type": "text", "text": system_prompt}]},
-            {"role": "user", "content": [{"type": "text", "text": user_message}]}
-        ]
+        messages = scam_check_messages(user_input, scam_prompt, search_results)
         
         # Stream the response
-        stream = client.chat.completions.create(
+        stream = llm_client.stream_chat_completion(
+            task="scam_check",
             model="HCX-005",
             messages=messages,
             top_p=0.1,
             temperature=0.1,
             max_tokens=300,  # Limit scam check response tokens for faster processing
-            stream=True
         )
         
-        for chunk in stream:
-            content = chunk.choices[0].delta.content
-            if content is not None:
-                yield f"data: {content}\n\n"
-                await asyncio.sleep(0.01)
-    
+        # Emit the structured verdict as soon as the opening tokens contain it, then keep streaming
+        response_parts = []
+        verdict_sent = False
+        async for frame in coalesce_sse(collect_deltas(stream, response_parts), "scam_check"):
+            if not verdict_sent:
+                early_verdict = detect_scam_verdict("".join(response_parts))
+                if early_verdict:
+                    verdict_sent = True
+                    # Cache the verdict before the explanation streams: the transfer check stops reading
+                    # after the verdict event, which aborts this generator before the full answer is in
+                    verdict_cache.put(cache_key, SCAM_VERDICT_LINES[early_verdict])
+                    yield scam_verdict_frame(early_verdict, search_results)
+            yield frame
+        
+        verdict = "".join(response_parts).strip()
+        if is_valid_scam_verdict(verdict):
+            verdict_cache.put(cache_key, verdict)
+    
+    except LLMOverloadedError as e:
+        print(f"🚦 Scam check stream shed: {e.reason}")
+        yield f"data: [ERROR] The assistant is busy, please retry in {e.retry_after}s.\n\n"
+    except UpstreamUnavailableError as e:
+        print(f"🔌 Scam check stream failed fast: {e}")
+        yield f"data: [ERROR] The assistant is temporarily unavailable, please retry in {e.retry_after}s.\n\n"
     except Exception as e:
         print(f"❌ Error during scam check stream: {e}")
         yield f"data: [ERROR] {str(e)}\n\n"
 
 
 # --- Transfer Details Extraction Function ---
-async def extract_transfer_details(user_message: str, message_obj: dict = None) -> dict:
+async def extract_transfer_details(user_message: str, message_obj: dict = None, task: str = "transfer_extraction") -> dict:
     """
     Extract transfer details (account_number, amount, description) from user message and/or images.
     
     Args:
         user_message: The user's input message
         message_obj: Optional full message object that may contain images
+        task: Governor task name ("transfer_speculative" when started before the intent is known)
     
     Returns:
         dict with keys: account_number, amount, description (or None if not found)
@@ -921,61 +1242,41 @@ async def extract_transfer_details(user_message: str, message_obj: dict = None)
         print(f"💳 Extracting transfer details from: {user_message[:50]}...")
         
         # Load the transfer extractor prompt
-        transfer_prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "transfer_extractor.txt")
-        if not os.path.exists(transfer_prompt_path):
+        transfer_prompt = prompt_registry.system_message("transfer_extractor")
+        if transfer_prompt is None:
             print("⚠️ Transfer extractor prompt not found")
             return {"account_number": None, "amount": None, "description": None}
         
-        with open(transfer_prompt_path, 'r', encoding='utf-8') as f:
-            transfer_prompt = f.read()
-        
         # Prepare user message content with image if present
         user_msg_content = [{"type": "text", "text": user_message}]
         
-        if message_obj and (message_obj.get("image_data") or message_obj.get("image_url")):
-            image_data = message_obj.get("image_data") or message_obj.get("image_url")
-            if not image_data.startswith("data:"):
-                image_data = f"data:image/png;base64,{image_data}"
-            
-            user_msg_content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": image_data
-                }
-            })
-        
-        # Call the API for transfer details extraction
-        response = client.chat.completions.create(
-            model="HCX-005",
-            messages=[
-                {"role": "system", "content": [{"type": "text", "text": transfer_prompt}]},
-                {"role": "user", "content": user_msg_content}
-            ],
-            top_p=0.1,
-            temperature=0.1,
-            max_tokens=200,  # Limit tokens for structured extraction
-            stream=False
-        )
-        
-        response_text = response.choices[0].message.content.strip()
+        image_data = image_of(message_obj)
+        if image_data:
+            user_msg_content.append(request_image_store().image_part(image_data))
         
-        # Try to parse JSON response
+        # Call the API for transfer details extraction (generation stops once the JSON closes)
         try:
-            import json
-            # Extract JSON from response using regex
-            clean_json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if clean_json_match:
-                clean_json = clean_json_match.group()
-                transfer_data = json.loads(clean_json)
-                print(f"✅ Transfer details extracted: {transfer_data}")
-                return transfer_data
-            else:
-                print(f"⚠️ No JSON found in response: {response_text}")
-                return {"account_number": None, "amount": None, "description": None}
-        except json.JSONDecodeError as e:
-            print(f"⚠️ Could not parse transfer details JSON: {response_text} - Error: {e}")
+            details = await extract_structured(
+                task,
+                TransferDetailsResponse,
+                model="HCX-005",
+                messages=[
+                    transfer_prompt,
+                    {"role": "user", "content": user_msg_content}
+                ],
+                top_p=0.1,
+                temperature=0.1,
+                max_tokens=200,  # Limit tokens for structured extraction
+            )
+            transfer_data = details.model_dump()
+            print(f"✅ Transfer details extracted: {transfer_data}")
+            return transfer_data
+        except StructuredOutputError as e:
+            print(f"⚠️ Could not parse transfer details JSON: {e.raw} - Error: {e}")
             return {"account_number": None, "amount": None, "description": None}
     
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"⚠️ Error extracting transfer details: {e}")
         return {"account_number": None, "amount": None, "description": None}
@@ -1014,7 +1315,8 @@ async def stream_transfer_notification(user_message: str, transfer_details: dict
         )
         
         # Stream the notification with transfer data embedded
-        yield f"data: {notification}\n\n"
+        for frame in text_frames(notification):
+            yield frame
         
         # Send a special message with transfer data that the frontend can parse
         # Convert amount to int if it's a string
@@ -1039,10 +1341,24 @@ async def stream_transfer_notification(user_message: str, transfer_details: dict
 
 
 # --- Intent Detection Function ---
+_background_tasks = set()
+
+
+def spawn_background(coro):
+    """Run a fire-and-forget coroutine, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
 async def detect_intent(user_message: str, message_obj: dict = None) -> str:
     """
     Detect the user's intent: "Scam Check", "Transfer", or "Normal"
     
+    Confident messages are answered by the local intent classifier without an
+    upstream call; only ambiguous ones go to the LLM.
+    
     Args:
         user_message: The user's input message
         message_obj: Optional full message object that may contain images
@@ -1050,44 +1366,81 @@ async def detect_intent(user_message: str, message_obj: dict = None) -> str:
     Returns:
         "Scam Check", "Transfer", or "Normal"
     """
+    fast_intent, prediction = detect_intent_locally(user_message, message_obj)
+    if fast_intent:
+        return fast_intent
+    return await resolve_intent_with_llm(user_message, message_obj, prediction)
+
+
+def detect_intent_locally(user_message: str, message_obj: dict = None):
+    """
+    Local fast path of detect_intent.
+    
+    Returns:
+        (intent or None if the classifier is not confident, prediction)
+    """
+    has_image = bool(message_obj and (message_obj.get("image_data") or message_obj.get("image_url")))
+    fast_intent, prediction = intent_classifier.classify("chat", user_message, has_image)
+    if fast_intent:
+        print(f"⚡ Intent detected locally: {fast_intent} (confidence {prediction.confidence:.2f})")
+        if intent_classifier.should_shadow():
+            spawn_background(shadow_check_intent(user_message, message_obj, prediction))
+    return fast_intent, prediction
+
+
+async def resolve_intent_with_llm(user_message: str, message_obj: dict, prediction) -> str:
+    """LLM fallback of detect_intent; records the label for classifier agreement stats."""
+    intent = await detect_intent_with_llm(user_message, message_obj)
+    if intent is None:
+        return "Normal"
+    intent_classifier.record_llm_label("chat", prediction, intent)
+    return intent
+
+
+async def shadow_check_intent(user_message: str, message_obj: dict, prediction):
+    """Re-check a fast-path intent against the LLM to keep the agreement rate honest."""
+    try:
+        intent = await detect_intent_with_llm(user_message, message_obj, task="intent_shadow")
+        if intent is not None:
+            intent_classifier.record_llm_label("chat", prediction, intent)
+    except LLMOverloadedError:
+        pass
+
+
+async def detect_intent_with_llm(user_message: str, message_obj: dict = None, task: str = "intent") -> Optional[str]:
+    """
+    Classify intent with HCX-005 using prompts/intent.txt.
+    
+    Returns:
+        "Scam Check", "Transfer", "Normal", or None if the call failed
+    """
     try:
         print(f"🧠 Detecting intent for: {user_message[:50]}...")
         
         # Load the intent detection prompt
-        intent_prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "intent.txt")
-        if not os.path.exists(intent_prompt_path):
+        intent_prompt = prompt_registry.system_message("intent")
+        if intent_prompt is None:
             print("⚠️ Intent prompt not found, defaulting to Normal")
-            return "Normal"
-        
-        with open(intent_prompt_path, 'r', encoding='utf-8') as f:
-            intent_prompt = f.read()
+            return None
         
         # Prepare user message with image if present
         user_msg_content = [{"type": "text", "text": user_message}]
         
-        if message_obj and (message_obj.get("image_data") or message_obj.get("image_url")):
-            image_data = message_obj.get("image_data") or message_obj.get("image_url")
-            if not image_data.startswith("data:"):
-                image_data = f"data:image/png;base64,{image_data}"
-            
-            user_msg_content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": image_data
-                }
-            })
+        image_data = image_of(message_obj)
+        if image_data:
+            user_msg_content.append(request_image_store().image_part(image_data))
         
         # Call the API for intent detection
-        response = client.chat.completions.create(
+        response = await llm_client.chat_completion(
+            task=task,
             model="HCX-005",
             messages=[
-                {"role": "system", "content": [{"type": "text", "text": intent_prompt}]},
+                intent_prompt,
                 {"role": "user", "content": user_msg_content}
             ],
             top_p=0.1,
             temperature=0.1,
             max_tokens=100,  # Limit tokens for intent classification
-            stream=False
         )
         
         intent = response.choices[0].message.content.strip()
@@ -1103,10 +1456,75 @@ async def detect_intent(user_message: str, message_obj: dict = None) -> str:
             print(f"✅ Intent detected: Normal")
             return "Normal"
     
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"⚠️ Error detecting intent: {e}, defaulting to Normal")
-        return "Normal"
+        return None
+
+
+async def detect_intent_and_transfer_details(user_message: str, message_obj: dict = None) -> Optional[dict]:
+    """
+    Classify intent and extract transfer details in a single HCX-005 call
+    using prompts/intent_transfer.txt (the image, if any, is sent once).
     
+    Returns:
+        {"intent": ..., "transfer_details": {account_number, amount, description}},
+        or None if the call failed or the output was unusable (callers fall back
+        to detect_intent_with_llm + extract_transfer_details)
+    """
+    try:
+        print(f"🧠 Detecting intent + transfer details for: {user_message[:50]}...")
+        
+        combined_prompt = prompt_registry.system_message("intent_transfer")
+        if combined_prompt is None:
+            print("⚠️ Combined intent prompt not found, falling back to separate calls")
+            return None
+        
+        user_msg_content = [{"type": "text", "text": user_message}]
+        
+        image_data = image_of(message_obj)
+        if image_data:
+            user_msg_content.append(request_image_store().image_part(image_data))
+        
+        try:
+            data = await extract_structured(
+                "intent_transfer",
+                IntentTransferExtraction,
+                model="HCX-005",
+                messages=[
+                    combined_prompt,
+                    {"role": "user", "content": user_msg_content}
+                ],
+                top_p=0.1,
+                temperature=0.1,
+                max_tokens=200,  # Same budget as the transfer extractor
+            )
+        except StructuredOutputError as e:
+            print(f"⚠️ Unusable combined intent response: {e.raw} - Error: {e}")
+            return None
+        
+        raw_intent = data.intent
+        if "Scam Check" in raw_intent or "SCAM_CHECKING" in raw_intent:
+            intent = "Scam Check"
+        elif "Transfer" in raw_intent or "TRANSFER" in raw_intent:
+            intent = "Transfer"
+        elif "Normal" in raw_intent or "NORMAL" in raw_intent:
+            intent = "Normal"
+        else:
+            print(f"⚠️ Unknown intent in combined response: {raw_intent}")
+            return None
+        
+        transfer_details = data.model_dump(include={"account_number", "amount", "description"})
+        print(f"✅ Intent detected: {intent} (combined call)")
+        return {"intent": intent, "transfer_details": transfer_details}
+    
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        print(f"⚠️ Error in combined intent detection: {e}, falling back to separate calls")
+        return None
+
 async def call_clova_ocr_api(image_data: bytes, filename: str) -> dict:
     """
     Calls the Clova OCR API to extract text from an image.
@@ -1148,11 +1566,25 @@ async def call_clova_ocr_api(image_data: bytes, filename: str) -> dict:
         "timestamp": timestamp
     }
 
+    ocr_upstream = upstreams["ocr"]
+
+    async def post_ocr_request():
+        response = await http_clients.post(
+            "ocr", CLOVA_OCR_API_URL, headers=headers, json=payload, timeout=ocr_upstream.policy.timeout
+        )
+        response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+        return response.json()
+
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client: # Increased timeout for OCR
-            response = await client.post(CLOVA_OCR_API_URL, headers=headers, json=payload)
-            response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-            return response.json()
+        # OCR is read-only, so transient failures are retried under the OCR deadline and breaker
+        return await ocr_upstream.call(post_ocr_request)
+    except UpstreamUnavailableError as e:
+        print(f"🔌 Clova OCR API unavailable: {e.reason}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Clova OCR API temporarily unavailable: {e.reason}",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except httpx.HTTPStatusError as e:
         print(f"Clova OCR API HTTP error: {e.response.status_code} - {e.response.text}")
         raise HTTPException(
@@ -1185,11 +1617,25 @@ async def call_clova_speech_api(audio_data: bytes) -> dict:
     }
     params = {"lang": "Eng"} 
 
+    speech_upstream = upstreams["speech"]
+
+    async def post_speech_request():
+        response = await http_clients.post(
+            "speech", CLOVA_SPEECH_INVOKE_URL, headers=headers, params=params, content=audio_data,
+            timeout=speech_upstream.policy.timeout,
+        )
+        response.raise_for_status() 
+        return response.json()
+
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(CLOVA_SPEECH_INVOKE_URL, headers=headers, params=params, data=audio_data)
-            response.raise_for_status() 
-            return response.json()
+        return await speech_upstream.call(post_speech_request)
+    except UpstreamUnavailableError as e:
+        print(f"🔌 Clova Speech API unavailable: {e.reason}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Clova Speech API tạm thời không khả dụng: {e.reason}",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except httpx.HTTPStatusError as e:
         print(f"Lỗi HTTP từ Clova Speech API: {e.response.status_code} - {e.response.text}")
         raise HTTPException(
@@ -1203,6 +1649,44 @@ async def call_clova_speech_api(audio_data: bytes) -> dict:
             detail=f"Lỗi server nội bộ khi nhận dạng giọng nói: {e}"
         )
 
+def admit_llm_stream(task: str):
+    """
+    Refuse a streaming request up front (429/503) if its LLM call would be shed
+    or the LLM breaker is open, so the client never gets a half-started stream.
+    """
+    upstreams["llm"].fail_fast()
+    llm_governor.check_admission(task)
+
+
+def compacted_chat_stream(message_dicts: list, endpoint: str, on_complete=None) -> StreamingResponse:
+    """
+    Compact the history to the endpoint's token budget and stream the reply.
+    The estimated prompt tokens saved are reported in X-Prompt-Tokens-Saved.
+    """
+    compacted, report = conversation_compactor.compact(message_dicts, endpoint)
+    return StreamingResponse(
+        stream_generator(compacted, on_complete=on_complete),
+        media_type="text/event-stream",
+        headers={"X-Prompt-Tokens-Saved": str(report.tokens_saved)},
+    )
+
+
+def start_speculative_branches(user_message: str, message_obj: dict = None, extraction: bool = True):
+    """
+    Start retrieval (and, in "full" mode, transfer extraction) alongside LLM intent detection.
+    Budgets and mode come from CHAT_SPECULATION_MODE / SPECULATIVE_*_BUDGET.
+    Pass extraction=False when the intent call already extracts transfer details.
+    """
+    factories = {}
+    if extraction:
+        factories["transfer_extraction"] = lambda: extract_transfer_details(
+            user_message, message_obj, task="transfer_speculative"
+        )
+    if rag_db:
+        factories["retrieval"] = lambda: rag_db.search(user_message, top_k=3)
+    return speculator.start(factories)
+
+
 @app.post("/api/chat")
 async def chat_endpoint(request: ChatRequest):
     """
@@ -1226,31 +1710,71 @@ async def chat_endpoint(request: ChatRequest):
             break
     
     if not last_user_message:
+        admit_llm_stream("chat")
         message_dicts.insert(0, {"role": "system", "content": "You're a skilled and helpful AI assistant named Sentinel."})
-        return StreamingResponse(stream_generator(message_dicts), media_type="text/event-stream")
-    
-    # Detect intent (pass both text and message object for image support)
-    intent = await detect_intent(last_user_message, last_user_message_obj)
+        return compacted_chat_stream(message_dicts, "chat")
+    
+    # Detect intent (pass both text and message object for image support).
+    # When the local classifier is unsure, start the branch work speculatively
+    # while the LLM decides, then keep only the branch the intent selects.
+    intent, prediction = detect_intent_locally(last_user_message, last_user_message_obj)
+    branches = None
+    transfer_details = None
+    if intent is None:
+        branches = start_speculative_branches(
+            last_user_message, last_user_message_obj, extraction=not CHAT_COMBINED_INTENT
+        )
+        try:
+            combined = None
+            if CHAT_COMBINED_INTENT:
+                combined = await detect_intent_and_transfer_details(last_user_message, last_user_message_obj)
+            if combined:
+                intent = combined["intent"]
+                transfer_details = combined["transfer_details"]
+                intent_classifier.record_llm_label("chat", prediction, intent)
+            else:
+                intent = await resolve_intent_with_llm(last_user_message, last_user_message_obj, prediction)
+        except BaseException:
+            branches.discard()
+            raise
     
     # Route based on intent
     if intent == "Scam Check":
         print("🔍 Routing to Scam Check with RAG...")
-        return StreamingResponse(stream_scam_check(last_user_message), media_type="text/event-stream")
+        retrieval = branches.take("retrieval") if branches else None
+        try:
+            admit_llm_stream("scam_check")
+        except (LLMOverloadedError, UpstreamUnavailableError):
+            if retrieval is not None:
+                retrieval.cancel()
+            raise
+        return StreamingResponse(stream_scam_check(last_user_message, retrieval), media_type="text/event-stream")
     elif intent == "Transfer":
         print("💳 Routing to Transfer Flow...")
-        # Extract transfer details (pass image if present)
-        transfer_details = await extract_transfer_details(last_user_message, last_user_message_obj)
+        extraction = branches.take("transfer_extraction") if branches else None
+        if extraction is not None and transfer_details is None:
+            try:
+                transfer_details = await extraction
+            except LLMOverloadedError:
+                print("🚦 Speculative transfer extraction was shed, retrying at full priority")
+        if transfer_details is None:
+            # Extract transfer details (pass image if present)
+            transfer_details = await extract_transfer_details(last_user_message, last_user_message_obj)
         return StreamingResponse(stream_transfer_notification(last_user_message, transfer_details), media_type="text/event-stream")
     elif intent == "TopUp":
         print("💰 Routing to Phone TopUp Flow (Defaulting to Normal Chat for now)...")
-        pass 
+        if branches:
+            branches.take(None)
     else:
         print("💬 Routing to Normal Chat...")
+        if branches:
+            branches.take(None)
         # Regular chat
         if not any(m['role'] == 'system' for m in message_dicts):
             message_dicts.insert(0, {"role": "system", "content": "You're a skilled and helpful AI assistant named Sentinel."})
         
-        return StreamingResponse(stream_generator(message_dicts), media_type="text/event-stream")
+        admit_llm_stream("chat")
+        return compacted_chat_stream(message_dicts, "chat")
 
 
 @app.post("/api/embeddings", response_model=EmbeddingResponse)
@@ -1259,21 +1783,30 @@ async def embeddings_endpoint(request: EmbeddingRequest):
     Generate embeddings for the provided text using HyperClovaX API.
     
     Args:
-        text: The text to generate embeddings for
+        text: The text, or a list of up to EMBEDDING_REQUEST_MAX_INPUTS texts, to generate embeddings for
         model: The model to use (default: bge-m3)
     
     Returns:
-        EmbeddingResponse with the embedding vector
+        EmbeddingResponse with the embedding vector (or embeddings, in input order, for a list)
     """
     try:
-        print(f"Generating embeddings for text: {request.text[:50]}...")
+        if isinstance(request.text, list):
+            print(f"Generating embeddings for {len(request.text)} texts in one request...")
+        else:
+            print(f"Generating embeddings for text: {request.text[:50]}...")
         
-        response = client.embeddings.create(
+        # A list is forwarded as a single upstream embeddings.create call
+        response = await llm_client.create_embeddings(
             model=request.model,
             input=request.text,
             encoding_format="float"  
         )
         
+        if isinstance(request.text, list):
+            embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            print(f"✅ {len(embeddings)} embeddings generated successfully.")
+            return EmbeddingResponse(success=True, embeddings=embeddings)
+
         embedding = response.data[0].embedding
         
         print(f"✅ Embeddings generated successfully. Dimension: {len(embedding)}")
@@ -1306,53 +1839,47 @@ async def scam_check_endpoint(request: ScamCheckRequest):
         print(f"🔍 Scam Check: {request.input[:100]}")
         
         # Load the scam check prompt
-        prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "scamcheck.txt")
-        if not os.path.exists(prompt_path):
+        scam_prompt = prompt_registry.get("scamcheck")
+        if scam_prompt is None:
             return ScamCheckResponse(
                 success=False,
                 error="Scam check prompt file not found"
             )
         
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            system_prompt = f.read()
+        cache_key = scam_verdict_cache_key(request.input, scam_prompt.version)
+        cached_verdict = verdict_cache.get(cache_key)
+        if cached_verdict:
+            print("⚡ Scam verdict cache hit")
+            return ScamCheckResponse(
+                success=True,
+                verdict=cached_verdict
+            )
+        
+        # Clear-cut scams are answered without RAG or the LLM
+        prescreen = scam_prescreener.screen(request.input)
+        if prescreen is not None:
+            return ScamCheckResponse(
+                success=True,
+                verdict=prescreen.verdict_text()
+            )
         
-        rag_context = ""
+        search_results = []
         if rag_db:
             try:
                 print(f"📚 Retrieving knowledge base context...")
                 search_results = await rag_db.search(request.input, top_k=3)
                 
                 if search_results:
-                    rag_context = "\n\nKNOWLEDGE BASE CONTEXT:\n"
-                    for i, result in enumerate(search_results, 1):
-                        rag_context += f"\n{i}. Source: {result['metadata']['source']}\n"
-                        rag_context += f"   Information: {result['metadata']['text'][:400]}\n"
-                    
                     print(f"✅ Retrieved {len(search_results)} knowledge base documents")
             except Exception as e:
                 print(f"⚠️ Warning: Could not retrieve RAG context: {e}")
         
-        user_message = request.input + rag_context if rag_context else request.input
-        
-        messages = [
-            {"role": "system", "content": [{"type": "text", "text": system_prompt}]},
-            {"role": "user", "content": [{"type": "text", "text": user_message}]}
-        ]
-        
-        response = client.chat.completions.create(
-            model="HCX-005",
-            messages=messages,
-            top_p=0.1,  # Lower temperature for more deterministic results
-            temperature=0.1,
-            stream=False  # Non-streaming for faster response
-        )
-        
         # Extract the verdict
-        verdict = response.choices[0].message.content.strip()
+        verdict = await complete_scam_check(request.input, scam_prompt, search_results)
         
         # Validate the verdict
-        if "This is a scam" in verdict or "This is not a scam" in verdict:
-            
+        if is_valid_scam_verdict(verdict):
+            verdict_cache.put(cache_key, verdict)
             return ScamCheckResponse(
                 success=True,
                 verdict=verdict
@@ -1364,12 +1891,129 @@ async def scam_check_endpoint(request: ScamCheckRequest):
                 verdict=verdict  
             )
     
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"❌ Error during scam check: {e}")
         return ScamCheckResponse(
             success=False,
             error=str(e)
         )
+
+# --- Batch scam check ---
+scam_batch_stats = {"batches": 0, "items": 0, "unique": 0, "cached": 0, "prescreened": 0, "checked": 0, "failed": 0}
+
+
+async def retrieve_scam_batch(texts: List[str]) -> List[list]:
+    """Shared retrieval for a batch: bulk embedding and one multi-vector Milvus search."""
+    contexts = [[] for _ in texts]
+    if not rag_db or not texts:
+        return contexts
+    try:
+        # Micro-batched embedding requests, aligned with texts (None where embedding failed)
+        embeddings = await rag_db.get_embeddings_batch(texts)
+        embedded = [i for i, embedding in enumerate(embeddings) if embedding is not None and len(embedding)]
+        if embedded:
+            results = await rag_db.search_with_embeddings([embeddings[i] for i in embedded], top_k=3)
+            for i, hits in zip(embedded, results):
+                contexts[i] = hits
+        print(f"📚 Batch retrieval: {len(embedded)}/{len(texts)} inputs embedded, one search call")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not retrieve RAG context for batch: {e}")
+    return contexts
+
+
+async def stream_scam_check_batch(inputs: List[str], scam_prompt):
+    """
+    Check a batch of messages and yield one NDJSON line per input as results complete.
+    
+    Identical inputs (after normalization) are checked once. Cached and pre-screened
+    verdicts are emitted first; the rest share one retrieval pass and their completions run at
+    most SCAM_BATCH_CONCURRENCY at a time. A final {"done": true, ...} line summarizes the batch.
+    """
+    started = time.monotonic()
+    groups = {}  # cache key -> indexes of identical inputs
+    texts = {}
+    for index, text in enumerate(inputs):
+        key = scam_verdict_cache_key(text, scam_prompt.version)
+        groups.setdefault(key, []).append(index)
+        texts.setdefault(key, text)
+    summary = {"items": len(inputs), "unique": len(groups), "cached": 0, "prescreened": 0, "checked": 0, "failed": 0}
+
+    def result_lines(key: str, result: dict):
+        return "".join(json.dumps({"index": index, **result}, ensure_ascii=False) + "\n" for index in groups[key])
+
+    pending = []
+    for key in groups:
+        cached_verdict = verdict_cache.get(key)
+        if cached_verdict:
+            summary["cached"] += 1
+            yield result_lines(key, {"success": True, "verdict": cached_verdict, "cached": True})
+            continue
+        prescreen = scam_prescreener.screen(texts[key])
+        if prescreen is not None:
+            summary["prescreened"] += 1
+            yield result_lines(key, {"success": True, "verdict": prescreen.verdict_text(), "cached": False, "prescreen": True})
+        else:
+            pending.append(key)
+
+    contexts = dict(zip(pending, await retrieve_scam_batch([texts[key] for key in pending])))
+    semaphore = asyncio.Semaphore(SCAM_BATCH_CONCURRENCY)
+
+    async def check(key: str):
+        async with semaphore:
+            for attempt in range(SCAM_BATCH_SHED_RETRIES + 1):
+                try:
+                    verdict = await complete_scam_check(texts[key], scam_prompt, contexts[key], task="scam_check_batch")
+                    if is_valid_scam_verdict(verdict):
+                        verdict_cache.put(key, verdict)
+                    return key, {"success": True, "verdict": verdict, "cached": False}
+                except LLMOverloadedError as e:
+                    # Batch work yields to interactive traffic; back off and retry
+                    if attempt >= SCAM_BATCH_SHED_RETRIES:
+                        return key, {"success": False, "error": f"LLM busy: {e.reason}"}
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    return key, {"success": False, "error": str(e)}
+
+    tasks = [asyncio.create_task(check(key)) for key in pending]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            key, result = await next_done
+            summary["checked" if result["success"] else "failed"] += 1
+            yield result_lines(key, result)
+    finally:
+        # Client went away: stop the remaining completions
+        for task in tasks:
+            task.cancel()
+        scam_batch_stats["batches"] += 1
+        for name, value in summary.items():
+            scam_batch_stats[name] += value
+
+    summary["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+    print(f"📦 Scam check batch: {summary}")
+    yield json.dumps({"done": True, **summary}) + "\n"
+
+
+@app.post("/api/scam-check/batch")
+async def scam_check_batch_endpoint(request: ScamCheckBatchRequest):
+    """
+    Scam-check many messages at once (e.g. exported SMS logs).
+    
+    Args:
+        inputs: Messages to check (up to SCAM_BATCH_MAX_ITEMS)
+    
+    Returns:
+        NDJSON stream: {"index", "success", "verdict"/"error", "cached"} per input as it
+        completes, then a {"done": true, ...} summary line
+    """
+    scam_prompt = prompt_registry.get("scamcheck")
+    if scam_prompt is None:
+        raise HTTPException(status_code=500, detail="Scam check prompt file not found")
+    upstreams["llm"].fail_fast()
+    return StreamingResponse(stream_scam_check_batch(request.inputs, scam_prompt), media_type="application/x-ndjson")
+
+
 @app.post("/api/safety-check", response_model=SafetyCheckResponse)
 async def safety_check_endpoint(
     request: SafetyCheckRequest,
@@ -1485,9 +2129,10 @@ async def search_endpoint(request: SearchRequest):
     Args:
         query: The search query
         top_k: Number of top results to return (default: 5)
+        per_document: Aggregate chunk hits per source document (default: false)
     
     Returns:
-        SearchResponse with matching documents
+        SearchResponse with matching chunks (or documents)
     """
     if rag_db is None:
         return SearchResponse(
@@ -1499,7 +2144,7 @@ async def search_endpoint(request: SearchRequest):
         print(f"🔍 Searching for: {request.query[:100]}")
         
         # Search in Milvus database
-        search_results = await rag_db.search(request.query, top_k=request.top_k)
+        search_results = await rag_db.search(request.query, top_k=request.top_k, per_document=request.per_document)
         
         # Format results for the response
         formatted_results = []
@@ -1509,7 +2154,9 @@ async def search_endpoint(request: SearchRequest):
                     id=result["id"],
                     distance=result["distance"],
                     source=result["metadata"]["source"],
-                    text=result["metadata"]["text"]
+                    text=result["metadata"]["text"],
+                    chunk_index=result["metadata"].get("chunk_index"),
+                    chunk_count=result["metadata"].get("chunk_count"),
                 )
             )
         
@@ -1549,16 +2196,7 @@ async def ocr_and_scam_check_endpoint(
         # 1. Perform OCR
         ocr_raw_response = await call_clova_ocr_api(image_data, image.filename)
         
-        full_text = []
-        for image_result in ocr_raw_response.get("images", []):
-            # Check if the inference was successful for the image
-            if image_result.get("inferResult") == "SUCCESS":
-                for field in image_result.get("fields", []):
-                    full_text.append(field.get("inferText", ""))
-            else:
-                print(f"⚠️ OCR inference failed for an image in the batch: {image_result.get('message', 'No message')}")
-        
-        extracted_text = " ".join(full_text).strip()
+        extracted_text = OcrLayout.from_response(ocr_raw_response).text.strip()
         print(f"✅ OCR extracted text (first 200 chars): {extracted_text[:200]}...")
 
         if not extracted_text:
@@ -1592,6 +2230,8 @@ async def ocr_and_scam_check_endpoint(
             success=False,
             error=e.detail
         )
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"❌ Unexpected error during OCR/Scam Check: {e}")
         return OcrScamCheckResponse(
@@ -1617,57 +2257,48 @@ async def process_receipt_endpoint(
         # 1. Perform OCR
         ocr_raw_response = await call_clova_ocr_api(image_data, image.filename)
         
-        full_text_list = [
-            field.get("inferText", "")
-            for image_result in ocr_raw_response.get("images", [])
-            if image_result.get("inferResult") == "SUCCESS"
-            for field in image_result.get("fields", [])
-        ]
-        extracted_text = " ".join(full_text_list).strip()
+        layout = OcrLayout.from_response(ocr_raw_response)
+        extracted_text = layout.text.strip()
         print(f"✅ OCR extracted text: {extracted_text[:200]}...")
 
         if not extracted_text:
             raise HTTPException(status_code=400, detail="No text could be extracted from the image.")
 
-        # 2. Use CLOVA Studio to extract information
-        prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "receipt_extractor.txt")
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            system_prompt = f.read()
-
-        messages = [
-            {"role": "system", "content": [{"type": "text", "text": system_prompt}]},
-            {"role": "user", "content": [{"type": "text", "text": extracted_text}]}
-        ]
-
-        response = client.chat.completions.create(
-            model="HCX-005",
-            messages=messages,
-            temperature=0.1,
-            top_p=0.1,
-            stream=False,
-        )
-
-        ai_response_content = response.choices[0].message.content.strip()
-        
-        print(f"🤖 AI Extraction Response: {ai_response_content}")
-
-        # 3. Parse JSON and save to database
+        # 2. Read a clearly labelled receipt directly from the layout, otherwise use CLOVA Studio
         try:
-            # The model might sometimes add markdown backticks around the JSON
-            cleaned_json_str = ai_response_content.strip('` \n').replace("json", "").strip()
-            transaction_data = json.loads(cleaned_json_str)
-            
-            # Validate required fields
-            if not all(k in transaction_data for k in ["transaction_type", "amount", "description"]):
-                raise ValueError("Missing required fields in AI response.")
+            receipt_fields = extract_receipt(layout)
+            ocr_extraction_stats.record("receipt", deterministic=receipt_fields is not None)
+            if receipt_fields is not None:
+                transaction_data = ReceiptExtraction(**receipt_fields.as_extraction())
+                print(f"📐 Receipt read from OCR layout: {transaction_data.model_dump()}")
+            else:
+                receipt_prompt = prompt_registry.system_message("receipt_extractor")
+                if receipt_prompt is None:
+                    raise HTTPException(status_code=500, detail="Receipt extractor prompt not found on server.")
+
+                messages = [
+                    receipt_prompt,
+                    {"role": "user", "content": [{"type": "text", "text": extracted_text}]}
+                ]
+
+                # 3. Extract validated JSON (generation stops once the object closes) and save to database
+                transaction_data = await extract_structured(
+                    "receipt_extraction",
+                    ReceiptExtraction,
+                    model="HCX-005",
+                    messages=messages,
+                    temperature=0.1,
+                    top_p=0.1,
+                )
+                print(f"🤖 AI Extraction Response: {transaction_data.model_dump()}")
 
             new_transaction = Transaction(
                 user_id=current_user.id,
-                type=transaction_data["transaction_type"],
-                amount=int(transaction_data["amount"]),
-                description=transaction_data["description"],
+                type=transaction_data.transaction_type,
+                amount=transaction_data.amount,
+                description=transaction_data.description,
                 # Use date from receipt if available, otherwise default to now
-                transaction_date=datetime.fromisoformat(transaction_data["transaction_date"]) if transaction_data.get("transaction_date") else datetime.utcnow()
+                transaction_date=datetime.fromisoformat(transaction_data.transaction_date) if transaction_data.transaction_date else datetime.utcnow()
             )
             db.add(new_transaction)
             db.commit()
@@ -1676,13 +2307,18 @@ async def process_receipt_endpoint(
             print(f"✅ Transaction saved successfully with ID: {new_transaction.id}")
             return new_transaction
 
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"❌ Failed to parse AI response or save transaction: {e}")
-            raise HTTPException(status_code=500, detail=f"AI returned invalid data: {ai_response_content}")
+        except StructuredOutputError as e:
+            print(f"❌ Failed to parse AI response: {e}")
+            raise HTTPException(status_code=500, detail=f"AI returned invalid data: {e.raw}")
+        except ValueError as e:
+            print(f"❌ Failed to save transaction: {e}")
+            raise HTTPException(status_code=500, detail=f"AI returned invalid data: {transaction_data.model_dump()}")
 
     except HTTPException as e:
         # Re-raise HTTPExceptions to send proper client errors
         raise e
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"❌ Unexpected error during receipt processing: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
@@ -1944,43 +2580,37 @@ async def voice_command_endpoint(
 
     # 2. Load Prompt from File (Original Method)
     try:
-        prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "voice_nlu.txt")
-        if not os.path.exists(prompt_path):
-            # Fallback only if file is missing
-            nlu_system_prompt = "You are a banking assistant. Return JSON with intent (transfer_money, phone_topup, check_scam) and entities."
+        # Intents without entities can be answered by the local classifier, skipping NLU
+        fast_intent, prediction = intent_classifier.classify("voice", transcribed_text)
+        if fast_intent in ("general_chat", "check_scam"):
+            print(f"⚡ Voice intent detected locally: {fast_intent} (confidence {prediction.confidence:.2f})")
+            parsed_json = {"intent": fast_intent}
         else:
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                nlu_system_prompt = f.read()
+            nlu_system_message = prompt_registry.system_message("voice_nlu")
+            if nlu_system_message is None:
+                # Fallback only if file is missing
+                nlu_system_message = {"role": "system", "content": [{"type": "text", "text": "You are a banking assistant. Return JSON with intent (transfer_money, phone_topup, check_scam) and entities."}]}
         
-        messages = [
-            {"role": "system", "content": [{"type": "text", "text": nlu_system_prompt}]},
-            {"role": "user", "content": [{"type": "text", "text": transcribed_text}]}
-        ]
+            messages = [
+                nlu_system_message,
+                {"role": "user", "content": [{"type": "text", "text": transcribed_text}]}
+            ]
 
-        # Call AI
-        response = client.chat.completions.create(
-            model="HCX-005",
-            messages=messages,
-            temperature=0.1,
-            top_p=0.1,
-            stream=False,
-        )
-        ai_response_content = response.choices[0].message.content.strip()
-        
-        # Parse JSON
-        cleaned_json_str = ai_response_content
-        if "```json" in ai_response_content:
-            cleaned_json_str = ai_response_content.split("```json")[1].split("```")[0]
-        elif "```" in ai_response_content:
-            cleaned_json_str = ai_response_content.split("```")[1].split("```")[0]
-            
-        cleaned_json_str = cleaned_json_str.strip()
-        
-        parsed_json = {}
-        try:
-            parsed_json = json.loads(cleaned_json_str)
-        except:
-            parsed_json = {"intent": "general_chat"}
+            # Call AI (generation stops once the JSON object closes)
+            try:
+                nlu_result = await extract_structured(
+                    "voice_nlu",
+                    VoiceNLUResult,
+                    model="HCX-005",
+                    messages=messages,
+                    temperature=0.1,
+                    top_p=0.1,
+                )
+                parsed_json = nlu_result.model_dump()
+                intent_classifier.record_llm_label("voice", prediction, parsed_json.get("intent"))
+            except StructuredOutputError as e:
+                print(f"⚠️ Voice NLU returned unusable output: {e}")
+                parsed_json = {"intent": "general_chat"}
 
         # Inject transcript
         parsed_json["transcript"] = transcribed_text
@@ -2019,7 +2649,8 @@ async def voice_command_endpoint(
                 {"role": "user", "content": [{"type": "text", "text": transcribed_text}]}
             ]
             
-            chat_response = client.chat.completions.create(
+            chat_response = await llm_client.chat_completion(
+                task="chat",
                 model="HCX-005",
                 messages=chat_messages,
                 temperature=0.5,
@@ -2034,6 +2665,8 @@ async def voice_command_endpoint(
                 "reply": reply_text
             }
 
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"❌ Voice API Error: {e}")
         return {
@@ -2042,7 +2675,203 @@ async def voice_command_endpoint(
             "reply": "I heard you, but I encountered an error processing the request."
         }
 
+# --- Streaming Voice Command ---
+VOICE_REPLY_SYSTEM_PROMPT = "You are Sentinel, a helpful AI banking assistant."
+
+
+def voice_event_frame(name: str, payload: dict) -> str:
+    """Structured SSE event, e.g. data: <<<VOICE_NLU>>>{...}<<<END_VOICE_NLU>>>"""
+    return f"data: <<<{name}>>>{json.dumps(payload, ensure_ascii=False)}<<<END_{name}>>>\n\n"
+
+
+def voice_nlu_messages(transcript: str) -> list:
+    """voice_nlu.txt plus the instructions to append a spoken reply for general chat"""
+    nlu_prompt = prompt_registry.text("voice_nlu") or (
+        "You are a banking assistant. Return JSON with intent (transfer_money, phone_topup, check_scam, general_chat) and entities."
+    )
+    reply_prompt = prompt_registry.text("voice_nlu_reply") or ""
+    return [
+        {"role": "system", "content": [{"type": "text", "text": f"{nlu_prompt}\n\n{reply_prompt}".strip()}]},
+        {"role": "user", "content": [{"type": "text", "text": transcript}]}
+    ]
+
+
+async def stream_voice_chat_reply(transcript: str, started_at: float):
+    """Separate chat completion for the reply (local fast path, or when the NLU call gave none)"""
+    stream = llm_client.stream_chat_completion(
+        task="chat",
+        model="HCX-005",
+        messages=[
+            {"role": "system", "content": [{"type": "text", "text": VOICE_REPLY_SYSTEM_PROMPT}]},
+            {"role": "user", "content": [{"type": "text", "text": transcript}]}
+        ],
+        temperature=0.5,
+        max_tokens=300
+    )
+    async for frame in coalesce_sse(stream, "voice_reply", started_at=started_at):
+        yield frame
+
+
+async def stream_voice_command(audio_data: Optional[bytes], text: Optional[str]):
+    """
+    Voice command pipeline as Server-Sent Events.
+    
+    Emits, as each stage finishes:
+    1. <<<VOICE_TRANSCRIPT>>>{"transcript"}<<<END_VOICE_TRANSCRIPT>>> once ASR returns
+    2. <<<VOICE_NLU>>>{intent, entities..., transcript}<<<END_VOICE_NLU>>> once the intent is known
+    3. general_chat: the reply as text frames, streamed from the same completion as the NLU;
+       check_scam: the scam check stream (verdict event, then explanation)
+    """
+    started_at = time.monotonic()
+    try:
+        # 1. Transcript
+        if text:
+            transcript = text
+        else:
+            speech_result = await call_clova_speech_api(audio_data)
+            transcript = speech_result.get("text")
+        if not transcript:
+            yield "data: [ERROR] Could not recognize voice.\n\n"
+            return
+        yield voice_event_frame("VOICE_TRANSCRIPT", {"transcript": transcript})
+
+        # 2. Intent: local fast path for intents without entities, otherwise NLU (+ reply) in one call
+        fast_intent, prediction = intent_classifier.classify("voice", transcript)
+        if fast_intent in ("general_chat", "check_scam"):
+            print(f"⚡ Voice intent detected locally: {fast_intent} (confidence {prediction.confidence:.2f})")
+            parsed_json = {"intent": fast_intent, "transcript": transcript}
+            yield voice_event_frame("VOICE_NLU", parsed_json)
+            if fast_intent == "check_scam":
+                async for frame in stream_scam_check(transcript):
+                    yield frame
+            else:
+                async for frame in stream_voice_chat_reply(transcript, started_at):
+                    yield frame
+            return
+
+        reply_parts = []
+        stream = stream_structured_prefix(
+            "voice_nlu",
+            VoiceNLUResult,
+            model="HCX-005",
+            messages=voice_nlu_messages(transcript),
+            temperature=0.1,
+            top_p=0.1,
+            max_tokens=400,
+        )
+        try:
+            try:
+                nlu_result = await stream.__anext__()
+                parsed_json = nlu_result.model_dump()
+                intent_classifier.record_llm_label("voice", prediction, parsed_json.get("intent"))
+            except StructuredOutputError as e:
+                print(f"⚠️ Voice NLU returned unusable output: {e}")
+                parsed_json = {"intent": "general_chat"}
+                nlu_result = None
+            parsed_json["transcript"] = transcript
+            yield voice_event_frame("VOICE_NLU", parsed_json)
+
+            # 3. Only general chat continues the completion; anything else stops generation here
+            if parsed_json.get("intent") == "general_chat" and nlu_result is not None:
+                async def reply_deltas():
+                    leading = True
+                    async for delta in stream:
+                        if leading:
+                            # Drop the line break between the JSON object and the reply
+                            delta = delta.lstrip()
+                            if not delta:
+                                continue
+                            leading = False
+                        yield delta
+
+                async for frame in coalesce_sse(collect_deltas(reply_deltas(), reply_parts), "voice_reply", started_at=started_at):
+                    yield frame
+        finally:
+            await stream.aclose()
+
+        intent = parsed_json.get("intent")
+        if intent == "check_scam":
+            async for frame in stream_scam_check(parsed_json.get("content") or transcript):
+                yield frame
+        elif intent not in ("transfer_money", "phone_topup") and not "".join(reply_parts).strip():
+            # The model gave no reply after the JSON: fall back to a separate chat completion
+            print("💬 Voice NLU gave no reply, falling back to a chat completion")
+            async for frame in stream_voice_chat_reply(transcript, started_at):
+                yield frame
+
+    except HTTPException as e:
+        yield f"data: [ERROR] {e.detail}\n\n"
+    except LLMOverloadedError as e:
+        print(f"🚦 Voice command stream shed: {e.reason}")
+        yield f"data: [ERROR] The assistant is busy, please retry in {e.retry_after}s.\n\n"
+    except UpstreamUnavailableError as e:
+        print(f"🔌 Voice command stream failed fast: {e}")
+        yield f"data: [ERROR] The assistant is temporarily unavailable, please retry in {e.retry_after}s.\n\n"
+    except Exception as e:
+        print(f"❌ Voice command stream error: {e}")
+        yield f"data: [ERROR] {str(e)}\n\n"
+
+
+@app.post("/api/voice-command/stream")
+async def voice_command_stream_endpoint(
+    audio: UploadFile = File(None),
+    text: str = Form(None),
+    current_user: Optional[User] = Depends(get_current_user_optional)
+):
+    """
+    Streaming variant of /api/voice-command (Server-Sent Events).
+    
+    The transcript, the parsed intent/entities and the general-chat reply are sent
+    as soon as each is available, instead of one JSON response at the end.
+    """
+    username = current_user.username if current_user else "anonymous"
+    print(f"🎤 Streaming voice command received from: {username}")
+    if not text and not audio:
+        raise HTTPException(status_code=400, detail="No voice or text data received.")
+    admit_llm_stream("voice_nlu")
+    audio_data = None if text else await audio.read()
+    return StreamingResponse(stream_voice_command(audio_data, text), media_type="text/event-stream")
+
+
 # --- RAG-Augmented Chat Endpoint ---
+RAG_CHAT_SYSTEM_PROMPT = (
+    "You are Sentinel, a banking security assistant specializing in scam/fraud detection and prevention.\n"
+    "Use the user's message (and any OCR/image-derived text) together with the knowledge base context provided below to assess scam risk.\n"
+    "Be conservative and prioritize user safety."
+)
+
+
+def rag_answer_cache_namespace() -> str:
+    """Cached RAG answers are only valid for the current system prompt and knowledge base."""
+    kb_version = rag_db.kb_version if rag_db and rag_db.kb_version else "no-kb"
+    prompt_hash = hashlib.sha256(RAG_CHAT_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:16]
+    return f"{prompt_hash}:{kb_version}"
+
+
+# Digits (phone/account numbers, amounts) and links: two texts differing only in these embed
+# almost identically but must not share an answer ("is 0901234567 a scam" vs "is 0907654321 a scam")
+_ANSWER_CACHE_SPECIFICS_RE = re.compile(r"\d|https?://|www\.|\b[\w-]+\.(com|net|org|vn|kr|io|ly|me|co|xyz|top|info|link|click)\b", re.IGNORECASE)
+
+
+def is_single_turn_question(message_dicts: list) -> bool:
+    """
+    One text-only user message and no earlier assistant turns (system messages are replaced anyway).
+
+    Messages containing digits or links are about a specific number, account, amount or site
+    and are never answered from the semantic cache.
+    """
+    turns = [m for m in message_dicts if m["role"] != "system"]
+    if len(turns) != 1 or turns[0]["role"] != "user" or image_of(turns[0]) is not None:
+        return False
+    content = (turns[0].get("content") or "").strip()
+    return bool(content) and not _ANSWER_CACHE_SPECIFICS_RE.search(content)
+
+
+async def replay_cached_answer(answer: str):
+    for frame in text_frames(answer):
+        yield frame
+
+
 @app.post("/api/chat-with-rag")
 async def chat_with_rag_endpoint(request: ChatRequest):
     """
@@ -2057,6 +2886,11 @@ async def chat_with_rag_endpoint(request: ChatRequest):
         StreamingResponse with AI response augmented by RAG
     """
     message_dicts = [msg.model_dump() for msg in request.messages]
+    # Single-turn text questions may be answered from the semantic answer cache without the LLM
+    cacheable = answer_cache.enabled and rag_db is not None and is_single_turn_question(message_dicts)
+    if not cacheable:
+        # Shed early, before spending OCR and retrieval work on a request we cannot serve
+        admit_llm_stream("chat")
     
     # Extract the last user message for RAG search
     last_user_message = None
@@ -2108,16 +2942,29 @@ async def chat_with_rag_endpoint(request: ChatRequest):
             # Continue with original message if OCR fails
     
     # Build augmented system message with RAG context
-    system_content = (
-        "You are Sentinel, a banking security assistant specializing in scam/fraud detection and prevention.\n"
-        "Use the user's message (and any OCR/image-derived text) together with the knowledge base context provided below to assess scam risk.\n"
-        "Be conservative and prioritize user safety."
-    )
+    system_content = RAG_CHAT_SYSTEM_PROMPT
+    on_complete = None
     
     if rag_db and last_user_message:
         try:
+            # Embed once: the same vector serves the answer cache lookup and the retrieval
+            query_embedding = await rag_db.get_embedding_from_api(last_user_message)
+            if cacheable:
+                namespace = rag_answer_cache_namespace()
+                cached = answer_cache.lookup(query_embedding, namespace)
+                if cached is not None:
+                    print(f"⚡ RAG answer cache hit (similarity {cached.similarity}): '{cached.question[:50]}'")
+                    return StreamingResponse(
+                        replay_cached_answer(cached.answer),
+                        media_type="text/event-stream",
+                        headers={"X-Answer-Cache": "hit"},
+                    )
+                question = last_user_message
+                on_complete = lambda answer: answer_cache.put(question, query_embedding, answer, namespace)
+
             # Search for relevant documents using the text prompt (or OCR-extracted text)
-            search_results = await rag_db.search(last_user_message, top_k=3)
+            batch_results = await rag_db.search_with_embeddings([query_embedding], top_k=3)
+            search_results = batch_results[0] if batch_results else []
             
             if search_results:
                 # Build context from search results
@@ -2130,6 +2977,12 @@ async def chat_with_rag_endpoint(request: ChatRequest):
                 print(f"✅ RAG Context added: {len(search_results)} documents retrieved")
         except Exception as e:
             print(f"⚠️ Warning: Could not retrieve RAG context: {e}")
+            # Don't cache an answer written without the knowledge base
+            on_complete = None
+
+    if cacheable:
+        # Cache miss: this request needs the LLM after all
+        admit_llm_stream("chat")
     
     # Update system message
     if not any(m['role'] == 'system' for m in message_dicts):
@@ -2142,7 +2995,7 @@ async def chat_with_rag_endpoint(request: ChatRequest):
                 break
     
     # Return a StreamingResponse that uses our generator (text-only messages)
-    return StreamingResponse(stream_generator(message_dicts), media_type="text/event-stream")
+    return compacted_chat_stream(message_dicts, "chat_with_rag", on_complete=on_complete)
 
 
 
@@ -2155,6 +3008,38 @@ def read_root():
     }
 
 
+@app.get("/api/health/upstreams")
+async def upstreams_health():
+    """
+    Circuit breaker state and call counters for each upstream AI dependency (per worker).
+    """
+    return upstream_health()
+
+
+@app.get("/api/admin/metrics")
+async def admin_metrics():
+    """
+    In-process metrics for the AI pipeline (per worker).
+    """
+    return {
+        "llm_governor": llm_governor.stats(),
+        "scam_verdict_cache": verdict_cache.stats(),
+        "intent_classifier": intent_classifier.stats(),
+        "speculation": speculator.stats(),
+        "prompts": prompt_registry.stats(),
+        "streaming": stream_metrics.stats(),
+        "conversation_compaction": conversation_compactor.stats(),
+        "images": image_stats.export(),
+        "scam_check_batch": dict(scam_batch_stats),
+        "scam_prescreen": scam_prescreener.stats(),
+        "ocr_extraction": ocr_extraction_stats.export(),
+        "rag_answer_cache": answer_cache.stats(),
+        "http_pools": http_clients.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "llm_calls": llm_telemetry.export(),
+    }
+
+
 # ==================== AUTHENTICATION ENDPOINTS ====================
 
 @app.post("/api/auth/register", response_model=LoginResponse, status_code=status.HTTP_201_CREATED)
@@ -2580,6 +3465,7 @@ async def unified_analyze_endpoint(
     
     extracted_text = ""
     source_type = "text" # or "image"
+    receipt_fields = None
 
     if image:
         print(f"📷 Analyzing image upload: {image.filename}")
@@ -2588,18 +3474,15 @@ async def unified_analyze_endpoint(
             image_data = await image.read()
             ocr_raw_response = await call_clova_ocr_api(image_data, image.filename)
             
-            full_text_list = [
-                field.get("inferText", "")
-                for image_result in ocr_raw_response.get("images", [])
-                if image_result.get("inferResult") == "SUCCESS"
-                for field in image_result.get("fields", [])
-            ]
-            extracted_text = " ".join(full_text_list).strip()
+            layout = OcrLayout.from_response(ocr_raw_response)
+            extracted_text = layout.text.strip()
             
             if not extracted_text:
                 raise HTTPException(status_code=400, detail="OCR failed to extract text from image.")
                 
             print(f"📝 OCR Result: {extracted_text[:100]}...")
+            # A receipt with a labelled total is a bill: no classification or extraction call needed
+            receipt_fields = extract_receipt(layout)
             
         except Exception as e:
             print(f"❌ OCR Error: {e}")
@@ -2623,23 +3506,23 @@ async def unified_analyze_endpoint(
     )
 
     try:
-        class_response = client.chat.completions.create(
-            model="HCX-005",
-            messages=[{"role": "system", "content": [{"type": "text", "text": "Output only JSON."}]}, 
-                      {"role": "user", "content": [{"type": "text", "text": classification_prompt}]}],
-            temperature=0.1,
-            max_tokens=50
-        )
-        
-        intent_raw = class_response.choices[0].message.content.strip()
-        # Clean potential markdown
-        if "```" in intent_raw:
-            intent_raw = intent_raw.split("```json")[-1].split("```")[0].strip()
-        
-        intent_data = json.loads(intent_raw)
-        intent = intent_data.get("intent", "CHAT")
+        if receipt_fields is not None:
+            intent_data = UnifiedIntentResult(intent="BILL")
+        else:
+            intent_data = await extract_structured(
+                "classification",
+                UnifiedIntentResult,
+                model="HCX-005",
+                messages=[{"role": "system", "content": [{"type": "text", "text": "Output only JSON."}]}, 
+                          {"role": "user", "content": [{"type": "text", "text": classification_prompt}]}],
+                temperature=0.1,
+                max_tokens=50
+            )
+        intent = intent_data.intent
         print(f"🧠 Detected Intent: {intent}")
 
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"⚠️ Classification failed, defaulting to SCAM_CHECK: {e}")
         intent = "SCAM_CHECK"
@@ -2647,33 +3530,37 @@ async def unified_analyze_endpoint(
 
     if intent == "BILL":
         try:
-            # Reuse receipt extraction logic prompt
-            prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "receipt_extractor.txt")
-            if os.path.exists(prompt_path):
-                with open(prompt_path, 'r', encoding='utf-8') as f:
-                    extractor_system_prompt = f.read()
+            if source_type == "image":
+                ocr_extraction_stats.record("receipt", deterministic=receipt_fields is not None)
+            if receipt_fields is not None:
+                tx_data = ReceiptExtraction(**receipt_fields.as_extraction())
+                print(f"📐 Receipt read from OCR layout: {tx_data.model_dump()}")
             else:
-                extractor_system_prompt = "Extract JSON: {transaction_type: 'expense'|'income', amount: int, description: str, transaction_date: 'YYYY-MM-DD'}"
+                # Reuse receipt extraction logic prompt
+                extractor_system_prompt = prompt_registry.text("receipt_extractor") or (
+                    "Extract JSON: {transaction_type: 'expense'|'income', amount: int, description: str, transaction_date: 'YYYY-MM-DD'}"
+                )
 
-            extract_response = client.chat.completions.create(
-                model="HCX-005",
-                messages=[
-                    {"role": "system", "content": [{"type": "text", "text": extractor_system_prompt}]},
-                    {"role": "user", "content": [{"type": "text", "text": extracted_text}]}
-                ],
-                temperature=0.1
-            )
-            
-            ai_content = extract_response.choices[0].message.content.strip()
-            clean_json = ai_content.strip('` \n').replace("json", "").strip()
-            tx_data = json.loads(clean_json)
+                tx_data = await extract_structured(
+                    "receipt_extraction",
+                    BillExtraction,
+                    model="HCX-005",
+                    messages=[
+                        {"role": "system", "content": [{"type": "text", "text": extractor_system_prompt}]},
+                        {"role": "user", "content": [{"type": "text", "text": extracted_text}]}
+                    ],
+                    temperature=0.1
+                )
+                if tx_data.amount is None:
+                    print(f"⚠️ Bill extraction returned no usable amount: {tx_data.model_dump()}")
+                    return {"category": "ERROR", "message": "Identified as bill, but could not read the amount."}
 
             # Save to DB
             new_transaction = Transaction(
                 user_id=current_user.id,
-                type=tx_data.get("transaction_type", "expense"),
-                amount=int(tx_data.get("amount", 0)),
-                description=tx_data.get("description", "Uploaded Receipt"),
+                type=tx_data.transaction_type,
+                amount=tx_data.amount,
+                description=tx_data.description,
                 transaction_date=datetime.utcnow() 
             )
             db.add(new_transaction)
@@ -2687,43 +3574,28 @@ async def unified_analyze_endpoint(
                 "details": f"{new_transaction.description}"
             }
 
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             print(f"❌ Bill processing error: {e}")
             return {"category": "ERROR", "message": "Identified as bill, but failed to extract data."}
 
     elif intent == "SCAM_CHECK":
-        prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "scamcheck.txt")
-        system_prompt = "Analyze if this is a scam."
-        if os.path.exists(prompt_path):
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                system_prompt = f.read()
-
-        rag_context = ""
-        if rag_db:
-             results = await rag_db.search(extracted_text, top_k=2)
-             if results:
-                 rag_context = "\nReference Info:\n" + "\n".join([r['metadata']['text'][:200] for r in results])
-
-        scam_response = client.chat.completions.create(
-            model="HCX-005",
-            messages=[
-                {"role": "system", "content": [{"type": "text", "text": system_prompt}]},
-                {"role": "user", "content": [{"type": "text", "text": extracted_text + rag_context}]}
-            ],
-            temperature=0.2
-        )
-        
-        verdict = scam_response.choices[0].message.content.strip()
+        # Share the scam-check pipeline (and its verdict cache) with the other paths
+        scam_result = await scam_check_endpoint(ScamCheckRequest(input=extracted_text))
+        if not scam_result.success:
+            raise HTTPException(status_code=500, detail=f"Scam check failed: {scam_result.error}")
         
         return {
             "category": "SCAM_CHECK",
             "success": True,
-            "verdict": verdict,
+            "verdict": scam_result.verdict,
             "ocr_text": extracted_text if source_type == "image" else None
         }
 
     else:
-        chat_response = client.chat.completions.create(
+        chat_response = await llm_client.chat_completion(
+            task="chat",
             model="HCX-005",
             messages=[
                 {"role": "system", "content": [{"type": "text", "text": "You are Sentinel, a helpful banking assistant."}]},
@@ -2931,13 +3803,16 @@ async def extract_transfer_details_from_image(
             print("🖼️ Processing as Image via OCR.")
             ocr_raw_response = await call_clova_ocr_api(file_data, file.filename)
             
-            full_text_list = [
-                field.get("inferText", "")
-                for image_result in ocr_raw_response.get("images", [])
-                if image_result.get("inferResult") == "SUCCESS"
-                for field in image_result.get("fields", [])
-            ]
-            extracted_text = " ".join(full_text_list).strip()
+            layout = OcrLayout.from_response(ocr_raw_response)
+            extracted_text = layout.text.strip()
+
+            # Banking-app screenshots label the account and amount: read them without the LLM
+            transfer_fields = extract_transfer(layout)
+            ocr_extraction_stats.record("transfer", deterministic=transfer_fields is not None)
+            if transfer_fields is not None:
+                details = TransferDetailsResponse(**transfer_fields)
+                print(f"📐 Transfer details read from OCR layout: {details.model_dump()}")
+                return details
 
         elif file_content_type.startswith('audio/'):
             print("🎙️ Processing as Audio via Clova Speech.")
@@ -2952,29 +3827,25 @@ async def extract_transfer_details_from_image(
         if not extracted_text:
             raise HTTPException(status_code=400, detail="No discernible text found in the file.")
 
-        prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "transfer_extractor.txt")
-        if not os.path.exists(prompt_path):
+        system_prompt = prompt_registry.text("transfer_extractor")
+        if system_prompt is None:
              raise HTTPException(status_code=500, detail="Transfer extractor prompt not found on server.")
 
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            system_prompt = f.read()
-
         messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": extracted_text}]
 
-        response = client.chat.completions.create(
-            model="HCX-005", messages=messages, temperature=0.1, top_p=0.1, stream=False,
-        )
-        ai_response_content = response.choices[0].message.content.strip()
-        print(f"🤖 AI Transfer Extraction Response: {ai_response_content}")
-
         try:
-            cleaned_json_str = ai_response_content.strip('` \n').replace("json", "").strip()
-            data = json.loads(cleaned_json_str)
-            return TransferDetailsResponse(**data)
-        except (json.JSONDecodeError, ValueError) as e:
+            details = await extract_structured(
+                "transfer_extraction", TransferDetailsResponse,
+                model="HCX-005", messages=messages, temperature=0.1, top_p=0.1,
+            )
+            print(f"🤖 AI Transfer Extraction Response: {details.model_dump()}")
+            return details
+        except StructuredOutputError as e:
             print(f"❌ Failed to parse AI response for transfer details: {e}")
-            raise HTTPException(status_code=500, detail=f"AI returned invalid data: {ai_response_content}")
+            raise HTTPException(status_code=500, detail=f"AI returned invalid data: {e.raw}")
 
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         print(f"❌ Unexpected error during file-based transfer detail extraction: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
@@ -0,0 +1,142 @@
+"""
+Request-scoped, content-addressed store for chat images.
+
+The web client re-sends every earlier base64 image on each turn, and intent
+detection, transfer extraction and the final chat call each attach the latest
+image again. Within one HTTP request every image is normalized to a data URI
+once and keyed by its content hash, so:
+
+- sub-calls that need the same image share one encoded data URI
+- only the newest CHAT_IMAGES_AS_PIXELS distinct images of a history are sent
+  as pixels; older images and repeats of a kept image become a text placeholder
+
+The store lives in a contextvar that ImageStoreMiddleware resets per request.
+"""
+import hashlib
+import os
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Set
+
+CHAT_IMAGES_AS_PIXELS = max(1, int(os.getenv("CHAT_IMAGES_AS_PIXELS", "1")))
+
+IMAGE_PLACEHOLDER = "[An image was attached here earlier in the conversation]"
+DUPLICATE_IMAGE_PLACEHOLDER = "[The same image is attached later in the conversation]"
+
+
+class ImageStats:
+    def __init__(self):
+        self.encoded = 0             # Distinct images normalized to a data URI
+        self.reused = 0              # Lookups served from the request's store
+        self.deduplicated = 0        # Repeats of an image already sent in the same history
+        self.placeholders = 0        # Older images replaced by text
+        self.bytes_not_sent = 0      # Data URI bytes saved by dedup + placeholders
+
+    def export(self) -> dict:
+        return {
+            "images_as_pixels": CHAT_IMAGES_AS_PIXELS,
+            "encoded": self.encoded,
+            "reused": self.reused,
+            "deduplicated": self.deduplicated,
+            "placeholders": self.placeholders,
+            "bytes_not_sent": self.bytes_not_sent,
+        }
+
+
+image_stats = ImageStats()
+
+
+def image_of(msg: Optional[dict]) -> Optional[str]:
+    """The raw image (base64, data URI or URL) attached to a ChatRequest-style message, if any."""
+    if not msg:
+        return None
+    return msg.get("image_data") or msg.get("image_url") or None
+
+
+class ImageStore:
+    def __init__(self):
+        # id(raw string) -> (raw, digest): the same string object is passed to every sub-call,
+        # so repeated lookups don't re-hash megabytes of base64. raw is held to keep the id valid.
+        self._by_object: Dict[int, tuple] = {}
+        self._uris: Dict[str, str] = {}
+
+    def digest(self, raw: str) -> str:
+        entry = self._by_object.get(id(raw))
+        if entry is not None and entry[0] is raw:
+            return entry[1]
+        digest = hashlib.sha256(raw.split(",", 1)[-1].encode("utf-8")).hexdigest()
+        self._by_object[id(raw)] = (raw, digest)
+        return digest
+
+    def data_uri(self, raw: str) -> str:
+        """Normalized data URI for an image, built once per content hash."""
+        digest = self.digest(raw)
+        uri = self._uris.get(digest)
+        if uri is not None:
+            image_stats.reused += 1
+            return uri
+        uri = raw if raw.startswith("data:") else f"data:image/png;base64,{raw}"
+        self._uris[digest] = uri
+        image_stats.encoded += 1
+        return uri
+
+    def image_part(self, raw: str) -> dict:
+        """OpenAI-style content part for an image."""
+        return {"type": "image_url", "image_url": {"url": self.data_uri(raw)}}
+
+    def pixel_images(self, messages: List[dict], limit: int = CHAT_IMAGES_AS_PIXELS) -> Set[int]:
+        """
+        Pick which messages keep their image as pixels.
+
+        Args:
+            messages: ChatRequest-style message dicts
+            limit: Number of distinct images to keep, newest first
+
+        Returns:
+            Indexes of the messages whose image is sent; every other image becomes a placeholder
+        """
+        keep: Set[int] = set()
+        seen: Set[str] = set()
+        for i in range(len(messages) - 1, -1, -1):
+            raw = image_of(messages[i])
+            if raw is None:
+                continue
+            digest = self.digest(raw)
+            if digest in seen or len(seen) >= limit:
+                continue
+            seen.add(digest)
+            keep.add(i)
+        return keep
+
+    def placeholder_for(self, raw: str, kept_digests: Set[str]) -> str:
+        """Placeholder text for an image that is not sent, recording what it saved."""
+        image_stats.bytes_not_sent += len(raw)
+        if self.digest(raw) in kept_digests:
+            image_stats.deduplicated += 1
+            return DUPLICATE_IMAGE_PLACEHOLDER
+        image_stats.placeholders += 1
+        return IMAGE_PLACEHOLDER
+
+
+_current_store: ContextVar[Optional[ImageStore]] = ContextVar("image_store", default=None)
+
+
+def request_image_store() -> ImageStore:
+    """The current request's image store (a throwaway one outside a request)."""
+    store = _current_store.get()
+    return store if store is not None else ImageStore()
+
+
+class ImageStoreMiddleware:
+    """ASGI middleware giving each HTTP request a fresh image store."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _current_store.set(ImageStore())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_store.reset(token)
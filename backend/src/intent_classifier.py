@@ -0,0 +1,271 @@
+"""
+Local fast-path intent classifier for chat and voice commands.
+
+Scores a message against multilingual (vi/ko/en) keyword and pattern lexicons
+plus character n-gram profiles bootstrapped from the examples in
+prompts/intent.txt and prompts/voice_nlu.txt. When the top label is confident
+enough the answer is returned in microseconds; otherwise callers fall back to
+the LLM and report its answer back so the agreement rate can be tracked.
+"""
+import math
+import os
+import random
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "..", "prompts")
+
+INTENT_FAST_PATH_ENABLED = os.getenv("INTENT_FAST_PATH_ENABLED", "true").lower() == "true"
+INTENT_FAST_PATH_THRESHOLD = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.85"))
+# Fraction of fast-path answers re-checked against the LLM in the background
+INTENT_SHADOW_RATE = float(os.getenv("INTENT_SHADOW_RATE", "0.02"))
+
+# Internal labels
+NORMAL = "normal"
+SCAM_CHECK = "scam_check"
+TRANSFER = "transfer"
+PHONE_TOPUP = "phone_topup"
+LABELS = (NORMAL, SCAM_CHECK, TRANSFER, PHONE_TOPUP)
+
+# Surface-specific label names (chat uses intent.txt labels, voice uses voice_nlu.txt intents)
+CHAT_LABELS = {NORMAL: "Normal", SCAM_CHECK: "Scam Check", TRANSFER: "Transfer"}
+VOICE_LABELS = {NORMAL: "general_chat", SCAM_CHECK: "check_scam", TRANSFER: "transfer_money", PHONE_TOPUP: "phone_topup"}
+
+# (pattern, label, weight). Patterns run against folded text: lowercase, no Vietnamese diacritics.
+LEXICON: List[Tuple[str, str, float]] = [
+    # Scam checking
+    (r"\b(scam|scammer|scammed|fraud|fraudulent|phishing|phish|smishing|spam|legit)\b", SCAM_CHECK, 3.5),
+    (r"\b(suspicious|fake|hacked|too good to be true)\b", SCAM_CHECK, 2.5),
+    (r"\bis (this|it|that) (real|safe|true|legit)\b", SCAM_CHECK, 2.5),
+    (r"\b(verify|check) (this|the|that) (message|link|sms|email|number|call|website|site|offer)\b", SCAM_CHECK, 2.5),
+    (r"\b(lua dao|bi lua|lua gat|lua tien|gia mao|chiem doat)\b", SCAM_CHECK, 3.5),
+    (r"\b(co an toan khong|an toan khong|co that khong|dang ngo|nghi ngo|uy tin khong)\b", SCAM_CHECK, 2.5),
+    (r"\bkiem tra (tin nhan|link|duong link|so dien thoai|cuoc goi|email|trang web)\b", SCAM_CHECK, 2.5),
+    (r"(사기|피싱|스미싱|보이스피싱|안전한가요|안전해요|의심|진짜인가요|가짜)", SCAM_CHECK, 3.5),
+    (r"(https?://|www\.|\b[\w-]+\.(com|net|org|vn|xyz|top|info|link|click|io|ly|me)\b)", SCAM_CHECK, 1.5),
+    (r"\b(otp|verification code|ma xac nhan|ma otp|인증번호)\b", SCAM_CHECK, 1.0),
+    # Transfers
+    (r"\b(transfer|wire|remit|send (some |the )?money|pay (to|for|my)|payment to)\b|\b(send|pay) \d", TRANSFER, 3.0),
+    (r"\b(chuyen tien|chuyen khoan|chuyen cho|gui tien|gui cho|thanh toan|ck cho)\b|\b(chuyen|gui|ck) \d", TRANSFER, 3.0),
+    (r"(송금|이체|보내|입금)", TRANSFER, 3.0),
+    (r"\b(stk|so tai khoan|account( number)?|tai khoan|계좌)\b", TRANSFER, 1.0),
+    (r"(?<![\d-])\d{8,16}(?![\d-])", TRANSFER, 1.0),
+    (r"\d[\d.,]*\s*(k|nghin|ngan|tr|trieu|cu|vnd|dong|d|won|usd|\$)(?![a-z])|\d[\d,]*\s*(원|만원)", TRANSFER, 1.0),
+    (r"\b\d{1,3}([.,]\d{3})+\b", TRANSFER, 0.8),
+    (r"\b(thousand|million|hundred)\b", TRANSFER, 0.8),
+    # Phone top-up (voice_nlu.txt rule 1: "phone" always means top-up)
+    (r"\bphone\b", PHONE_TOPUP, 3.0),
+    (r"\b(top ?up|recharge|nap tien dien thoai|nap the|nap dt|nap dien thoai)\b", PHONE_TOPUP, 3.0),
+    (r"(충전)", PHONE_TOPUP, 3.0),
+]
+
+# Extra bootstrap examples per label, complementing the prompt files
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("hello how are you", NORMAL),
+    ("what can you do", NORMAL),
+    ("explain how savings goals work", NORMAL),
+    ("xin chào bạn khỏe không", NORMAL),
+    ("hôm nay thời tiết thế nào", NORMAL),
+    ("안녕하세요 오늘 날씨 어때요", NORMAL),
+    ("I got this message, is it a scam", SCAM_CHECK),
+    ("someone called claiming to be from the bank", SCAM_CHECK),
+    ("có người gọi tự xưng là công an", SCAM_CHECK),
+    ("tin nhắn trúng thưởng này có thật không", SCAM_CHECK),
+    ("send 200k to 0123456789", TRANSFER),
+    ("chuyển 500k cho 0123456789", TRANSFER),
+    ("chuyển khoản 1 triệu tiền nhà", TRANSFER),
+    ("계좌 1234567890으로 5만원 이체해줘", TRANSFER),
+    ("top up my phone 50k", PHONE_TOPUP),
+    ("nạp tiền điện thoại 100k", PHONE_TOPUP),
+]
+
+# Evidence added to NORMAL when no other label has any lexicon hit
+NORMAL_PRIOR = 1.0
+NO_SIGNAL_BONUS = 2.0
+NGRAM_WEIGHT = 1.5
+NGRAM_SIZE = 3
+# A second non-normal label with at least this much evidence (any scam-check keyword, a transfer verb
+# alongside a top-up, ...) makes the message ambiguous, so the LLM decides however confident the top label is
+CONFLICT_SCORE = 2.5
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_COMPILED_LEXICON = [(re.compile(pattern), label, weight) for pattern, label, weight in LEXICON]
+
+
+def fold_text(text: str) -> str:
+    """Lowercase and strip Vietnamese diacritics while keeping Hangul intact."""
+    decomposed = unicodedata.normalize("NFD", (text or "").lower())
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return unicodedata.normalize("NFC", stripped).replace("đ", "d")
+
+
+def _ngram_profile(folded: str) -> Dict[str, float]:
+    padded = " " + _WHITESPACE_RE.sub(" ", folded).strip() + " "
+    counts = Counter(padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1))
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {gram: v / norm for gram, v in counts.items()}
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+def _load_prompt_examples(prompts_dir: str) -> List[Tuple[str, str]]:
+    """Harvest labelled examples from intent.txt and voice_nlu.txt."""
+    examples = []
+    chat_to_label = {v: k for k, v in CHAT_LABELS.items()}
+    voice_to_label = {v: k for k, v in VOICE_LABELS.items()}
+
+    try:
+        with open(os.path.join(prompts_dir, "intent.txt"), "r", encoding="utf-8") as f:
+            for text, output in re.findall(r'User:\s*"(.*?)"\s*\nOutput:\s*(.+)', f.read()):
+                label = chat_to_label.get(output.strip())
+                if label:
+                    examples.append((text, label))
+    except OSError as e:
+        print(f"⚠️ Could not read intent examples: {e}")
+
+    try:
+        with open(os.path.join(prompts_dir, "voice_nlu.txt"), "r", encoding="utf-8") as f:
+            pattern = r'User:\s*"(.*?)"\s*\nResponse:\s*\{.*?"intent":\s*"(\w+)"'
+            for text, intent in re.findall(pattern, f.read(), re.DOTALL):
+                label = voice_to_label.get(intent)
+                if label:
+                    examples.append((text, label))
+    except OSError as e:
+        print(f"⚠️ Could not read voice NLU examples: {e}")
+
+    return examples
+
+
+class IntentPrediction(NamedTuple):
+    label: str
+    confidence: float
+    scores: Dict[str, float]
+
+
+class LocalIntentClassifier:
+    def __init__(self, prompts_dir: str = PROMPTS_DIR, threshold: float = INTENT_FAST_PATH_THRESHOLD,
+                 enabled: bool = INTENT_FAST_PATH_ENABLED, shadow_rate: float = INTENT_SHADOW_RATE):
+        self.threshold = threshold
+        self.enabled = enabled
+        self.shadow_rate = shadow_rate
+        examples = _load_prompt_examples(prompts_dir) + SEED_EXAMPLES
+        self._centroids = self._build_centroids(examples)
+        self._stats = {
+            surface: {
+                "requests": 0, "fast_path": 0, "fallback": 0,
+                "agreement_checked": 0, "agreement_matched": 0,
+                "total_latency_us": 0.0,
+            }
+            for surface in ("chat", "voice")
+        }
+        print(f"✅ Local intent classifier ready ({len(examples)} bootstrap examples, threshold={threshold})")
+
+    @staticmethod
+    def _build_centroids(examples: List[Tuple[str, str]]) -> Dict[str, Dict[str, float]]:
+        centroids: Dict[str, Dict[str, float]] = {label: {} for label in LABELS}
+        for text, label in examples:
+            for gram, value in _ngram_profile(fold_text(text)).items():
+                centroids[label][gram] = centroids[label].get(gram, 0.0) + value
+        for label, vector in centroids.items():
+            norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+            centroids[label] = {gram: v / norm for gram, v in vector.items()}
+        return centroids
+
+    def predict(self, text: str, has_image: bool = False) -> IntentPrediction:
+        """
+        Score a message against every label.
+
+        Args:
+            text: The user's message
+            has_image: Whether an image is attached (images carry signal we cannot see)
+
+        Returns:
+            IntentPrediction with the top label, its probability and all raw scores
+        """
+        folded = fold_text(text)
+        evidence = {label: 0.0 for label in LABELS}
+        for pattern, label, weight in _COMPILED_LEXICON:
+            if pattern.search(folded):
+                evidence[label] += weight
+
+        evidence[NORMAL] += NORMAL_PRIOR
+        if not has_image and not any(evidence[label] for label in LABELS if label != NORMAL):
+            evidence[NORMAL] += NO_SIGNAL_BONUS
+
+        profile = _ngram_profile(folded)
+        for label in LABELS:
+            evidence[label] += NGRAM_WEIGHT * _cosine(profile, self._centroids[label])
+
+        top = max(evidence.values())
+        exp_scores = {label: math.exp(score - top) for label, score in evidence.items()}
+        total = sum(exp_scores.values())
+        label = max(exp_scores, key=exp_scores.get)
+        return IntentPrediction(label=label, confidence=exp_scores[label] / total, scores=evidence)
+
+    def classify(self, surface: str, text: str, has_image: bool = False) -> Tuple[Optional[str], IntentPrediction]:
+        """
+        Try to answer on the fast path.
+
+        Args:
+            surface: "chat" (intent.txt labels) or "voice" (voice_nlu.txt intents)
+            text: The user's message
+            has_image: Whether an image is attached
+
+        Returns:
+            (surface label or None if the LLM should decide, the raw prediction)
+        """
+        started = time.perf_counter()
+        prediction = self.predict(text, has_image)
+        labels = CHAT_LABELS if surface == "chat" else VOICE_LABELS
+        stats = self._stats[surface]
+        stats["requests"] += 1
+        stats["total_latency_us"] += (time.perf_counter() - started) * 1e6
+
+        conflicting = any(
+            score >= CONFLICT_SCORE
+            for label, score in prediction.scores.items()
+            if label not in (NORMAL, prediction.label)
+        )
+        if self.enabled and prediction.confidence >= self.threshold and prediction.label in labels and not conflicting:
+            stats["fast_path"] += 1
+            return labels[prediction.label], prediction
+        stats["fallback"] += 1
+        return None, prediction
+
+    def should_shadow(self) -> bool:
+        """Whether to re-check a fast-path answer against the LLM in the background."""
+        return self.shadow_rate > 0 and random.random() < self.shadow_rate
+
+    def record_llm_label(self, surface: str, prediction: IntentPrediction, llm_label: str):
+        """Compare the local top label with the LLM's answer for the agreement metric."""
+        labels = CHAT_LABELS if surface == "chat" else VOICE_LABELS
+        stats = self._stats[surface]
+        stats["agreement_checked"] += 1
+        if labels.get(prediction.label) == llm_label:
+            stats["agreement_matched"] += 1
+
+    def stats(self) -> dict:
+        result = {"enabled": self.enabled, "threshold": self.threshold, "shadow_rate": self.shadow_rate}
+        for surface, s in self._stats.items():
+            requests = s["requests"]
+            checked = s["agreement_checked"]
+            result[surface] = {
+                "requests": requests,
+                "fast_path": s["fast_path"],
+                "fallback": s["fallback"],
+                "hit_rate": round(s["fast_path"] / requests, 4) if requests else 0.0,
+                "agreement_checked": checked,
+                "agreement_rate": round(s["agreement_matched"] / checked, 4) if checked else None,
+                "avg_latency_us": round(s["total_latency_us"] / requests, 1) if requests else 0.0,
+            }
+        return result
+
+
+intent_classifier = LocalIntentClassifier()
@@ -0,0 +1,156 @@
+"""
+Async HyperCLOVA X client shared by every LLM call site.
+
+All chat completions and embeddings go through one AsyncOpenAI instance backed
+by a keep-alive httpx connection pool, so upstream round trips never block the
+event loop and a single worker can keep many completions in flight.
+"""
+import os
+from typing import AsyncIterator, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from llm_governor import governor
+from llm_telemetry import llm_telemetry
+from resilience import upstreams
+
+_llm = upstreams["llm"]
+_embedding = upstreams["embedding"]
+
+CLOVA_STUDIO_API_KEY = os.getenv("CLOVA_STUDIO_API_KEY", "nv-a851d08d11b84ff18525aa7cd38d138dxBoj")
+CLOVA_STUDIO_BASE_URL = os.getenv("CLOVA_STUDIO_BASE_URL", "https://clovastudio.stream.ntruss.com/v1/openai")
+
+# Connection pool sizing (per worker)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+
+_client: Optional[AsyncOpenAI] = None
+
+
+def get_client() -> AsyncOpenAI:
+    """Return the process-wide AsyncOpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+        _client = AsyncOpenAI(
+            api_key=CLOVA_STUDIO_API_KEY,
+            base_url=CLOVA_STUDIO_BASE_URL,
+            http_client=http_client,
+            max_retries=0,  # Retries and deadlines are handled by resilience.upstreams
+        )
+        print(f"✅ Async LLM client ready (pool: {LLM_MAX_CONNECTIONS} connections, {LLM_MAX_KEEPALIVE_CONNECTIONS} keep-alive)")
+    return _client
+
+
+async def chat_completion(task: str, **kwargs):
+    """
+    Run a non-streaming chat completion.
+
+    Args:
+        task: Call-site label used for admission priority (see llm_governor.TASK_PRIORITIES)
+        **kwargs: Arguments forwarded to `chat.completions.create` (model, messages, ...)
+
+    Returns:
+        The ChatCompletion response object
+
+    Raises:
+        LLMOverloadedError if the governor sheds the call
+        UpstreamUnavailableError if the LLM breaker is open or the call keeps timing out
+    """
+    call = llm_telemetry.start(task)
+    try:
+        _llm.fail_fast()
+        async with governor.slot(task):
+            call.upstream_started()
+            response = await _llm.call(lambda: get_client().chat.completions.create(stream=False, **kwargs))
+    except BaseException as e:
+        call.failed(e)
+        raise
+    call.finished(usage=getattr(response, "usage", None))
+    return response
+
+
+async def stream_chat_completion(task: str, **kwargs) -> AsyncIterator[str]:
+    """
+    Run a streaming chat completion and yield the text deltas.
+
+    The governor slot is held until the stream is finished. Closing the
+    generator early closes the upstream stream as well, so callers can stop
+    generation by simply breaking out of the loop.
+
+    Args:
+        task: Call-site label used for admission priority (see llm_governor.TASK_PRIORITIES)
+        **kwargs: Arguments forwarded to `chat.completions.create` (model, messages, ...)
+
+    Yields:
+        Non-empty content deltas as they arrive
+    """
+    call = llm_telemetry.start(task)
+    usage = None
+    deltas = 0
+    try:
+        _llm.fail_fast()
+        async with governor.slot(task):
+            call.upstream_started()
+            # The deadline and retries cover opening the stream; nothing has been emitted yet
+            stream = await _llm.call(lambda: get_client().chat.completions.create(stream=True, **kwargs))
+            try:
+                async for chunk in stream:
+                    # Some deployments report usage on the final chunk
+                    usage = getattr(chunk, "usage", None) or usage
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content is not None:
+                        call.first_token()
+                        deltas += 1
+                        yield content
+            except Exception as e:
+                _llm.record_failure(e)
+                raise
+            finally:
+                await stream.close()
+    except GeneratorExit:
+        # Consumer stopped early (client disconnect or early-stop parsing)
+        if deltas:
+            call.finished(usage=usage, completion_tokens=deltas, closed_early=True)
+        else:
+            call.failed("Closed")
+        raise
+    except BaseException as e:
+        call.failed(e)
+        raise
+    call.finished(usage=usage, completion_tokens=deltas)
+
+
+async def create_embeddings(**kwargs):
+    """
+    Create embeddings through the OpenAI-compatible embeddings API.
+
+    Args:
+        **kwargs: Arguments forwarded to `embeddings.create` (model, input, ...)
+
+    Returns:
+        The CreateEmbeddingResponse object
+    """
+    return await _embedding.call(lambda: get_client().embeddings.create(**kwargs))
+
+
+async def aclose():
+    """Close the shared client and its connection pool."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        print("✅ Async LLM client closed")
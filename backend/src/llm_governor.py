@@ -0,0 +1,240 @@
+"""
+Priority-aware admission control for upstream LLM calls.
+
+Every HCX-005 call takes a slot from a shared concurrency budget. Callers are
+grouped into priority classes (transfers > scam checks > general chat); each
+class has a bounded wait queue, a queue-time deadline and a cap on how many
+slots it may hold, so a flood of general chat can never starve the banking
+flows. Requests that cannot be admitted in time are shed immediately with
+LLMOverloadedError, which the API turns into 429 + Retry-After.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Deque, Dict
+
+
+class LLMOverloadedError(Exception):
+    """Raised when an LLM call is shed by the governor."""
+
+    def __init__(self, task: str, retry_after: int, reason: str):
+        self.task = task
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(f"LLM capacity exhausted for task '{task}': {reason}")
+
+
+@dataclass
+class PriorityClass:
+    name: str
+    level: int             # Lower value = served first
+    max_queue: int         # Maximum number of waiters before shedding
+    queue_timeout: float   # Seconds a caller may wait for a slot
+    max_share: float       # Fraction of the concurrency budget this class may hold
+
+
+# Task name -> priority class name
+TASK_PRIORITIES = {
+    "transfer_extraction": "critical",
+    "transfer_speculative": "normal",
+    "voice_nlu": "critical",
+    "scam_check": "high",
+    "scam_check_batch": "normal",
+    "intent": "high",
+    "intent_transfer": "high",
+    "intent_shadow": "normal",
+    "classification": "high",
+    "receipt_extraction": "high",
+    "chat": "normal",
+}
+DEFAULT_PRIORITY = "normal"
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class LLMGovernor:
+    def __init__(self, max_concurrency: int, classes: Dict[str, PriorityClass]):
+        self.max_concurrency = max_concurrency
+        self.classes = classes
+        self._order = sorted(classes.values(), key=lambda c: c.level)
+        self._queues: Dict[str, Deque[asyncio.Future]] = {name: deque() for name in classes}
+        self._active: Dict[str, int] = {name: 0 for name in classes}
+        # Exponentially weighted average of how long a slot is held
+        self._avg_hold_time = 2.0
+        self._stats = {
+            name: {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_deadline": 0, "total_wait_ms": 0.0}
+            for name in classes
+        }
+
+    @classmethod
+    def from_env(cls) -> "LLMGovernor":
+        classes = {
+            "critical": PriorityClass(
+                name="critical", level=0,
+                max_queue=_env_int("LLM_QUEUE_LIMIT_CRITICAL", 200),
+                queue_timeout=_env_float("LLM_QUEUE_TIMEOUT_CRITICAL", 10.0),
+                max_share=1.0,
+            ),
+            "high": PriorityClass(
+                name="high", level=1,
+                max_queue=_env_int("LLM_QUEUE_LIMIT_HIGH", 200),
+                queue_timeout=_env_float("LLM_QUEUE_TIMEOUT_HIGH", 8.0),
+                max_share=1.0,
+            ),
+            "normal": PriorityClass(
+                name="normal", level=2,
+                max_queue=_env_int("LLM_QUEUE_LIMIT_NORMAL", 50),
+                queue_timeout=_env_float("LLM_QUEUE_TIMEOUT_NORMAL", 3.0),
+                max_share=_env_float("LLM_CHAT_MAX_SHARE", 0.75),
+            ),
+        }
+        return cls(max_concurrency=_env_int("LLM_MAX_CONCURRENCY", 32), classes=classes)
+
+    # ---- Internal helpers ----
+
+    def _class_for(self, task: str) -> PriorityClass:
+        return self.classes[TASK_PRIORITIES.get(task, DEFAULT_PRIORITY)]
+
+    def _total_active(self) -> int:
+        return sum(self._active.values())
+
+    def _class_cap(self, pclass: PriorityClass) -> int:
+        return max(1, math.floor(self.max_concurrency * pclass.max_share))
+
+    def _can_run(self, pclass: PriorityClass) -> bool:
+        return (
+            self._total_active() < self.max_concurrency
+            and self._active[pclass.name] < self._class_cap(pclass)
+        )
+
+    def _waiting_ahead(self, pclass: PriorityClass) -> int:
+        return sum(len(self._queues[c.name]) for c in self._order if c.level <= pclass.level)
+
+    def _estimated_wait(self, pclass: PriorityClass) -> float:
+        return (self._waiting_ahead(pclass) + 1) / self.max_concurrency * self._avg_hold_time
+
+    def _retry_after(self, pclass: PriorityClass) -> int:
+        return max(1, math.ceil(self._estimated_wait(pclass)))
+
+    def _grant_next(self):
+        """Hand freed slots to the highest-priority waiters that are allowed to run."""
+        for pclass in self._order:
+            queue = self._queues[pclass.name]
+            while queue and self._can_run(pclass):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self._active[pclass.name] += 1
+                waiter.set_result(None)
+            if self._total_active() >= self.max_concurrency:
+                return
+
+    def _release(self, pclass: PriorityClass, held_for: float):
+        self._active[pclass.name] -= 1
+        self._avg_hold_time = 0.9 * self._avg_hold_time + 0.1 * held_for
+        self._grant_next()
+
+    # ---- Public API ----
+
+    def check_admission(self, task: str):
+        """
+        Fail fast if a call for this task would certainly be shed.
+
+        Used by streaming endpoints before the response has started, so the
+        client still gets a proper 429 instead of an error frame mid-stream.
+        """
+        pclass = self._class_for(task)
+        if self._can_run(pclass) and not self._waiting_ahead(pclass):
+            return
+        if len(self._queues[pclass.name]) >= pclass.max_queue:
+            self._stats[pclass.name]["shed_queue_full"] += 1
+            raise LLMOverloadedError(task, self._retry_after(pclass), "queue full")
+        if self._estimated_wait(pclass) > pclass.queue_timeout:
+            self._stats[pclass.name]["shed_deadline"] += 1
+            raise LLMOverloadedError(task, self._retry_after(pclass), "estimated wait exceeds deadline")
+
+    async def acquire(self, task: str) -> PriorityClass:
+        """
+        Wait for an LLM slot for the given task.
+
+        Returns:
+            The priority class the slot was charged to (pass it to release)
+
+        Raises:
+            LLMOverloadedError if the queue is full or the deadline expires
+        """
+        pclass = self._class_for(task)
+        stats = self._stats[pclass.name]
+
+        if self._can_run(pclass) and not self._waiting_ahead(pclass):
+            self._active[pclass.name] += 1
+            stats["admitted"] += 1
+            return pclass
+
+        self.check_admission(task)
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._queues[pclass.name]
+        queue.append(waiter)
+        stats["queued"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=pclass.queue_timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(pclass, 0.0)
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            stats["total_wait_ms"] += (time.monotonic() - started) * 1000
+            if waiter in queue:
+                queue.remove(waiter)
+
+        if not waiter.done():
+            waiter.cancel()
+            stats["shed_deadline"] += 1
+            raise LLMOverloadedError(task, self._retry_after(pclass), "queue deadline exceeded")
+
+        stats["admitted"] += 1
+        return pclass
+
+    @asynccontextmanager
+    async def slot(self, task: str):
+        """Hold an LLM slot for the duration of the block (including a whole stream)."""
+        pclass = await self.acquire(task)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(pclass, time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._total_active(),
+            "avg_hold_time_s": round(self._avg_hold_time, 3),
+            "classes": {
+                name: {
+                    "active": self._active[name],
+                    "cap": self._class_cap(self.classes[name]),
+                    "queued_now": len(self._queues[name]),
+                    **counters,
+                    "total_wait_ms": round(counters["total_wait_ms"], 1),
+                }
+                for name, counters in self._stats.items()
+            },
+        }
+
+
+governor = LLMGovernor.from_env()
@@ -0,0 +1,195 @@
+"""
+In-process telemetry for HCX-005 calls.
+
+Every chat completion made through llm_client is recorded under its task label
+(intent, transfer_extraction, scam_check, chat, ...) and the HTTP endpoint that
+triggered it. Per (task, endpoint) we keep fixed-bucket histograms of
+time-to-first-token, total latency, tokens/sec, prompt and completion tokens,
+plus counters of calls and error classes. The endpoint is carried in a
+contextvar set by EndpointContextMiddleware, so call sites don't need to pass
+it around.
+"""
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="background")
+
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2000, 4000, 8000, 15000, 30000, 60000]
+TOKENS_PER_SEC_BUCKETS = [1, 5, 10, 20, 40, 80, 160, 320]
+TOKEN_COUNT_BUCKETS = [16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384]
+
+
+class Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Bucket upper bound containing the q-quantile (max for the overflow bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def export(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 2),
+            "mean": round(self.sum / self.count, 2) if self.count else None,
+            "max": round(self.max, 2),
+            "p50_le": self.quantile(0.5),
+            "p95_le": self.quantile(0.95),
+            "buckets": {
+                **{f"le_{upper}": n for upper, n in zip(self.buckets, self.counts)},
+                "le_inf": self.counts[-1],
+            },
+        }
+
+
+class _Series:
+    def __init__(self):
+        self.calls = 0
+        self.closed_early = 0
+        self.errors: Dict[str, int] = {}
+        self.ttft_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.tokens_per_sec = Histogram(TOKENS_PER_SEC_BUCKETS)
+        self.prompt_tokens = Histogram(TOKEN_COUNT_BUCKETS)
+        self.completion_tokens = Histogram(TOKEN_COUNT_BUCKETS)
+
+    def export(self) -> dict:
+        return {
+            "calls": self.calls,
+            "closed_early": self.closed_early,
+            "errors": dict(self.errors),
+            "ttft_ms": self.ttft_ms.export(),
+            "latency_ms": self.latency_ms.export(),
+            "tokens_per_sec": self.tokens_per_sec.export(),
+            "prompt_tokens": self.prompt_tokens.export(),
+            "completion_tokens": self.completion_tokens.export(),
+        }
+
+
+class LLMCall:
+    """Tracks a single LLM call; created by LLMTelemetry.start()."""
+
+    def __init__(self, telemetry: "LLMTelemetry", task: str, endpoint: str):
+        self._telemetry = telemetry
+        self.task = task
+        self.endpoint = endpoint
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self._done = False
+
+    def upstream_started(self):
+        """Restart the clock once the governor slot is held, so queueing isn't counted as latency."""
+        self.started = time.monotonic()
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+    def finished(self, usage=None, completion_tokens: Optional[int] = None, closed_early: bool = False):
+        """
+        Record a successful call.
+
+        Args:
+            usage: OpenAI-style usage object (prompt_tokens / completion_tokens), if the API returned one
+            completion_tokens: Fallback completion count (e.g. number of streamed deltas)
+            closed_early: The consumer stopped reading the stream before it ended
+        """
+        if self._done:
+            return
+        self._done = True
+        now = time.monotonic()
+        series = self._telemetry._series(self.task, self.endpoint)
+        series.calls += 1
+        series.closed_early += closed_early
+        latency = now - self.started
+        series.latency_ms.observe(latency * 1000)
+        if self.first_token_at is not None:
+            series.ttft_ms.observe((self.first_token_at - self.started) * 1000)
+
+        prompt = getattr(usage, "prompt_tokens", None) if usage is not None else None
+        completion = getattr(usage, "completion_tokens", None) if usage is not None else None
+        if completion is None:
+            completion = completion_tokens
+        if prompt is not None:
+            series.prompt_tokens.observe(prompt)
+        if completion is not None:
+            series.completion_tokens.observe(completion)
+            # Generation speed: for streams measure from the first token, otherwise the whole call
+            generating = now - (self.first_token_at or self.started)
+            if completion and generating > 0:
+                series.tokens_per_sec.observe(completion / generating)
+
+    def failed(self, error):
+        """Record a failed call under the error's class name (or a given label)."""
+        if self._done:
+            return
+        self._done = True
+        series = self._telemetry._series(self.task, self.endpoint)
+        series.calls += 1
+        name = error if isinstance(error, str) else type(error).__name__
+        series.errors[name] = series.errors.get(name, 0) + 1
+
+
+class LLMTelemetry:
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], _Series] = {}
+
+    def _series(self, task: str, endpoint: str) -> _Series:
+        key = (task, endpoint)
+        series = self._data.get(key)
+        if series is None:
+            series = self._data[key] = _Series()
+        return series
+
+    def start(self, task: str) -> LLMCall:
+        return LLMCall(self, task, current_endpoint.get())
+
+    def export(self) -> dict:
+        """Histograms grouped as {task: {endpoint: series}}."""
+        result: Dict[str, dict] = {}
+        for (task, endpoint), series in sorted(self._data.items()):
+            result.setdefault(task, {})[endpoint] = series.export()
+        return result
+
+
+class EndpointContextMiddleware:
+    """ASGI middleware that labels everything done for a request with its path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = current_endpoint.set(scope.get("path", "unknown"))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_endpoint.reset(token)
+
+
+llm_telemetry = LLMTelemetry()
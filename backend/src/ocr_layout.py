@@ -0,0 +1,359 @@
+"""
+Layout-aware post-processing of Clova OCR V2 responses.
+
+Clova returns one field per word with its bounding polygon and a lineBreak
+flag. Instead of joining every inferText with spaces, the words are rebuilt
+into lines (lineBreak flags when present, otherwise vertical overlap), each
+line is split into cells at wide horizontal gaps, and "label: value" /
+"label ..... value" lines become key/value pairs.
+
+On top of the layout, deterministic extractors read receipt totals, dates and
+merchants, and bank-transfer screenshot fields (account number, amount, bank,
+message). They return None unless the result is unambiguous, in which case
+callers fall back to receipt_extractor.txt / transfer_extractor.txt, now fed
+the line-preserving layout text instead of a flat blob.
+"""
+import os
+import re
+import statistics
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from intent_classifier import fold_text
+
+# Set to false to always send OCR text to the LLM extractors (layout text is still used)
+OCR_DETERMINISTIC_EXTRACTION = os.getenv("OCR_DETERMINISTIC_EXTRACTION", "true").lower() == "true"
+
+# A gap wider than this many line heights starts a new cell ("Total      55,000")
+CELL_GAP_LINE_HEIGHTS = 1.5
+
+
+@dataclass
+class OcrWord:
+    text: str
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    line_break: Optional[bool] = None
+
+    @property
+    def height(self) -> float:
+        return max(1.0, self.y1 - self.y0)
+
+    @property
+    def y_center(self) -> float:
+        return (self.y0 + self.y1) / 2
+
+
+@dataclass
+class OcrLine:
+    words: List[OcrWord]
+    cells: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return " ".join(w.text for w in self.words)
+
+
+def _word_from_field(ocr_field: dict) -> Optional[OcrWord]:
+    text = (ocr_field.get("inferText") or "").strip()
+    if not text:
+        return None
+    vertices = (ocr_field.get("boundingPoly") or {}).get("vertices") or []
+    xs = [v.get("x", 0.0) for v in vertices] or [0.0]
+    ys = [v.get("y", 0.0) for v in vertices] or [0.0]
+    return OcrWord(text, min(xs), min(ys), max(xs), max(ys), ocr_field.get("lineBreak"))
+
+
+def _lines_by_line_break(words: List[OcrWord]) -> List[List[OcrWord]]:
+    lines, current = [], []
+    for word in words:
+        current.append(word)
+        if word.line_break:
+            lines.append(current)
+            current = []
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _lines_by_geometry(words: List[OcrWord]) -> List[List[OcrWord]]:
+    """Group words whose vertical centers are within half a word height."""
+    lines: List[List[OcrWord]] = []
+    centers: List[float] = []
+    for word in sorted(words, key=lambda w: w.y_center):
+        if lines and abs(word.y_center - centers[-1]) <= 0.5 * min(word.height, lines[-1][0].height):
+            lines[-1].append(word)
+            centers[-1] = statistics.mean(w.y_center for w in lines[-1])
+        else:
+            lines.append([word])
+            centers.append(word.y_center)
+    return [sorted(line, key=lambda w: w.x0) for line in lines]
+
+
+def _cells(words: List[OcrWord]) -> List[str]:
+    line_height = statistics.median(w.height for w in words)
+    cells, current = [], [words[0].text]
+    for previous, word in zip(words, words[1:]):
+        if word.x0 - previous.x1 > CELL_GAP_LINE_HEIGHTS * line_height:
+            cells.append(" ".join(current))
+            current = []
+        current.append(word.text)
+    cells.append(" ".join(current))
+    return cells
+
+
+class OcrLayout:
+    def __init__(self, words: List[OcrWord]):
+        if any(w.line_break for w in words):
+            grouped = _lines_by_line_break(words)
+        else:
+            grouped = _lines_by_geometry(words)
+        self.lines = [OcrLine(line, _cells(line)) for line in grouped if line]
+        self.key_values = self._key_values()
+
+    @classmethod
+    def from_response(cls, ocr_response: dict) -> "OcrLayout":
+        """Build the layout from every successfully inferred image of a Clova OCR V2 response."""
+        words = []
+        for image_result in ocr_response.get("images", []):
+            if image_result.get("inferResult") != "SUCCESS":
+                print(f"⚠️ OCR inference failed for an image in the batch: {image_result.get('message', 'No message')}")
+                continue
+            for ocr_field in image_result.get("fields", []):
+                word = _word_from_field(ocr_field)
+                if word is not None:
+                    words.append(word)
+        return cls(words)
+
+    @property
+    def text(self) -> str:
+        """Line-preserving text, one OCR line per line"""
+        return "\n".join(line.text for line in self.lines)
+
+    def _key_values(self) -> List[Tuple[str, str]]:
+        pairs = []
+        for line in self.lines:
+            text = line.text
+            if ":" in text:
+                key, value = text.split(":", 1)
+                pairs.append((key.strip(), value.strip()))
+            elif len(line.cells) >= 2:
+                pairs.append((line.cells[0], line.cells[-1]))
+        return pairs
+
+    def find_value(self, label_re: re.Pattern, value_re: re.Pattern,
+                   exclude_re: Optional[re.Pattern] = None) -> List[str]:
+        """
+        Values for a label, in reading order.
+
+        The value is looked for after the label on the same line (":" or a separate
+        cell), then on the next line (label above value, as in banking apps).
+
+        Args:
+            label_re: Pattern matched against the folded line text
+            value_re: Pattern the value must contain
+            exclude_re: Lines whose folded text matches this are skipped (e.g. "subtotal")
+        """
+        values = []
+        for i, line in enumerate(self.lines):
+            folded = fold_text(line.text)
+            label = label_re.search(folded)
+            if not label or (exclude_re is not None and exclude_re.search(folded)):
+                continue
+            # Same line, after the label (match positions are stable: folding keeps lengths for Latin/Hangul)
+            rest = line.text[label.end():] if len(folded) == len(line.text) else line.text
+            rest = rest.lstrip(" :-")
+            match = value_re.search(rest)
+            if match is None and i + 1 < len(self.lines):
+                match = value_re.search(self.lines[i + 1].text)
+            if match is not None:
+                values.append(match.group(0).strip())
+        return values
+
+
+# --- Value parsing ---
+_AMOUNT_RE = re.compile(
+    r"[+-]?\s*(?:\$|₩)?\s*\d{1,3}(?:[.,\s]\d{3})+(?:[.,]\d{1,2})?\s*(?:vnd|vnđ|đ|d|won|원|usd|k)?"
+    r"|[+-]?\s*\d+(?:[.,]\d{1,2})?\s*(?:vnd|vnđ|đ|d|won|원|usd|k|tr|triệu|trieu)?(?![\w])",
+    re.IGNORECASE,
+)
+_ACCOUNT_RE = re.compile(r"(?<![\d])\d(?:[\d\s-]{4,22})\d(?![\d])")
+_DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), ("y", "m", "d")),
+    (re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b"), ("d", "m", "y")),
+    (re.compile(r"(\d{4})\s*년\s*(\d{1,2})\s*월\s*(\d{1,2})\s*일"), ("y", "m", "d")),
+]
+
+
+def parse_amount(text: str) -> Optional[int]:
+    """Parse "1.250.000đ", "25,000,000 VND", "12,000원", "200K", "1.5 triệu" into an integer amount."""
+    folded = fold_text(text).replace(" ", "")
+    multiplier = 1
+    for suffix, factor in (("trieu", 1_000_000), ("tr", 1_000_000), ("k", 1_000)):
+        if re.search(rf"\d{suffix}$", folded.rstrip("vnd")):
+            multiplier = factor
+            break
+    number = re.search(r"\d[\d.,]*", folded)
+    if not number:
+        return None
+    digits = number.group(0).rstrip(".,")
+    # A trailing 1-2 digit group after the last separator is a decimal part
+    decimal = re.search(r"[.,](\d{1,2})$", digits)
+    fraction = 0.0
+    if decimal:
+        fraction = float("0." + decimal.group(1))
+        digits = digits[:decimal.start()]
+    integer = int(re.sub(r"[.,]", "", digits) or 0)
+    return int(round((integer + fraction) * multiplier))
+
+
+def _looks_like_money(token: str) -> bool:
+    """Thousands separators or a currency marker, so phone numbers and IDs are not read as amounts"""
+    return bool(re.search(r"\d[.,\s]\d{3}", token) or re.search(r"(vnd|vnđ|đ|won|원|usd|\$|₩|k)\s*$", token.strip(), re.IGNORECASE))
+
+
+def parse_date(text: str) -> Optional[str]:
+    """First valid date in the text as YYYY-MM-DD"""
+    for pattern, order in _DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            parts = dict(zip(order, (int(g) for g in match.groups())))
+            try:
+                return date(parts["y"], parts["m"], parts["d"]).isoformat()
+            except ValueError:
+                continue
+    return None
+
+
+# --- Receipts ---
+# Folded labels: lowercase, no Vietnamese diacritics
+_TOTAL_RE = re.compile(
+    r"\b(tong cong|tong tien|tong thanh toan|thanh toan|can thanh toan|grand total|total( amount| due)?|amount due)\b"
+    r"|(합계|총액|결제금액|받을금액)"
+)
+_SUBTOTAL_RE = re.compile(r"\b(sub ?total|tam tinh|tien hang|tien mat|tien khach dua|tien thua|cash|change|vat|discount|giam gia)\b|(소계|거스름돈|받은금액)")
+_CASH_RE = re.compile(r"\b(tien mat|tien khach dua|khach dua|cash|tendered)\b|(받은금액)")
+_INCOME_RE = re.compile(r"(^|\s)\+\s*\d|\b(nhan tien|tien vao|received|credited|deposit)\b|(입금)")
+_MERCHANT_SKIP_RE = re.compile(r"\b(hoa don|phieu|receipt|invoice|bill|dia chi|address|tel|dt|mst|ma so thue|ngay|date)\b|(영수증|주소|전화)")
+
+
+@dataclass
+class ReceiptFields:
+    amount: int
+    transaction_date: Optional[str]
+    merchant: Optional[str]
+
+    def as_extraction(self) -> dict:
+        """Same shape as receipt_extractor.txt's JSON"""
+        description = f"Expense at {self.merchant}" if self.merchant else "Receipt payment"
+        return {
+            "transaction_type": "expense",
+            "amount": self.amount,
+            "description": f"{description} (Processed by OCR)",
+            "transaction_date": self.transaction_date,
+        }
+
+
+def _merchant(layout: OcrLayout) -> Optional[str]:
+    for line in layout.lines[:3]:
+        text = line.text.strip()
+        letters = sum(ch.isalpha() for ch in text)
+        if letters >= 3 and letters >= 0.6 * len(text.replace(" ", "")) and not _MERCHANT_SKIP_RE.search(fold_text(text)):
+            return text
+    return None
+
+
+def extract_receipt(layout: OcrLayout) -> Optional[ReceiptFields]:
+    """
+    Deterministic receipt extraction.
+
+    Returns:
+        ReceiptFields when a labelled total was found and no other amount on the
+        receipt is larger (except cash given / change lines); None otherwise
+    """
+    if not OCR_DETERMINISTIC_EXTRACTION or not layout.lines or _INCOME_RE.search(fold_text(layout.text)):
+        return None
+    totals = [parse_amount(v) for v in layout.find_value(_TOTAL_RE, _AMOUNT_RE, exclude_re=_SUBTOTAL_RE)]
+    totals = [t for t in totals if t]
+    if not totals:
+        return None
+    total = totals[-1]  # The final total line wins over earlier "total" mentions
+    for line in layout.lines:
+        if _CASH_RE.search(fold_text(line.text)):
+            continue  # Cash given can exceed the total
+        for match in _AMOUNT_RE.finditer(line.text):
+            token = match.group(0)
+            if _looks_like_money(token) and (parse_amount(token) or 0) > total:
+                return None  # A larger figure we can't explain, e.g. a misread total
+    return ReceiptFields(amount=total, transaction_date=parse_date(layout.text), merchant=_merchant(layout))
+
+
+# --- Bank transfer screenshots ---
+_ACCOUNT_LABEL_RE = re.compile(
+    r"\b(so tai khoan|stk|tai khoan (nhan|thu huong|den)|tk nhan|den tai khoan|account( number| no\.?)?|to account|beneficiary account)\b"
+    r"|(계좌번호|받는 ?계좌|입금계좌)"
+)
+_AMOUNT_LABEL_RE = re.compile(r"\b(so tien|amount|transfer amount|so tien chuyen)\b|(금액|이체금액|송금액)")
+_BANK_LABEL_RE = re.compile(r"\b(ngan hang( nhan| thu huong)?|bank( name)?|to bank)\b|(은행)")
+_MESSAGE_LABEL_RE = re.compile(r"\b(noi dung( chuyen khoan)?|loi nhan|message|memo|content|description|nd)\b|(메모|받는분 통장표시)")
+_ANY_TEXT_RE = re.compile(r"\S.*\S|\S")
+KNOWN_BANKS = [
+    "Vietcombank", "VCB", "Techcombank", "TCB", "BIDV", "VietinBank", "Agribank", "MB Bank", "MBBank", "ACB",
+    "VPBank", "TPBank", "Sacombank", "HDBank", "VIB", "SHB", "OCB", "SeABank", "MSB", "Eximbank", "LienVietPostBank",
+    "Shinhan", "Woori", "KB Kookmin", "Kookmin", "Hana", "NH", "IBK", "KakaoBank", "Toss",
+]
+_KNOWN_BANK_RE = re.compile(r"\b(" + "|".join(re.escape(b) for b in KNOWN_BANKS) + r")\b", re.IGNORECASE)
+
+
+def extract_transfer(layout: OcrLayout) -> Optional[Dict[str, object]]:
+    """
+    Deterministic transfer-screenshot extraction.
+
+    Returns:
+        {"account_number", "amount", "description", "bank"} when a labelled account
+        number and a labelled amount were both found unambiguously; None otherwise
+    """
+    if not OCR_DETERMINISTIC_EXTRACTION:
+        return None
+    accounts = {re.sub(r"[\s-]", "", v) for v in layout.find_value(_ACCOUNT_LABEL_RE, _ACCOUNT_RE)}
+    accounts = {a for a in accounts if 6 <= len(a) <= 19}
+    amounts = {parse_amount(v) for v in layout.find_value(_AMOUNT_LABEL_RE, _AMOUNT_RE)}
+    amounts.discard(None)
+    amounts.discard(0)
+    if len(accounts) != 1 or len(amounts) != 1:
+        return None
+
+    bank = None
+    labelled_banks = layout.find_value(_BANK_LABEL_RE, _ANY_TEXT_RE)
+    if labelled_banks:
+        bank = labelled_banks[0]
+    else:
+        known = _KNOWN_BANK_RE.search(layout.text)
+        bank = known.group(0) if known else None
+    messages = layout.find_value(_MESSAGE_LABEL_RE, _ANY_TEXT_RE)
+    return {
+        "account_number": accounts.pop(),
+        "amount": amounts.pop(),
+        "description": messages[0] if messages else None,
+        "bank": bank,
+    }
+
+
+class OcrExtractionStats:
+    def __init__(self):
+        self._counts = {kind: {"deterministic": 0, "llm": 0} for kind in ("receipt", "transfer")}
+
+    def record(self, kind: str, deterministic: bool):
+        self._counts[kind]["deterministic" if deterministic else "llm"] += 1
+
+    def export(self) -> dict:
+        result = {"enabled": OCR_DETERMINISTIC_EXTRACTION}
+        for kind, counts in self._counts.items():
+            total = counts["deterministic"] + counts["llm"]
+            result[kind] = {**counts, "deterministic_rate": round(counts["deterministic"] / total, 4) if total else 0.0}
+        return result
+
+
+ocr_extraction_stats = OcrExtractionStats()
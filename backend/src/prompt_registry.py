@@ -0,0 +1,153 @@
+"""
+In-memory registry of the system prompts in backend/prompts.
+
+All prompts are loaded and validated once at startup and kept together with a
+prebuilt system message, so AI handlers no longer touch the filesystem per
+request. Files are re-checked at most every PROMPT_RELOAD_INTERVAL seconds:
+when the mtime or size changes the file is re-read, and the prompt is swapped
+only if its content hash actually changed. Each prompt carries a short content
+version id that caches (e.g. the scam verdict cache) can key on.
+"""
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.join(os.path.dirname(__file__), "..", "prompts"))
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2.0"))
+
+# Prompt name -> file name
+PROMPT_FILES = {
+    "scamcheck": "scamcheck.txt",
+    "intent": "intent.txt",
+    "intent_transfer": "intent_transfer.txt",
+    "transfer_extractor": "transfer_extractor.txt",
+    "receipt_extractor": "receipt_extractor.txt",
+    "voice_nlu": "voice_nlu.txt",
+    "voice_nlu_reply": "voice_nlu_reply.txt",
+}
+
+
+@dataclass(frozen=True)
+class Prompt:
+    name: str
+    text: str
+    version: str
+    mtime: float
+    size: int
+    # Prebuilt {"role": "system", ...} message; shared, must not be mutated
+    system_message: dict = field(repr=False)
+
+
+class PromptRegistry:
+    def __init__(self, prompts_dir: str = PROMPTS_DIR, files: Dict[str, str] = None,
+                 reload_interval: float = PROMPT_RELOAD_INTERVAL):
+        self.prompts_dir = prompts_dir
+        self.files = files or PROMPT_FILES
+        self.reload_interval = reload_interval
+        self._prompts: Dict[str, Prompt] = {}
+        self._last_checked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.load_errors = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.prompts_dir, self.files[name])
+
+    def _read(self, name: str, stat: os.stat_result) -> Optional[Prompt]:
+        """Read and validate a prompt file. Returns None if it is unusable."""
+        try:
+            with open(self._path(name), "r", encoding="utf-8") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"❌ Could not read prompt '{name}': {e}")
+            self.load_errors += 1
+            return None
+        if not text.strip():
+            print(f"❌ Prompt '{name}' is empty")
+            self.load_errors += 1
+            return None
+        return Prompt(
+            name=name,
+            text=text,
+            version=hashlib.sha256(text.encode("utf-8")).hexdigest()[:12],
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            system_message={"role": "system", "content": [{"type": "text", "text": text}]},
+        )
+
+    def _refresh(self, name: str):
+        """Reload a prompt if its file changed. Keeps the last good version on errors."""
+        current = self._prompts.get(name)
+        try:
+            stat = os.stat(self._path(name))
+        except OSError:
+            if current is None:
+                self.load_errors += 1
+            return
+        if current and current.mtime == stat.st_mtime and current.size == stat.st_size:
+            return
+        prompt = self._read(name, stat)
+        if prompt is None:
+            return
+        if current and current.version == prompt.version:
+            # Touched but unchanged: just remember the new mtime
+            self._prompts[name] = prompt
+            return
+        if current:
+            self.reloads += 1
+            print(f"🔄 Prompt '{name}' reloaded (version {current.version} -> {prompt.version})")
+        self._prompts[name] = prompt
+
+    def load_all(self):
+        """Load and validate every registered prompt (called at startup)."""
+        with self._lock:
+            now = time.monotonic()
+            for name in self.files:
+                self._refresh(name)
+                self._last_checked[name] = now
+        missing = [name for name in self.files if name not in self._prompts]
+        if missing:
+            print(f"⚠️ Prompts not available: {', '.join(missing)}")
+        print(f"✅ Loaded {len(self._prompts)}/{len(self.files)} prompts from {self.prompts_dir}")
+
+    def get(self, name: str) -> Optional[Prompt]:
+        """
+        Get a prompt, re-checking its file at most once per reload interval.
+
+        Returns:
+            The Prompt, or None if the file is missing or invalid
+        """
+        now = time.monotonic()
+        if now - self._last_checked.get(name, float("-inf")) >= self.reload_interval:
+            with self._lock:
+                if now - self._last_checked.get(name, float("-inf")) >= self.reload_interval:
+                    self._refresh(name)
+                    self._last_checked[name] = now
+        return self._prompts.get(name)
+
+    def text(self, name: str) -> Optional[str]:
+        prompt = self.get(name)
+        return prompt.text if prompt else None
+
+    def system_message(self, name: str) -> Optional[dict]:
+        prompt = self.get(name)
+        return prompt.system_message if prompt else None
+
+    def version(self, name: str) -> str:
+        prompt = self.get(name)
+        return prompt.version if prompt else "missing"
+
+    def stats(self) -> dict:
+        return {
+            "prompts_dir": self.prompts_dir,
+            "versions": {name: p.version for name, p in self._prompts.items()},
+            "missing": [name for name in self.files if name not in self._prompts],
+            "reloads": self.reloads,
+            "load_errors": self.load_errors,
+        }
+
+
+prompt_registry = PromptRegistry()
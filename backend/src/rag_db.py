@@ -2,70 +2,116 @@ from pymilvus import Collection, CollectionSchema, FieldSchema, DataType, connec
 import numpy as np
 from tqdm import tqdm
 import os
-from typing import List
+from typing import List, Optional
 import json
-import httpx
 import asyncio
+import hashlib
+import time
 
-# Embedding endpoint configuration
-EMBEDDING_API_BASE_URL = os.getenv("EMBEDDING_API_URL", "http://localhost:6011")
-EMBEDDING_ENDPOINT = f"{EMBEDDING_API_BASE_URL}/api/embeddings"
+from embedding_provider import EmbeddingProvider, make_embedding_provider
+from embedding_cache import embedding_cache
+from chunking import CHUNK_OVERLAP_CHARS, CHUNK_SIZE_CHARS, aggregate_by_document, chunk_metadata, chunk_text
+
+# Texts per upstream embedding request, and requests in flight per worker
+EMBEDDING_MICRO_BATCH_SIZE = int(os.getenv("EMBEDDING_MICRO_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_CONCURRENCY = int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", "4"))
+# Chunk hits fetched per requested document when search results are aggregated per document
+CHUNK_SEARCH_OVERFETCH = int(os.getenv("CHUNK_SEARCH_OVERFETCH", "4"))
+# Where the per-collection content version marker (<collection>.kb_version) is kept
+RAG_KB_VERSION_DIR = os.getenv("RAG_KB_VERSION_DIR") or os.path.dirname(os.path.abspath(__file__))
+# How often (seconds) kb_version re-checks the marker for rebuilds done by another process
+RAG_KB_VERSION_RELOAD_INTERVAL = float(os.getenv("RAG_KB_VERSION_RELOAD_INTERVAL", "2.0"))
 
 
 class MilvusRAGDB:
-    def __init__(self, host: str = "localhost", port: str = "19530", collection_name: str = "rag_collection"):
+    def __init__(self, host: str = "localhost", port: str = "19530", collection_name: str = "rag_collection",
+                 embedding_provider: Optional[EmbeddingProvider] = None):
         self.host = host
         self.port = port
         self.collection_name = collection_name
+        # In-process by default; HTTP when the embedding service runs elsewhere (EMBEDDING_PROVIDER)
+        self.embedding_provider = embedding_provider or make_embedding_provider()
+        self._embed_semaphore = asyncio.Semaphore(max(1, EMBEDDING_BATCH_CONCURRENCY))
         connections.connect("default", host=self.host, port=self.port)
         self.collection = None
+        self._kb_version = None
+        self._content_version = None
+        self._marker_stat = None
+        self._marker_checked = float("-inf")
         self._initialize_collection()
 
-    async def get_embedding_from_api(self, text: str) -> List[float]:
+    async def _embed(self, text: str) -> np.ndarray:
+        try:
+            return await self.embedding_provider.embed(text)
+        except Exception as e:
+            print(f"❌ Error fetching embedding from API: {e}")
+            raise
+
+    async def get_embedding_from_api(self, text: str) -> np.ndarray:
         """
-        Get embedding from the FastAPI embedding endpoint.
+        Get an embedding from the embedding cache, or from the configured embedding provider.
         
         Args:
             text: The text to generate embeddings for
             
         Returns:
-            List of floats representing the embedding vector
+            float32 NumPy vector
             
         Raises:
-            Exception if the API call fails
+            Exception if the embedding call fails
         """
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    EMBEDDING_ENDPOINT,
-                    json={"text": text, "model": "bge-m3"},
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                if data.get("success"):
-                    return data.get("embedding")
+        model = self.embedding_provider.model
+        cached = await embedding_cache.get(model, text)
+        if cached is not None:
+            return cached
+        embedding = await self._embed(text)
+        await embedding_cache.put(model, text, embedding)
+        return embedding
+
+    async def _embed_micro_batch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """One upstream request for a micro-batch; if it fails, texts are retried one by one so one bad item can't sink the rest."""
+        async with self._embed_semaphore:
+            try:
+                return await self.embedding_provider.embed_many(texts)
+            except Exception as e:
+                if len(texts) > 1:
+                    print(f"⚠️ Embedding micro-batch of {len(texts)} failed ({e}), retrying items one by one")
                 else:
-                    raise Exception(f"API Error: {data.get('error', 'Unknown error')}")
-        except Exception as e:
-            print(f"❌ Error fetching embedding from API: {e}")
-            raise
+                    print(f"❌ Error fetching embedding from API: {e}")
+                    return [None]
+            results = []
+            for text in texts:
+                try:
+                    results.append(await self.embedding_provider.embed(text))
+                except Exception as e:
+                    print(f"❌ Error fetching embedding from API: {e}")
+                    results.append(None)
+            return results
 
-    async def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    async def get_embeddings_batch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
         """
-        Get embeddings for multiple texts in parallel.
+        Get embeddings for multiple texts; only texts missing from the cache are embedded,
+        in micro-batches of EMBEDDING_MICRO_BATCH_SIZE with at most EMBEDDING_BATCH_CONCURRENCY
+        upstream requests in flight per worker.
         
         Args:
             texts: List of texts to generate embeddings for
             
         Returns:
-            List of embedding vectors
+            Embedding vectors aligned with texts (None where embedding failed)
         """
-        tasks = [self.get_embedding_from_api(text) for text in texts]
-        embeddings = await asyncio.gather(*tasks)
-        # Filter out any potential None results from failed API calls
-        return [emb for emb in embeddings if emb is not None]
+        model = self.embedding_provider.model
+        embeddings = await embedding_cache.get_many(model, texts)
+        missing = list(dict.fromkeys(text for text, emb in zip(texts, embeddings) if emb is None))
+        if missing:
+            size = max(1, EMBEDDING_MICRO_BATCH_SIZE)
+            chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+            chunk_results = await asyncio.gather(*(self._embed_micro_batch(chunk) for chunk in chunks))
+            fresh = [emb for chunk_result in chunk_results for emb in chunk_result]
+            await embedding_cache.put_many(model, missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            embeddings = [emb if emb is not None else by_text[text] for text, emb in zip(texts, embeddings)]
+        return embeddings
 
     def _initialize_collection(self):
         if not utility.has_collection(self.collection_name):
@@ -87,19 +133,94 @@ class MilvusRAGDB:
             }
             self.collection.create_index(field_name="embedding", index_params=index_params)
             print("✅ Collection and HNSW index created successfully.")
+            # A fresh collection starts a fresh content version (a stale marker may survive a drop)
+            self._record_content_change([])
         else:
             print(f"✅ Found existing collection '{self.collection_name}'.")
             self.collection = Collection(name=self.collection_name)
+            self._content_version = self._load_content_version()
         
         # Load collection into memory for searching
         self.collection.load()
         print("✅ Collection loaded into memory.")
+        self._refresh_kb_version()
+
+    def _content_version_path(self) -> str:
+        return os.path.join(RAG_KB_VERSION_DIR, f"{self.collection_name}.kb_version")
+
+    def _marker_signature(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self._content_version_path())
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load_content_version(self) -> Optional[str]:
+        self._marker_stat = self._marker_signature()
+        try:
+            with open(self._content_version_path(), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _record_content_change(self, metadata_strs: List[str]):
+        """
+        Chain a hash of newly written rows and the write time into the stored content version,
+        so a rebuild that ends with the same entity count still gets a new version.
+        """
+        digest = hashlib.sha256((self._content_version or "").encode("utf-8"))
+        digest.update(repr(time.time()).encode("utf-8"))
+        for metadata_str in metadata_strs:
+            digest.update(metadata_str.encode("utf-8"))
+        self._content_version = digest.hexdigest()[:16]
+        try:
+            with open(self._content_version_path(), "w", encoding="utf-8") as f:
+                f.write(self._content_version)
+            self._marker_stat = self._marker_signature()
+        except OSError as e:
+            print(f"⚠️ Could not store KB content version: {e}")
+
+    def _refresh_kb_version(self):
+        """
+        Recompute the knowledge-base version used by caches keyed on KB content: the entity
+        count plus the content version recorded on every write (RAG_KB_VERSION_DIR).
+        Set RAG_KB_VERSION to pin the version explicitly (e.g. across workers).
+        """
+        pinned = os.getenv("RAG_KB_VERSION")
+        if pinned:
+            self._kb_version = pinned
+            return
+        content_version = self._content_version or "unversioned"
+        try:
+            self._kb_version = f"{self.collection_name}:{self.collection.num_entities}:{content_version}"
+        except Exception as e:
+            print(f"⚠️ Could not read entity count for KB version: {e}")
+            self._kb_version = f"{self.collection_name}:unknown:{content_version}"
+
+    @property
+    def kb_version(self) -> Optional[str]:
+        """
+        Current knowledge-base version. The marker file is stat()ed at most once per
+        RAG_KB_VERSION_RELOAD_INTERVAL, so a rebuild by another process (python rag_db.py)
+        changes the version seen by running workers, and with it every cache key built on it.
+        """
+        now = time.monotonic()
+        if not os.getenv("RAG_KB_VERSION") and now - self._marker_checked >= RAG_KB_VERSION_RELOAD_INTERVAL:
+            self._marker_checked = now
+            if self._marker_signature() != self._marker_stat:
+                previous = self._kb_version
+                self._content_version = self._load_content_version()
+                self._refresh_kb_version()
+                if self._kb_version != previous:
+                    print(f"🔄 KB version changed ({previous} -> {self._kb_version})")
+        return self._kb_version
 
 
     async def build(self, folder_path: str, batch_size: int = 32):
         """
         Builds the database by reading all .txt files from a folder,
-        generating embeddings, and inserting them into the collection.
+        splitting them into sentence-aligned chunks (CHUNK_SIZE_CHARS / CHUNK_OVERLAP_CHARS),
+        generating embeddings, and inserting one row per chunk into the collection.
         
         Args:
             folder_path: The path to the folder containing .txt files.
@@ -127,11 +248,10 @@ class MilvusRAGDB:
                     with open(path, 'r', encoding='utf-8') as f:
                         content = f.read()
                         if content.strip(): 
-                            batch_texts.append(content)
-                            batch_metadatas.append({
-                                "source": os.path.basename(path),
-                                "text": content
-                            })
+                            chunks = chunk_text(content, CHUNK_SIZE_CHARS, CHUNK_OVERLAP_CHARS)
+                            for chunk in chunks:
+                                batch_texts.append(chunk.text)
+                                batch_metadatas.append(chunk_metadata(os.path.basename(path), chunk, len(chunks)))
                 except Exception as e:
                     print(f"⚠️ Could not read or process file {path}: {e}")
             
@@ -152,6 +272,7 @@ class MilvusRAGDB:
         try:
             self.collection.flush()
             print("✅ All data flushed to disk successfully.")
+            self._refresh_kb_version()
         except Exception as e:
             print(f"❌ Error during final flush: {e}")
             raise
@@ -178,20 +299,24 @@ class MilvusRAGDB:
             print(f"❌ Timeout fetching embeddings. Skipping this batch.")
             return
         
-        if not embeddings:
+        # Keep each vector with its own metadata; documents that failed to embed are skipped
+        embedded = [(emb, metadata) for emb, metadata in zip(embeddings, metadatas) if emb is not None]
+        if not embedded:
             print("❌ No embeddings were generated. Skipping insertion.")
             return
 
-        print(f"✅ Received {len(embeddings)} embeddings")
+        print(f"✅ Received {len(embedded)} embeddings")
+        if len(embedded) < len(texts):
+            print(f"⚠️ Skipping {len(texts) - len(embedded)} documents that could not be embedded")
         
-        await self.insert(embeddings, metadatas, flush=flush)
+        await self.insert([emb for emb, _ in embedded], [metadata for _, metadata in embedded], flush=flush)
 
-    async def insert(self, embeddings: List[List[float]], metadatas: List[dict], flush: bool = True):
+    async def insert(self, embeddings: List[np.ndarray], metadatas: List[dict], flush: bool = True):
         """
         Insert embeddings and metadata into the collection.
         
         Args:
-            embeddings: List of embedding vectors (List[float])
+            embeddings: List of embedding vectors (float32 arrays or float lists)
             metadatas: List of metadata dictionaries
             flush: Whether to flush to disk immediately (default: True)
         """
@@ -210,30 +335,33 @@ class MilvusRAGDB:
             loop = asyncio.get_event_loop()
             await loop.run_in_executor(None, self.collection.insert, entities)
             print(f"✅ Insert completed for {len(embeddings)} documents")
+            self._record_content_change(metadata_strs)
             
             if flush:
                 print(f"💾 Flushing data to disk...")
                 await loop.run_in_executor(None, self.collection.flush)
                 print(f"✅ Inserted and flushed {len(embeddings)} documents into Milvus.")
+                self._refresh_kb_version()
         except Exception as e:
             print(f"❌ Error during insert/flush: {e}")
             raise
 
-    async def search(self, query_text: str, top_k: int = 5) -> List[dict]:
+    async def search(self, query_text: str, top_k: int = 5, per_document: bool = False) -> List[dict]:
         """
-        Search for similar documents using a query text.
+        Search for similar chunks using a query text.
         
         Args:
             query_text: The query text to search for
             top_k: Number of top results to return
+            per_document: Fold chunk hits into one result per source document
             
         Returns:
-            List of results with id, distance, and metadata
+            List of results with id, distance, and metadata (source, text, chunk position)
         """
         print(f"🔍 Generating embedding for query: '{query_text[:50]}...'")
         query_embedding = await self.get_embedding_from_api(query_text)
         
-        if not query_embedding:
+        if query_embedding is None or len(query_embedding) == 0:
             print("❌ Failed to generate query embedding. Cannot perform search.")
             return []
             
@@ -248,7 +376,7 @@ class MilvusRAGDB:
                     [query_embedding],
                     "embedding", 
                     search_params, 
-                    limit=top_k, 
+                    limit=top_k * CHUNK_SEARCH_OVERFETCH if per_document else top_k, 
                     output_fields=["metadata"]
                 )),
                 timeout=30  
@@ -269,17 +397,21 @@ class MilvusRAGDB:
                     "distance": hit.distance, 
                     "metadata": metadata
                 })
+        if per_document:
+            hit_list = aggregate_by_document(hit_list, top_k)
         
         print(f"✅ Found {len(hit_list)} similar documents.")
         return hit_list
     
-    async def search_with_embeddings(self, query_embeddings: List[List[float]], top_k: int = 5) -> List[List[dict]]:
+    async def search_with_embeddings(self, query_embeddings: List[np.ndarray], top_k: int = 5,
+                                     per_document: bool = False) -> List[List[dict]]:
         """
         Search using pre-computed embeddings.
         
         Args:
             query_embeddings: List of embedding vectors
             top_k: Number of top results to return
+            per_document: Fold chunk hits into one result per source document
             
         Returns:
             List of results for each query
@@ -293,7 +425,7 @@ class MilvusRAGDB:
                     query_embeddings, 
                     "embedding", 
                     search_params, 
-                    limit=top_k, 
+                    limit=top_k * CHUNK_SEARCH_OVERFETCH if per_document else top_k, 
                     output_fields=["metadata"]
                 )),
                 timeout=30  
@@ -311,7 +443,7 @@ class MilvusRAGDB:
             for hit in hits:
                 metadata = json.loads(hit.entity.get("metadata"))
                 hit_list.append({"id": hit.id, "distance": hit.distance, "metadata": metadata})
-            all_results.append(hit_list)
+            all_results.append(aggregate_by_document(hit_list, top_k) if per_document else hit_list)
         return all_results
     
     def delete_collection(self):
@@ -0,0 +1,237 @@
+"""
+Deadlines, retries and circuit breakers for upstream AI dependencies.
+
+Each upstream (HCX-005 LLM, Clova OCR, Clova Speech, embeddings) gets a policy:
+a per-attempt deadline, a bounded number of retries with full-jitter
+exponential backoff (only for idempotent calls and transient errors), and a
+circuit breaker. After UPSTREAM_<NAME>_BREAKER_THRESHOLD consecutive transient
+failures the breaker opens and calls fail immediately with
+UpstreamUnavailableError for UPSTREAM_<NAME>_BREAKER_COOLDOWN seconds; then a
+single probe is let through (half-open) to decide whether to close again.
+
+Breaker state is exposed through GET /api/health/upstreams.
+"""
+import asyncio
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, TypeVar
+
+import httpx
+import openai
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when an upstream is short-circuited by its breaker or keeps timing out."""
+
+    def __init__(self, upstream: str, retry_after: int, reason: str):
+        self.upstream = upstream
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(f"Upstream '{upstream}' unavailable: {reason}")
+
+
+@dataclass
+class UpstreamPolicy:
+    name: str
+    timeout: float            # Seconds per attempt
+    max_retries: int          # Extra attempts for idempotent calls
+    backoff_base: float       # Seconds; attempt n waits up to base * 2**n
+    backoff_max: float
+    failure_threshold: int    # Consecutive transient failures that open the breaker
+    cooldown: float           # Seconds the breaker stays open before a probe
+
+    @classmethod
+    def from_env(cls, name: str, timeout: float, max_retries: int) -> "UpstreamPolicy":
+        prefix = f"UPSTREAM_{name.upper()}_"
+        return cls(
+            name=name,
+            timeout=float(os.getenv(prefix + "TIMEOUT", str(timeout))),
+            max_retries=int(os.getenv(prefix + "RETRIES", str(max_retries))),
+            backoff_base=float(os.getenv(prefix + "BACKOFF_BASE", "0.2")),
+            backoff_max=float(os.getenv(prefix + "BACKOFF_MAX", "2.0")),
+            failure_threshold=int(os.getenv(prefix + "BREAKER_THRESHOLD", "5")),
+            cooldown=float(os.getenv(prefix + "BREAKER_COOLDOWN", "30")),
+        )
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Errors worth retrying and counting against the breaker (timeouts, connection errors, 5xx, 429)."""
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    if isinstance(exc, openai.APIConnectionError):  # Includes APITimeoutError
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code >= 500 or exc.status_code == 429
+    return False
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def retry_after(self) -> int:
+        return max(1, int(self.opened_at + self.cooldown - time.monotonic()) + 1)
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream right now."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self):
+        """Give back a half-open probe whose call never finished (e.g. cancelled)."""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class Upstream:
+    def __init__(self, policy: UpstreamPolicy):
+        self.policy = policy
+        self.breaker = CircuitBreaker(policy.failure_threshold, policy.cooldown)
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.short_circuited = 0
+
+    @property
+    def name(self) -> str:
+        return self.policy.name
+
+    def fail_fast(self):
+        """Raise if the breaker is open and still cooling down (does not consume a half-open probe)."""
+        breaker = self.breaker
+        if breaker.state == OPEN and time.monotonic() - breaker.opened_at < breaker.cooldown:
+            self.short_circuited += 1
+            raise UpstreamUnavailableError(self.name, breaker.retry_after(), "circuit open")
+
+    def check(self):
+        """Fail fast if the breaker does not allow a call now."""
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise UpstreamUnavailableError(self.name, self.breaker.retry_after(), "circuit open")
+
+    def record_success(self):
+        self.breaker.record_success()
+
+    def record_failure(self, exc: BaseException):
+        """Count a transient failure observed outside call() (e.g. mid-stream)."""
+        if is_transient(exc):
+            self.failures += 1
+            self.breaker.record_failure()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.policy.backoff_max, self.policy.backoff_base * (2 ** attempt)))
+
+    async def call(self, fn: Callable[[], Awaitable[T]], idempotent: bool = True) -> T:
+        """
+        Run an upstream call under this upstream's deadline, retry and breaker policy.
+
+        Args:
+            fn: Zero-argument callable returning a fresh awaitable per attempt
+            idempotent: Only idempotent calls are retried
+
+        Returns:
+            The call's result
+
+        Raises:
+            UpstreamUnavailableError if the breaker is open or every attempt timed out;
+            otherwise the last error from the call
+        """
+        attempts = 1 + (self.policy.max_retries if idempotent else 0)
+        for attempt in range(attempts):
+            self.check()
+            self.calls += 1
+            try:
+                result = await asyncio.wait_for(fn(), timeout=self.policy.timeout)
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # The upstream answered; a 4xx or bad payload is not an availability problem
+                    self.breaker.record_success()
+                    raise
+                self.failures += 1
+                timed_out = isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException, openai.APITimeoutError))
+                if timed_out:
+                    self.timeouts += 1
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts or self.breaker.state == OPEN:
+                    print(f"❌ Upstream '{self.name}' failed after {attempt + 1} attempt(s): {type(e).__name__}")
+                    if timed_out:
+                        raise UpstreamUnavailableError(
+                            self.name, self.breaker.retry_after() if self.breaker.state == OPEN else 1,
+                            f"timed out after {self.policy.timeout}s",
+                        ) from e
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+            else:
+                self.breaker.record_success()
+                return result
+
+    def stats(self) -> dict:
+        breaker = self.breaker
+        return {
+            "state": breaker.state,
+            "consecutive_failures": breaker.consecutive_failures,
+            "times_opened": breaker.times_opened,
+            "retry_after_s": breaker.retry_after() if breaker.state == OPEN else 0,
+            "timeout_s": self.policy.timeout,
+            "max_retries": self.policy.max_retries,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "short_circuited": self.short_circuited,
+        }
+
+
+upstreams: Dict[str, Upstream] = {
+    "llm": Upstream(UpstreamPolicy.from_env("llm", timeout=30.0, max_retries=1)),
+    "ocr": Upstream(UpstreamPolicy.from_env("ocr", timeout=15.0, max_retries=2)),
+    "speech": Upstream(UpstreamPolicy.from_env("speech", timeout=30.0, max_retries=1)),
+    "embedding": Upstream(UpstreamPolicy.from_env("embedding", timeout=10.0, max_retries=2)),
+}
+
+
+def upstream_health() -> dict:
+    states = {name: upstream.stats() for name, upstream in upstreams.items()}
+    degraded = [name for name, s in states.items() if s["state"] != CLOSED]
+    return {"status": "degraded" if degraded else "ok", "degraded": degraded, "upstreams": states}
@@ -0,0 +1,289 @@
+"""
+Zero-LLM pre-screening tier for scam checks.
+
+Before paying for retrieval and a completion, every scam-check input is scored
+in-process against:
+
+- URL/domain lists: a blocklist (SCAM_PRESCREEN_BLOCKLIST_FILE), domains mined
+  from the knowledge base .txt files (SCAM_PRESCREEN_KB_DIR), an allowlist of
+  known bank/government domains, plus risky URL shapes (shorteners, raw IPs,
+  punycode, throwaway TLDs)
+- compiled multilingual (vi/ko/en) lexicons of scam signals: credential
+  requests, "send me" asks, urgency, prizes, impersonation, account threats
+
+Scores at or above the threshold short-circuit with a "This is a scam"
+verdict in the scamcheck.txt format. The pre-screen never clears a message:
+missing a keyword is not evidence of safety (a "new number, help me out" or
+"install AnyDesk" scam has none), so everything below the threshold goes on
+to RAG + the LLM. Counters show how much traffic the zero-LLM tier absorbs.
+"""
+import os
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from intent_classifier import fold_text
+
+SCAM_PRESCREEN_ENABLED = os.getenv("SCAM_PRESCREEN_ENABLED", "true").lower() == "true"
+SCAM_PRESCREEN_SCAM_THRESHOLD = float(os.getenv("SCAM_PRESCREEN_SCAM_THRESHOLD", "6.0"))
+SCAM_PRESCREEN_BLOCKLIST_FILE = os.getenv("SCAM_PRESCREEN_BLOCKLIST_FILE", "")
+SCAM_PRESCREEN_ALLOWLIST_FILE = os.getenv("SCAM_PRESCREEN_ALLOWLIST_FILE", "")
+SCAM_PRESCREEN_KB_DIR = os.getenv("SCAM_PRESCREEN_KB_DIR", "")
+
+SCAM = "scam"
+UNCERTAIN = "uncertain"
+
+# Domains that are never evidence on their own (subdomains included)
+DEFAULT_ALLOWLIST = {
+    "vietcombank.com.vn", "techcombank.com.vn", "bidv.com.vn", "vietinbank.vn", "agribank.com.vn",
+    "mbbank.com.vn", "tpb.vn", "vpbank.com.vn", "acb.com.vn", "sacombank.com.vn", "sbv.gov.vn", "gov.vn",
+    "naver.com", "kakaobank.com", "kbstar.com", "shinhan.com", "wooribank.com", "go.kr",
+    "google.com", "apple.com", "microsoft.com",
+}
+URL_SHORTENERS = {"bit.ly", "tinyurl.com", "t.co", "goo.gl", "is.gd", "cutt.ly", "rebrand.ly", "shorturl.at", "ow.ly", "s.id"}
+RISKY_TLDS = {"xyz", "top", "click", "link", "info", "icu", "buzz", "shop", "online", "site", "live", "vip", "cc", "tk", "ml", "ga", "cf", "gq"}
+
+# (pattern, signal, weight). Patterns run against folded text: lowercase, no Vietnamese diacritics.
+SIGNALS: List[Tuple[str, str, float]] = [
+    # Credential requests
+    (r"\b(otp|one[- ]time (password|code)|verification code|pin code|cvv|password|passcode)\b", "credentials", 2.5),
+    (r"\b(ma otp|ma xac (nhan|thuc)|mat khau|ma pin|so cvv)\b", "credentials", 2.5),
+    (r"(인증번호|비밀번호|보안카드|otp번호)", "credentials", 2.5),
+    # Asking the reader to send something
+    (r"\b(send|give|share|forward|tell) (me|us|it|the code|your)\b|\breply with\b", "send_request", 2.0),
+    (r"\b(gui|chuyen|cung cap|doc|nhan) (cho )?(toi|em|anh|chi|minh|chung toi|ma|lai ma)\b", "send_request", 2.0),
+    (r"(보내주세요|알려주세요|입력하세요|입금하세요|보내 주세요)", "send_request", 2.0),
+    # Urgency and threats
+    (r"\b(urgent|urgently|immediately|right now|within (24|48) hours|last chance|act now|expires? today)\b", "urgency", 1.5),
+    (r"\b(gap|khan cap|ngay lap tuc|trong (24|48) gio|het han|cuoi cung)\b", "urgency", 1.5),
+    (r"(긴급|즉시|오늘까지|마감|지금 바로)", "urgency", 1.5),
+    (r"\b(account (will be )?(locked|suspended|blocked|closed)|legal action|arrest warrant)\b", "account_threat", 2.0),
+    (r"\b(khoa tai khoan|tam khoa|dong bang tai khoan|bi phong toa|lenh bat|khoi to)\b", "account_threat", 2.0),
+    (r"(계좌 정지|계좌가 정지|동결|체포|고소)", "account_threat", 2.0),
+    # Prizes and too-good-to-be-true offers
+    (r"\b(you (have )?won|winner|prize|lottery|free gift|claim your|guaranteed (profit|return)|double your money)\b", "prize", 2.0),
+    (r"\b(trung thuong|giai thuong|qua tang mien phi|nhan thuong|loi nhuan cao|viec nhe luong cao)\b", "prize", 2.0),
+    (r"(당첨|경품|무료 선물|고수익|원금 보장)", "prize", 2.0),
+    # Impersonation of authorities, banks and couriers
+    (r"\b(police|tax office|customs|bank security|fraud department|courier|delivery failed|irs)\b", "impersonation", 1.0),
+    (r"\b(cong an|vien kiem sat|toa an|co quan thue|hai quan|nhan vien ngan hang|buu dien|giao hang)\b", "impersonation", 1.0),
+    (r"(검찰|경찰|금융감독원|국세청|택배|은행 직원)", "impersonation", 1.0),
+    # Money
+    (r"\d[\d.,]*\s*(k|nghin|ngan|tr|trieu|cu|vnd|dong|won|usd|\$)(?![a-z])|\d[\d,]*\s*(원|만원)|\$\s*\d", "money", 0.5),
+    (r"\b(transfer|deposit|wire|gift card|crypto|bitcoin|usdt|chuyen khoan|nap tien|dat coc|송금|입금|이체)\b", "money", 0.5),
+]
+# Signal pairs that are much stronger together than apart
+COMBOS: List[Tuple[str, str, float]] = [
+    ("credentials", "send_request", 3.0),   # "send me the OTP"
+    ("impersonation", "money", 1.5),        # "police: transfer the bail"
+    ("prize", "money", 1.5),                # "you won, pay the fee"
+    ("account_threat", "link", 1.5),        # "account locked, log in here"
+]
+LINK_WEIGHT = 1.0
+RISKY_LINK_WEIGHT = 2.0
+KB_DOMAIN_WEIGHT = 3.0
+BLOCKLIST_WEIGHT = 10.0
+
+_URL_RE = re.compile(
+    r"(?:https?://)?(?:www\.)?((?:[a-z0-9-]+\.)+[a-z]{2,}|\d{1,3}(?:\.\d{1,3}){3})(?::\d+)?(?:/[^\s]*)?",
+    re.IGNORECASE,
+)
+_HAS_SCHEME_OR_WWW_RE = re.compile(r"(https?://|www\.)", re.IGNORECASE)
+_IP_RE = re.compile(r"^\d{1,3}(\.\d{1,3}){3}$")
+# Bare "word.tld" only counts as a link for common web TLDs (avoid "e.g." / "3.5")
+_BARE_DOMAIN_TLDS = {"com", "net", "org", "vn", "kr", "io", "ly", "me", "co", "app"} | RISKY_TLDS
+_COMPILED_SIGNALS = [(re.compile(pattern), signal, weight) for pattern, signal, weight in SIGNALS]
+
+# Bank OTP notices say "do not share it with anyone": a warning just before (vi/en) or just after (ko)
+# an ask in the same clause means the ask is not counted
+NEGATED_SIGNALS = {"send_request"}
+_NEGATION_BEFORE_RE = re.compile(
+    r"\b(do not|don'?t|never|must not|should not|khong|dung|tuyet doi khong|khong bao gio|khong duoc)"
+    r"( [^\s.,;:!?]+){0,2} ?$"
+)
+_NEGATION_AFTER_RE = re.compile(r"^[^.,;:!?\n]{0,3}(지 ?마|마세요|말 것|말아)")
+_CLAUSE_BREAK_RE = re.compile(r"[.,;:!?\n]")
+
+_GUIDANCE = "Do not send money, codes or personal information, and contact your bank through its official hotline."
+_DISCLAIMER = "This was an automatic pre-check and may be mistaken, so verify through trusted sources if unsure."
+_SIGNAL_DESCRIPTIONS = {
+    "blocklisted_domain": "it links to a domain on the known-scam blocklist",
+    "kb_domain": "it links to a domain mentioned in known scam reports",
+    "risky_link": "it contains a shortened, raw-IP or throwaway-domain link",
+    "link": "it contains a link",
+    "credentials": "it asks for OTPs, passwords or other credentials",
+    "send_request": "it asks you to send or share something",
+    "urgency": "it pressures you to act quickly",
+    "account_threat": "it threatens your account or legal action",
+    "prize": "it promises prizes or unrealistic returns",
+    "impersonation": "it claims to come from an authority, bank or courier",
+    "money": "it involves money or payments",
+}
+
+
+class PrescreenResult(NamedTuple):
+    tier: str                 # SCAM or UNCERTAIN
+    score: float
+    signals: List[str]
+    domains: List[str]
+
+    @property
+    def confident(self) -> bool:
+        return self.tier != UNCERTAIN
+
+    @property
+    def confidence(self) -> float:
+        """Heuristic confidence for the verdict event: grows with the score, highest for blocklisted domains."""
+        if self.tier != SCAM:
+            return 0.5
+        return 0.99 if "blocklisted_domain" in self.signals else round(min(0.95, 0.6 + self.score / 30), 2)
+
+    def verdict_text(self) -> str:
+        """Verdict in the scamcheck.txt response format (verdict, guidance, disclaimer, explanation)."""
+        reasons = [_SIGNAL_DESCRIPTIONS[s] for s in self.signals if s in _SIGNAL_DESCRIPTIONS]
+        explanation = "This message matches known scam patterns: " + "; ".join(reasons) + "."
+        return f"This is a scam.\n{_GUIDANCE}\n{_DISCLAIMER}\nExplanation: {explanation}"
+
+
+def _read_domain_file(path: str) -> Set[str]:
+    if not path:
+        return set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {line.strip().lower().removeprefix("www.") for line in f if line.strip() and not line.startswith("#")}
+    except OSError as e:
+        print(f"⚠️ Could not read domain list {path}: {e}")
+        return set()
+
+
+def _domains_in(text: str) -> List[str]:
+    domains = []
+    for match in _URL_RE.finditer(text):
+        domain = match.group(1).lower()
+        tld = domain.rsplit(".", 1)[-1]
+        if _IP_RE.match(domain) or _HAS_SCHEME_OR_WWW_RE.match(match.group(0)) or tld in _BARE_DOMAIN_TLDS:
+            domains.append(domain)
+    return domains
+
+
+def _has_affirmative_match(pattern: re.Pattern, folded: str) -> bool:
+    """Whether any match of pattern is not negated by a warning in the same clause."""
+    for match in pattern.finditer(folded):
+        before = folded[:match.start()]
+        clause_start = max((m.end() for m in _CLAUSE_BREAK_RE.finditer(before)), default=0)
+        if _NEGATION_BEFORE_RE.search(before[clause_start:]) or _NEGATION_AFTER_RE.search(folded[match.end():]):
+            continue
+        return True
+    return False
+
+
+def _matches(domain: str, domain_set: Set[str]) -> bool:
+    """Whether a domain or any of its parent domains is in the set."""
+    parts = domain.split(".")
+    return any(".".join(parts[i:]) in domain_set for i in range(len(parts) - 1))
+
+
+class ScamPrescreener:
+    def __init__(self, enabled: bool = SCAM_PRESCREEN_ENABLED, scam_threshold: float = SCAM_PRESCREEN_SCAM_THRESHOLD,
+                 blocklist_file: str = SCAM_PRESCREEN_BLOCKLIST_FILE, allowlist_file: str = SCAM_PRESCREEN_ALLOWLIST_FILE,
+                 kb_dir: str = SCAM_PRESCREEN_KB_DIR):
+        self.enabled = enabled
+        self.scam_threshold = scam_threshold
+        self.blocklist = _read_domain_file(blocklist_file)
+        self.allowlist = DEFAULT_ALLOWLIST | _read_domain_file(allowlist_file)
+        self.kb_domains = self._mine_kb_domains(kb_dir)
+        self._stats: Dict[str, float] = {"requests": 0, SCAM: 0, UNCERTAIN: 0, "total_latency_us": 0.0}
+        print(
+            f"✅ Scam pre-screen ready ({len(self.blocklist)} blocklisted, {len(self.kb_domains)} KB domains, "
+            f"threshold={scam_threshold}, enabled={enabled})"
+        )
+
+    def _mine_kb_domains(self, kb_dir: str) -> Set[str]:
+        """Domains mentioned in the knowledge base documents (scam reports), minus allowlisted ones."""
+        if not kb_dir or not os.path.isdir(kb_dir):
+            return set()
+        domains = set()
+        for name in os.listdir(kb_dir):
+            if not name.endswith(".txt"):
+                continue
+            try:
+                with open(os.path.join(kb_dir, name), "r", encoding="utf-8") as f:
+                    domains.update(_domains_in(f.read()))
+            except OSError as e:
+                print(f"⚠️ Could not read KB file {name}: {e}")
+        return {d for d in domains if not _matches(d, self.allowlist)}
+
+    def score(self, text: str) -> PrescreenResult:
+        """
+        Score a message without any upstream call.
+
+        Returns:
+            PrescreenResult; tier is SCAM at or above the threshold, otherwise UNCERTAIN (the LLM decides)
+        """
+        folded = fold_text(text)
+        weights: Dict[str, float] = {}
+
+        domains = [d.removeprefix("www.") for d in _domains_in(text)]
+        for domain in domains:
+            if _matches(domain, self.allowlist):
+                continue
+            if _matches(domain, self.blocklist):
+                weights["blocklisted_domain"] = BLOCKLIST_WEIGHT
+            elif _matches(domain, self.kb_domains):
+                weights["kb_domain"] = KB_DOMAIN_WEIGHT
+            tld = domain.rsplit(".", 1)[-1]
+            if domain in URL_SHORTENERS or _IP_RE.match(domain) or "xn--" in domain or tld in RISKY_TLDS:
+                weights["risky_link"] = RISKY_LINK_WEIGHT
+        if domains:
+            weights["link"] = LINK_WEIGHT
+
+        for pattern, signal, weight in _COMPILED_SIGNALS:
+            if signal in weights:
+                continue
+            if _has_affirmative_match(pattern, folded) if signal in NEGATED_SIGNALS else pattern.search(folded):
+                weights[signal] = weight
+        for first, second, bonus in COMBOS:
+            if first in weights and second in weights:
+                weights[f"{first}+{second}"] = bonus
+
+        score = sum(weights.values())
+        signals = [s for s in weights if "+" not in s]
+        tier = SCAM if score >= self.scam_threshold else UNCERTAIN
+        return PrescreenResult(tier=tier, score=round(score, 2), signals=signals, domains=domains)
+
+    def screen(self, text: str) -> Optional[PrescreenResult]:
+        """
+        Pre-screen a scam-check input.
+
+        Returns:
+            A SCAM PrescreenResult to answer with, or None to continue with RAG + LLM
+        """
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        result = self.score(text)
+        self._stats["requests"] += 1
+        self._stats[result.tier] += 1
+        self._stats["total_latency_us"] += (time.perf_counter() - started) * 1e6
+        if result.confident:
+            print(f"🛡️ Scam pre-screen: {result.tier} (score {result.score}, signals {result.signals})")
+            return result
+        return None
+
+    def stats(self) -> dict:
+        requests = self._stats["requests"]
+        absorbed = self._stats[SCAM]
+        return {
+            "enabled": self.enabled,
+            "scam_threshold": self.scam_threshold,
+            "blocklist_domains": len(self.blocklist),
+            "kb_domains": len(self.kb_domains),
+            "requests": requests,
+            "scam": self._stats[SCAM],
+            "sent_to_llm": self._stats[UNCERTAIN],
+            "absorbed_rate": round(absorbed / requests, 4) if requests else 0.0,
+            "avg_latency_us": round(self._stats["total_latency_us"] / requests, 1) if requests else 0.0,
+        }
+
+
+scam_prescreener = ScamPrescreener()
@@ -0,0 +1,185 @@
+"""
+Embedding-similarity answer cache for single-turn knowledge-base chat.
+
+/api/chat-with-rag keeps answering the same few hundred questions ("how do I
+know if a call from the bank is fake", "what is OTP fraud"). The endpoint
+already embeds the question for retrieval; that embedding is looked up here
+first, and a cached question whose cosine similarity reaches
+RAG_ANSWER_CACHE_THRESHOLD has its answer replayed instead of running
+retrieval and a streaming completion.
+
+Entries belong to a namespace (system prompt hash + knowledge-base version):
+when the namespace changes, every entry is dropped. Entries expire after a
+TTL and the least-recently-used ones are evicted to stay within both an entry
+count and a byte budget.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+# Rough per-entry bookkeeping overhead (tuple, OrderedDict node, matrix row index)
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    similarity: float
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 16 * 1024 * 1024,
+                 ttl_seconds: float = 86400, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (expires_at, question, vector, answer, size)
+        self._next_id = 0
+        self._bytes = 0
+        self._namespace: Optional[str] = None
+        # Stacked unit vectors of all entries, rebuilt lazily after puts/evictions
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "SemanticAnswerCache":
+        return cls(
+            max_entries=int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "2000")),
+            max_bytes=int(os.getenv("RAG_ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("RAG_ANSWER_CACHE_TTL", "86400")),
+            threshold=float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def _unit(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    def _check_namespace(self, namespace: str):
+        """Drop every entry when the prompt or knowledge base changed (lock held)."""
+        if namespace == self._namespace:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+        self._matrix, self._matrix_ids = None, []
+        self._namespace = namespace
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            self._bytes -= entry[4]
+            self._matrix = None
+
+    def lookup(self, embedding, namespace: str) -> Optional[CachedAnswer]:
+        """
+        Find the most similar cached question.
+
+        Args:
+            embedding: The question's embedding (as used for retrieval)
+            namespace: Current prompt + knowledge-base version
+
+        Returns:
+            The cached answer when the best similarity reaches the threshold, else None
+        """
+        if not self.enabled:
+            return None
+        query = self._unit(embedding)
+        with self._lock:
+            self._check_namespace(namespace)
+            if query is None or not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[i][2] for i in self._matrix_ids])
+            if self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            entry_id = self._matrix_ids[best]
+            expires_at, question, _, answer, _ = self._entries[entry_id]
+            if expires_at < time.monotonic():
+                self._remove(entry_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return CachedAnswer(question=question, answer=answer, similarity=round(similarity, 4))
+
+    def put(self, question: str, embedding, answer: str, namespace: str):
+        """Store an answer, evicting least-recently-used entries if needed."""
+        if not self.enabled or not answer:
+            return
+        vector = self._unit(embedding)
+        if vector is None:
+            return
+        size = vector.nbytes + len(question.encode("utf-8")) + len(answer.encode("utf-8")) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_namespace(namespace)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (time.monotonic() + self.ttl_seconds, question, vector, answer, size)
+            self._bytes += size
+            self._matrix = None
+            self.stores += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._matrix, self._matrix_ids = None, []
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+answer_cache = SemanticAnswerCache.from_env()
@@ -0,0 +1,134 @@
+"""
+Speculative execution of chat routing branches.
+
+While the intent is still being decided, chat_endpoint can start the work the
+likely branches will need (query embedding + Milvus retrieval, and optionally
+transfer extraction). Once the intent is known the matching branch is kept and
+every other branch is cancelled. Per-branch in-flight budgets cap how much
+speculative work can run at once, and waste is tracked so the trade-off can be
+tuned from /api/admin/metrics.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+# off | retrieval | full  (full also speculates transfer extraction)
+CHAT_SPECULATION_MODE = os.getenv("CHAT_SPECULATION_MODE", "retrieval").lower()
+SPECULATIVE_RETRIEVAL_BUDGET = int(os.getenv("SPECULATIVE_RETRIEVAL_BUDGET", "32"))
+SPECULATIVE_EXTRACTION_BUDGET = int(os.getenv("SPECULATIVE_EXTRACTION_BUDGET", "8"))
+
+BRANCH_MODES = {
+    "retrieval": ("retrieval", "full"),
+    "transfer_extraction": ("full",),
+}
+
+
+class SpeculativeBranches:
+    """The set of speculative tasks started for a single request."""
+
+    def __init__(self, speculator: "Speculator"):
+        self._speculator = speculator
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started_at: Dict[str, float] = {}
+
+    def _add(self, name: str, task: asyncio.Task):
+        self._tasks[name] = task
+        self._started_at[name] = time.monotonic()
+
+    def take(self, name: Optional[str]) -> Optional[asyncio.Task]:
+        """
+        Keep one branch and cancel all others.
+
+        Args:
+            name: Branch to keep, or None to discard everything
+
+        Returns:
+            The kept task (possibly already finished), or None if it was not started
+        """
+        kept = self._tasks.pop(name, None) if name else None
+        if kept is not None:
+            self._speculator._record(name, "used")
+        self.discard()
+        return kept
+
+    def discard(self):
+        """Cancel every remaining branch and account for the wasted work."""
+        now = time.monotonic()
+        for name, task in self._tasks.items():
+            self._speculator._record(name, "wasted", now - self._started_at[name], finished=task.done())
+            if not task.done():
+                task.cancel()
+            else:
+                # Retrieve the outcome so failed branches don't log "exception never retrieved"
+                task.cancelled() or task.exception()
+        self._tasks.clear()
+
+
+class Speculator:
+    def __init__(self, mode: str = CHAT_SPECULATION_MODE, budgets: Optional[Dict[str, int]] = None):
+        self.mode = mode
+        self.budgets = budgets or {
+            "retrieval": SPECULATIVE_RETRIEVAL_BUDGET,
+            "transfer_extraction": SPECULATIVE_EXTRACTION_BUDGET,
+        }
+        self._inflight: Dict[str, int] = {name: 0 for name in self.budgets}
+        self._stats: Dict[str, dict] = {
+            name: {
+                "launched": 0, "used": 0, "wasted": 0, "wasted_after_finishing": 0,
+                "skipped_budget": 0, "wasted_seconds": 0.0,
+            }
+            for name in self.budgets
+        }
+
+    def enabled_for(self, name: str) -> bool:
+        return self.mode in BRANCH_MODES.get(name, ())
+
+    def start(self, factories: Dict[str, Callable[[], Awaitable]]) -> SpeculativeBranches:
+        """
+        Start the enabled branches that fit within their in-flight budgets.
+
+        Args:
+            factories: Branch name -> zero-argument callable returning the coroutine to run
+
+        Returns:
+            SpeculativeBranches handle; call take() once the intent is known
+        """
+        branches = SpeculativeBranches(self)
+        for name, factory in factories.items():
+            if not self.enabled_for(name):
+                continue
+            if self._inflight[name] >= self.budgets[name]:
+                self._stats[name]["skipped_budget"] += 1
+                continue
+            self._inflight[name] += 1
+            self._stats[name]["launched"] += 1
+            task = asyncio.create_task(factory())
+            task.add_done_callback(lambda _t, n=name: self._finish(n))
+            branches._add(name, task)
+        return branches
+
+    def _finish(self, name: str):
+        self._inflight[name] -= 1
+
+    def _record(self, name: str, outcome: str, elapsed: float = 0.0, finished: bool = False):
+        stats = self._stats[name]
+        stats[outcome] += 1
+        if outcome == "wasted":
+            stats["wasted_seconds"] += elapsed
+            if finished:
+                stats["wasted_after_finishing"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "budgets": self.budgets,
+            "inflight": dict(self._inflight),
+            "branches": {
+                name: {**s, "wasted_seconds": round(s["wasted_seconds"], 3)}
+                for name, s in self._stats.items()
+            },
+        }
+
+
+speculator = Speculator()
@@ -0,0 +1,226 @@
+"""
+Shared Server-Sent Events layer for the streaming AI endpoints.
+
+Upstream deltas are coalesced into `data: ...` frames: the first token is
+flushed immediately, after that deltas are buffered until the frame reaches
+SSE_COALESCE_MAX_CHARS or SSE_COALESCE_WINDOW_MS has passed since the first
+buffered delta, whichever comes first. Nothing ever sleeps; the window only
+bounds how long a delta may wait for company.
+
+The clients split the body on blank lines and keep only `data: ` lines, so a
+frame must never contain a blank line and must not end with a newline (it
+would be swallowed by the split). Trailing newlines are carried to the start
+of the next frame and runs of newlines are collapsed to one.
+
+Time-to-first-token and frames per response are recorded per stream name and
+exported through /api/admin/metrics.
+"""
+import asyncio
+import os
+import re
+import statistics
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional
+
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", "48"))
+SSE_COALESCE_WINDOW_MS = float(os.getenv("SSE_COALESCE_WINDOW_MS", "25"))
+
+_NEWLINE_RUN_RE = re.compile(r"\n{2,}")
+
+# Number of recent responses kept per stream for percentiles
+_SAMPLE_SIZE = 1000
+
+
+def sse_frame(text: str) -> str:
+    return f"data: {text}\n\n"
+
+
+class _FrameBuilder:
+    """Turns arbitrary text into frame-safe payloads, carrying trailing newlines forward."""
+
+    def __init__(self):
+        self._carry = ""
+
+    def build(self, text: str) -> Optional[str]:
+        text = _NEWLINE_RUN_RE.sub("\n", self._carry + text)
+        if text.endswith("\n"):
+            text = text.rstrip("\n")
+            self._carry = "\n"
+        else:
+            self._carry = ""
+        return text or None
+
+
+def text_frames(text: str) -> Iterator[str]:
+    """
+    Yield a complete text as frame-safe SSE frames, one line per frame
+    (used for cached verdicts and fixed notifications).
+    """
+    lines = [line for line in text.split("\n") if line.strip()]
+    for i, line in enumerate(lines):
+        prefix = "\n" if i > 0 else ""
+        yield sse_frame(f"{prefix}{line}")
+
+
+async def collect_deltas(deltas: AsyncIterator[str], sink: list) -> AsyncIterator[str]:
+    """Pass deltas through unchanged while keeping a copy of the raw text in sink."""
+    async for delta in deltas:
+        sink.append(delta)
+        yield delta
+
+
+class StreamMetrics:
+    def __init__(self, sample_size: int = _SAMPLE_SIZE):
+        self._samples: Dict[str, Dict[str, Deque[float]]] = {}
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self.sample_size = sample_size
+
+    def record(self, name: str, ttft: Optional[float], frames: int, deltas: int):
+        samples = self._samples.setdefault(name, {
+            "ttft_ms": deque(maxlen=self.sample_size),
+            "frames": deque(maxlen=self.sample_size),
+        })
+        totals = self._totals.setdefault(name, {"responses": 0, "frames": 0, "deltas": 0, "empty": 0})
+        totals["responses"] += 1
+        totals["frames"] += frames
+        totals["deltas"] += deltas
+        if ttft is None:
+            totals["empty"] += 1
+        else:
+            samples["ttft_ms"].append(ttft * 1000)
+        samples["frames"].append(frames)
+
+    @staticmethod
+    def _percentile(values, pct: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(pct * len(ordered)))], 1)
+
+    def stats(self) -> dict:
+        result = {
+            "coalesce_max_chars": SSE_COALESCE_MAX_CHARS,
+            "coalesce_window_ms": SSE_COALESCE_WINDOW_MS,
+            "streams": {},
+        }
+        for name, totals in self._totals.items():
+            samples = self._samples[name]
+            ttft = samples["ttft_ms"]
+            result["streams"][name] = {
+                **totals,
+                "ttft_ms_p50": self._percentile(ttft, 0.5),
+                "ttft_ms_p95": self._percentile(ttft, 0.95),
+                "ttft_ms_mean": round(statistics.mean(ttft), 1) if ttft else None,
+                "frames_per_response_mean": round(statistics.mean(samples["frames"]), 2) if samples["frames"] else None,
+                "deltas_per_frame": round(totals["deltas"] / totals["frames"], 2) if totals["frames"] else None,
+            }
+        return result
+
+
+stream_metrics = StreamMetrics()
+
+
+async def coalesce_sse(
+    deltas: AsyncIterator[str],
+    name: str,
+    started_at: Optional[float] = None,
+    max_chars: int = SSE_COALESCE_MAX_CHARS,
+    window_ms: float = SSE_COALESCE_WINDOW_MS,
+) -> AsyncIterator[str]:
+    """
+    Coalesce upstream text deltas into SSE frames.
+
+    Args:
+        deltas: Async iterator of text deltas (e.g. llm_client.stream_chat_completion)
+        name: Stream name used for metrics
+        started_at: time.monotonic() of the request start, for time-to-first-token
+        max_chars: Flush once the buffered text reaches this size
+        window_ms: Flush once the oldest buffered delta is this old
+
+    Yields:
+        `data: ...` frames. Exceptions from the upstream iterator propagate so
+        callers keep their own error frames.
+    """
+    started_at = started_at if started_at is not None else time.monotonic()
+    window = window_ms / 1000
+    iterator = deltas.__aiter__()
+    builder = _FrameBuilder()
+    buffer = []
+    buffered_chars = 0
+    buffer_started = 0.0
+    frames = 0
+    delta_count = 0
+    ttft = None
+    pending: Optional[asyncio.Future] = None
+
+    def flush() -> Optional[str]:
+        nonlocal buffer, buffered_chars, frames
+        payload = builder.build("".join(buffer))
+        buffer, buffered_chars = [], 0
+        if payload is None:
+            return None
+        frames += 1
+        return sse_frame(payload)
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            if buffer:
+                timeout = max(0.0, buffer_started + window - time.monotonic())
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    frame = flush()
+                    if frame:
+                        yield frame
+                    continue
+            else:
+                await asyncio.wait({pending})
+
+            try:
+                delta = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+            if not delta:
+                continue
+            delta_count += 1
+
+            if ttft is None:
+                # First token goes out immediately
+                ttft = time.monotonic() - started_at
+                buffer.append(delta)
+                frame = flush()
+                if frame:
+                    yield frame
+                continue
+
+            if not buffer:
+                buffer_started = time.monotonic()
+            buffer.append(delta)
+            buffered_chars += len(delta)
+            if buffered_chars >= max_chars:
+                frame = flush()
+                if frame:
+                    yield frame
+
+        if buffer:
+            frame = flush()
+            if frame:
+                yield frame
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration, Exception):
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except RuntimeError:
+                pass
+        stream_metrics.record(name, ttft, frames, delta_count)
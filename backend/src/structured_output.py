@@ -0,0 +1,154 @@
+"""
+Streaming structured-output extraction for JSON-producing prompts.
+
+The completion is streamed and scanned incrementally. As soon as the first
+top-level JSON object closes, the stream is closed, which cancels the upstream
+generation, so trailing chatter, closing markdown fences and explanations are
+never generated. Text before the object (e.g. "```json") is skipped. The
+object is parsed and validated against a Pydantic schema.
+
+Prompts that answer with an object followed by free text (e.g. voice NLU plus
+a spoken reply) use stream_structured_prefix, which hands over the validated
+object as soon as it closes and then keeps streaming the text after it.
+"""
+import json
+from typing import AsyncIterator, Optional, Type, TypeVar, Union
+
+from pydantic import BaseModel, ValidationError
+
+import llm_client
+
+M = TypeVar("M", bound=BaseModel)
+
+
+class StructuredOutputError(ValueError):
+    """The completion did not contain a valid object for the schema."""
+
+    def __init__(self, message: str, raw: str):
+        self.raw = raw
+        super().__init__(message)
+
+
+class JSONObjectScanner:
+    """Incrementally finds the first complete top-level JSON object in a text stream."""
+
+    def __init__(self):
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+        self.raw = ""
+        self.tail = ""  # Text after the closing brace in the chunk that completed the object
+
+    def feed(self, text: str) -> Optional[str]:
+        """
+        Consume more text.
+
+        Returns:
+            The complete object text once its closing brace has been seen, else None
+        """
+        self.raw += text
+        start = 0
+        if not self._started:
+            start = text.find("{")
+            if start < 0:
+                return None
+            self._started = True
+        for i in range(start, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start:i + 1])
+                    self.tail = text[i + 1:]
+                    return "".join(self._parts)
+        self._parts.append(text[start:])
+        return None
+
+
+def _validate(object_text: Optional[str], schema: Type[M], raw: str) -> M:
+    if object_text is None:
+        raise StructuredOutputError("No JSON object in model output", raw)
+    try:
+        data = json.loads(object_text)
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"Invalid JSON in model output: {e}", raw) from e
+    try:
+        return schema.model_validate(data)
+    except ValidationError as e:
+        raise StructuredOutputError(f"Model output does not match {schema.__name__}: {e}", raw) from e
+
+
+async def stream_structured_prefix(task: str, schema: Type[M], **kwargs) -> AsyncIterator[Union[M, str]]:
+    """
+    Stream a completion that starts with a JSON object and may continue with free text.
+
+    The first item yielded is the validated schema instance, as soon as the object
+    closes; every later item is a text delta from after the object. Closing the
+    generator (aclose) stops the upstream generation.
+
+    Args:
+        task: Governor/telemetry task label
+        schema: Pydantic model the object must satisfy
+        **kwargs: Arguments forwarded to the chat completion (model, messages, ...)
+
+    Raises:
+        StructuredOutputError before anything is yielded if the object is missing or invalid
+    """
+    scanner = JSONObjectScanner()
+    object_text = None
+    stream = llm_client.stream_chat_completion(task=task, **kwargs)
+    try:
+        async for delta in stream:
+            if object_text is None:
+                object_text = scanner.feed(delta)
+                if object_text is None:
+                    continue
+                yield _validate(object_text, schema, scanner.raw)
+                delta = scanner.tail
+            if delta:
+                yield delta
+        if object_text is None:
+            _validate(None, schema, scanner.raw)
+    finally:
+        # Closing the generator closes the upstream stream and stops generation
+        await stream.aclose()
+
+
+async def extract_structured(task: str, schema: Type[M], **kwargs) -> M:
+    """
+    Stream a completion and return the first JSON object in it, validated against schema.
+
+    Generation is stopped as soon as the object is complete.
+
+    Args:
+        task: Governor/telemetry task label
+        schema: Pydantic model the object must satisfy
+        **kwargs: Arguments forwarded to the chat completion (model, messages, ...)
+
+    Returns:
+        A validated schema instance
+
+    Raises:
+        StructuredOutputError if no object was produced or it failed parsing/validation
+        (LLMOverloadedError / UpstreamUnavailableError propagate unchanged)
+    """
+    stream = stream_structured_prefix(task, schema, **kwargs)
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:  # Not reached: a missing object raises StructuredOutputError
+        raise StructuredOutputError("No JSON object in model output", "")
+    finally:
+        await stream.aclose()
@@ -0,0 +1,372 @@
+"""
+Local stand-ins for the paid upstreams, for offline load tests and benchmarks.
+
+One FastAPI app serves:
+- HyperCLOVA X (OpenAI-compatible):  POST /v1/openai/chat/completions (stream and non-stream)
+                                      POST /v1/openai/embeddings
+- Embedding API (rag_db format):     POST /api/embeddings
+- Clova OCR V2:                       POST /ocr
+- Clova Speech:                       POST /speech
+- Stub settings:                      GET/PUT /stub/config
+
+Run it and point the backend at it:
+
+    python stub_servers.py --port 6100
+
+    CLOVA_STUDIO_BASE_URL=http://localhost:6100/v1/openai
+    EMBEDDING_API_URL=http://localhost:6100
+    CLOVA_OCR_API_URL=http://localhost:6100/ocr        CLOVA_OCR_SECRET_KEY=stub
+    CLOVA_SPEECH_INVOKE_URL=http://localhost:6100/speech CLOVA_SPEECH_SECRET_KEY=stub
+    MILVUS_ENABLED=false
+
+Replies are canned per prompt (intent labels, extraction JSON, scam verdicts,
+chat text) and chosen deterministically from the user text. Embeddings are
+deterministic unit vectors seeded by the text, so identical inputs embed
+identically. Latency (lognormal around a median), LLM time-to-first-token and
+token rate, and error injection are configurable per service via STUB_* env
+vars or PUT /stub/config.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+import uuid
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_SERVICES = ("llm", "embedding", "ocr", "speech")
+STUB_EMBEDDING_DIM = int(os.getenv("STUB_EMBEDDING_DIM", "1024"))
+STUB_OCR_TEXT = os.getenv(
+    "STUB_OCR_TEXT",
+    "CIRCLE K\nBanh mi 25,000\nCa phe sua 30,000\nTONG CONG 55,000 VND\nNgay 2024-05-01",
+)
+STUB_SPEECH_TEXT = os.getenv("STUB_SPEECH_TEXT", "Chuyển 500000 đồng cho tài khoản 0123456789 tiền ăn trưa")
+STUB_CHAT_REPLY_TOKENS = int(os.getenv("STUB_CHAT_REPLY_TOKENS", "120"))
+
+_DEFAULT_LATENCY_MS = {"llm": 300, "embedding": 40, "ocr": 600, "speech": 800}
+
+
+def _service_config(name: str) -> dict:
+    prefix = f"STUB_{name.upper()}_"
+    return {
+        "latency_ms": float(os.getenv(prefix + "LATENCY_MS", str(_DEFAULT_LATENCY_MS[name]))),  # Median
+        "latency_sigma": float(os.getenv(prefix + "LATENCY_SIGMA", "0.3")),  # Lognormal spread
+        "error_rate": float(os.getenv(prefix + "ERROR_RATE", "0")),         # Fraction answered with 503
+        "timeout_rate": float(os.getenv(prefix + "TIMEOUT_RATE", "0")),     # Fraction that hang
+        "hang_seconds": float(os.getenv(prefix + "HANG_SECONDS", "120")),
+    }
+
+
+stub_config = {name: _service_config(name) for name in STUB_SERVICES}
+stub_config["llm"].update({
+    "ttft_ms": float(os.getenv("STUB_LLM_TTFT_MS", "250")),
+    "tokens_per_sec": float(os.getenv("STUB_LLM_TOKENS_PER_SEC", "60")),
+    "stream_error_rate": float(os.getenv("STUB_LLM_STREAM_ERROR_RATE", "0")),  # Drop mid-stream
+})
+
+_rng = random.Random(os.getenv("STUB_SEED"))
+stub_stats = {name: {"requests": 0, "errors_injected": 0, "timeouts_injected": 0} for name in STUB_SERVICES}
+
+app = FastAPI(title="VigiPay upstream stubs")
+
+
+def _sample_latency(cfg: dict, key: str = "latency_ms") -> float:
+    median = cfg[key] / 1000
+    if median <= 0:
+        return 0.0
+    return median * math.exp(_rng.gauss(0, cfg["latency_sigma"]))
+
+
+async def _simulate(service: str, key: str = "latency_ms"):
+    """Apply the service's latency and injected failures to one request."""
+    cfg = stub_config[service]
+    stats = stub_stats[service]
+    stats["requests"] += 1
+    roll = _rng.random()
+    if roll < cfg["timeout_rate"]:
+        stats["timeouts_injected"] += 1
+        await asyncio.sleep(cfg["hang_seconds"])
+    elif roll < cfg["timeout_rate"] + cfg["error_rate"]:
+        stats["errors_injected"] += 1
+        await asyncio.sleep(_sample_latency(cfg, key))
+        raise HTTPException(status_code=503, detail=f"Injected {service} failure")
+    await asyncio.sleep(_sample_latency(cfg, key))
+
+
+# --- Canned content ---
+SCAM_WORDS = ("scam", "lừa đảo", "otp", "password", "mật khẩu", "prize", "trúng thưởng", "click", "link", "urgent")
+TRANSFER_WORDS = ("transfer", "send", "chuyển", "gửi", "송금")
+
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content or [] if part.get("type") == "text")
+
+
+def _choose_intent(user_text: str) -> str:
+    lowered = user_text.lower()
+    if any(w in lowered for w in SCAM_WORDS):
+        return "Scam Check"
+    if any(w in lowered for w in TRANSFER_WORDS):
+        return "Transfer"
+    return "Normal"
+
+
+def _transfer_fields(user_text: str) -> dict:
+    digits = [w.strip(".,") for w in user_text.split() if w.strip(".,").isdigit()]
+    account = next((d for d in digits if len(d) >= 8), None)
+    amount = next((int(d) for d in digits if d != account), None)
+    return {"account_number": account, "amount": amount, "description": user_text[:40] or None}
+
+
+def _chat_reply(user_text: str) -> str:
+    seed = int(hashlib.sha256(user_text.encode("utf-8")).hexdigest()[:8], 16)
+    words = random.Random(seed).choices(
+        ["your", "account", "balance", "is", "safe", "please", "check", "the", "details", "before",
+         "sending", "money", "and", "never", "share", "OTP", "codes", "with", "anyone", "today"],
+        k=STUB_CHAT_REPLY_TOKENS,
+    )
+    return " ".join(words).capitalize() + "."
+
+
+def canned_reply(messages: List[dict]) -> str:
+    """Pick a reply shaped like what the real prompt would produce."""
+    system = " ".join(_text_of(m.get("content")) for m in messages if m.get("role") == "system")
+    user_text = next((_text_of(m.get("content")) for m in reversed(messages) if m.get("role") == "user"), "")
+    intent = _choose_intent(user_text)
+
+    if "transaction_type" in system:
+        return json.dumps({"transaction_type": "expense", "amount": 55000,
+                           "description": "Circle K", "transaction_date": "2024-05-01"})
+    if "intent classification and information extraction" in system:
+        return json.dumps({"intent": intent, **_transfer_fields(user_text)})
+    if "Natural Language Understanding" in system:
+        voice_intent = {"Scam Check": "check_scam", "Transfer": "transfer_money"}.get(intent, "general_chat")
+        payload = {"intent": voice_intent}
+        if voice_intent == "transfer_money":
+            payload.update(_transfer_fields(user_text))
+        return json.dumps(payload, ensure_ascii=False)
+    if "account_number" in system:
+        return json.dumps(_transfer_fields(user_text), ensure_ascii=False)
+    if "intent classification model" in system:
+        return intent
+    if "scam detection expert" in system:
+        if intent == "Scam Check":
+            return ("This is a scam.\nDo not send money or share any codes.\nI may be wrong, so verify through "
+                    "trusted sources.\nExplanation: The message pressures you to act quickly and asks for sensitive data.")
+        return ("This is not a scam.\nStay aware and continue practicing safe habits online.\nI may be mistaken, "
+                "so please double-check if unsure.\nExplanation: No common scam indicators were found.")
+    if "Output only JSON" in system:
+        lowered = user_text.lower()
+        if "total" in lowered or "tong cong" in lowered:
+            return json.dumps({"intent": "BILL"})
+        return json.dumps({"intent": "SCAM_CHECK" if intent == "Scam Check" else "CHAT"})
+    return _chat_reply(user_text)
+
+
+def _tokens(text: str) -> List[str]:
+    """Split a reply into stream deltas of roughly one token each."""
+    deltas, current = [], ""
+    for ch in text:
+        current += ch
+        if ch in " \n" or len(current) >= 4:
+            deltas.append(current)
+            current = ""
+    if current:
+        deltas.append(current)
+    return deltas
+
+
+def _usage(messages: List[dict], completion: str) -> dict:
+    prompt_tokens = sum(len(_text_of(m.get("content"))) for m in messages) // 3
+    completion_tokens = len(_tokens(completion))
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def deterministic_embedding(text: str, dim: int = STUB_EMBEDDING_DIM) -> List[float]:
+    """Unit vector seeded by the text: the same text always gets the same embedding."""
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+# --- HyperCLOVA X (OpenAI-compatible) ---
+@app.post("/v1/openai/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "HCX-005")
+    reply = canned_reply(messages)
+    max_tokens = body.get("max_tokens")
+    deltas = _tokens(reply)
+    if max_tokens:
+        deltas = deltas[:max_tokens]
+    reply = "".join(deltas)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    cfg = stub_config["llm"]
+    if not body.get("stream"):
+        await _simulate("llm")
+        # Non-streaming calls also pay for generating every token
+        if cfg["tokens_per_sec"] > 0:
+            await asyncio.sleep(len(deltas) / cfg["tokens_per_sec"])
+        return {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": _usage(messages, reply),
+        }
+
+    await _simulate("llm", key="ttft_ms")
+
+    def chunk(delta: dict, finish_reason: Optional[str] = None, usage: Optional[dict] = None) -> str:
+        payload = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage is not None:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def generate():
+        yield chunk({"role": "assistant", "content": ""})
+        fail_at = len(deltas) // 2 if _rng.random() < cfg["stream_error_rate"] else None
+        interval = 1 / cfg["tokens_per_sec"] if cfg["tokens_per_sec"] > 0 else 0
+        for i, delta in enumerate(deltas):
+            if i == fail_at:
+                stub_stats["llm"]["errors_injected"] += 1
+                raise RuntimeError("Injected mid-stream failure")
+            if i and interval:
+                await asyncio.sleep(interval)
+            yield chunk({"content": delta})
+        yield chunk({}, finish_reason="stop", usage=_usage(messages, reply))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+@app.post("/v1/openai/embeddings")
+async def openai_embeddings(request: Request):
+    body = await request.json()
+    inputs = body.get("input", "")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    await _simulate("embedding")
+    return {
+        "object": "list",
+        "model": body.get("model", "bge-m3"),
+        "data": [{"object": "embedding", "index": i, "embedding": deterministic_embedding(text)}
+                 for i, text in enumerate(inputs)],
+        "usage": {"prompt_tokens": sum(len(t) // 3 for t in inputs), "total_tokens": sum(len(t) // 3 for t in inputs)},
+    }
+
+
+# --- Embedding API (the format rag_db calls at EMBEDDING_API_URL/api/embeddings) ---
+@app.post("/api/embeddings")
+async def rag_embeddings(request: Request):
+    body = await request.json()
+    await _simulate("embedding")
+    text = body.get("text", "")
+    if isinstance(text, list):
+        return {"success": True, "embeddings": [deterministic_embedding(t) for t in text], "error": None}
+    return {"success": True, "embedding": deterministic_embedding(text), "error": None}
+
+
+# --- Clova OCR V2 ---
+def _ocr_fields(text: str) -> List[dict]:
+    fields = []
+    for row, line in enumerate(text.splitlines()):
+        words = line.split()
+        x = 20
+        for col, word in enumerate(words):
+            width = 14 * len(word)
+            y = 30 + row * 40
+            fields.append({
+                "valueType": "ALL",
+                "boundingPoly": {"vertices": [
+                    {"x": x, "y": y}, {"x": x + width, "y": y},
+                    {"x": x + width, "y": y + 28}, {"x": x, "y": y + 28},
+                ]},
+                "inferText": word,
+                "inferConfidence": 0.99,
+                "type": "NORMAL",
+                "lineBreak": col == len(words) - 1,
+            })
+            x += width + 12
+    return fields
+
+
+@app.post("/ocr")
+async def clova_ocr(request: Request):
+    body = await request.json()
+    await _simulate("ocr")
+    images = body.get("images") or [{"name": "image", "format": "jpg"}]
+    return {
+        "version": body.get("version", "V2"),
+        "requestId": body.get("requestId", str(uuid.uuid4())),
+        "timestamp": int(time.time() * 1000),
+        "images": [{
+            "uid": uuid.uuid4().hex,
+            "name": image.get("name", "image"),
+            "inferResult": "SUCCESS",
+            "message": "SUCCESS",
+            "validationResult": {"result": "NO_REQUESTED"},
+            "convertedImageInfo": {"width": 800, "height": 1200, "pageIndex": 0, "longImage": False},
+            "fields": _ocr_fields(STUB_OCR_TEXT),
+        } for image in images],
+    }
+
+
+# --- Clova Speech (short sentence recognition) ---
+@app.post("/speech")
+async def clova_speech(request: Request):
+    await request.body()
+    await _simulate("speech")
+    return {"text": STUB_SPEECH_TEXT}
+
+
+# --- Stub settings ---
+@app.get("/stub/config")
+async def get_stub_config():
+    return {"config": stub_config, "stats": stub_stats}
+
+
+@app.put("/stub/config")
+async def update_stub_config(request: Request):
+    """Change latency/error settings at runtime, e.g. {"llm": {"error_rate": 0.2}}"""
+    body = await request.json()
+    for service, values in body.items():
+        if service not in stub_config:
+            return JSONResponse(status_code=400, content={"detail": f"Unknown service '{service}'"})
+        for key, value in values.items():
+            if key not in stub_config[service]:
+                return JSONResponse(status_code=400, content={"detail": f"Unknown setting '{service}.{key}'"})
+            stub_config[service][key] = float(value)
+    return {"config": stub_config}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local stand-in servers for HCX-005, embeddings, Clova OCR and Speech")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6100)
+    args = parser.parse_args()
+    base = f"http://{args.host}:{args.port}"
+    print("🧪 Upstream stubs - point the backend at them with:")
+    print(f"   CLOVA_STUDIO_BASE_URL={base}/v1/openai")
+    print(f"   EMBEDDING_API_URL={base}")
+    print(f"   CLOVA_OCR_API_URL={base}/ocr CLOVA_OCR_SECRET_KEY=stub")
+    print(f"   CLOVA_SPEECH_INVOKE_URL={base}/speech CLOVA_SPEECH_SECRET_KEY=stub")
+    print("   MILVUS_ENABLED=false")
+    uvicorn.run(app, host=args.host, port=args.port)
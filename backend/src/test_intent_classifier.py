@@ -0,0 +1,36 @@
+import pytest
+
+from intent_classifier import SCAM_CHECK, TRANSFER, LocalIntentClassifier
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return LocalIntentClassifier(threshold=0.85, enabled=True, shadow_rate=0.0)
+
+
+@pytest.mark.parametrize("surface, text, expected", [
+    ("chat", "send 200k to 0123456789", "Transfer"),
+    ("chat", "is this link a scam http://bit.ly/abc", "Scam Check"),
+    ("voice", "계좌 1234567890으로 5만원 이체해줘", "transfer_money"),
+    ("voice", "top up my phone 50k", "phone_topup"),
+])
+def test_clear_messages_take_the_fast_path(classifier, surface, text, expected):
+    label, _ = classifier.classify(surface, text)
+    assert label == expected
+
+
+@pytest.mark.parametrize("text", [
+    "chuyển 500k cho 0123456789 có phải lừa đảo không",
+    "send 200k to 0123456789, is this a scam?",
+])
+def test_transfer_asking_about_scam_goes_to_llm(classifier, text):
+    label, prediction = classifier.classify("chat", text)
+    assert label is None
+    assert prediction.label == TRANSFER
+    assert prediction.scores[SCAM_CHECK] > 0
+
+
+def test_disabled_classifier_never_answers():
+    classifier = LocalIntentClassifier(enabled=False, shadow_rate=0.0)
+    label, _ = classifier.classify("chat", "send 200k to 0123456789")
+    assert label is None
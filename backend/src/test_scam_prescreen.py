@@ -0,0 +1,70 @@
+import pytest
+
+from scam_prescreen import SCAM, UNCERTAIN, ScamPrescreener
+
+# Scams without any lexicon hit: the pre-screen must leave these to RAG + the LLM
+KEYWORDLESS_SCAMS = [
+    "Hi mum, I lost my phone, this is my new number, can you help me out quickly",
+    "Please install AnyDesk so our technician can fix your computer",
+    "Your package could not be delivered, please update your address",
+    "Hello I am a recruiter offering a remote job with great pay, reply on Telegram",
+]
+
+# Genuine bank OTP notices: the warning not to share the code must not count as a request for it
+BANK_OTP_NOTICES = [
+    "Your OTP code is 123456. Do not share it with anyone.",
+    "Ma OTP cua ban la 123456. Tuyet doi khong cung cap ma cho bat ky ai.",
+    "Mã OTP của bạn là 123456. Tuyệt đối không cung cấp mã cho bất kỳ ai.",
+    "Vietcombank: Your verification code is 884512. Never tell your password to anyone.",
+]
+
+
+@pytest.fixture
+def prescreener():
+    return ScamPrescreener(enabled=True, scam_threshold=6.0, blocklist_file="", allowlist_file="", kb_dir="")
+
+
+@pytest.mark.parametrize("text", KEYWORDLESS_SCAMS)
+def test_keywordless_scams_go_to_llm(prescreener, text):
+    assert prescreener.score(text).tier == UNCERTAIN
+    assert prescreener.screen(text) is None
+
+
+@pytest.mark.parametrize("text", BANK_OTP_NOTICES)
+def test_bank_otp_notices_are_not_short_circuited(prescreener, text):
+    result = prescreener.score(text)
+    assert "send_request" not in result.signals
+    assert prescreener.screen(text) is None
+
+
+def test_negation_in_another_clause_still_counts(prescreener):
+    result = prescreener.screen("Don't worry, just send me the OTP code")
+    assert result is not None and result.tier == SCAM
+
+
+def test_benign_text_is_never_cleared(prescreener):
+    assert prescreener.screen("See you at the coffee shop near the office at three tomorrow") is None
+
+
+def test_credential_request_is_a_scam(prescreener):
+    result = prescreener.screen("URGENT: your account will be locked, send me the OTP code now")
+    assert result is not None
+    assert result.tier == SCAM
+    assert result.verdict_text().startswith("This is a scam.")
+
+
+def test_blocklisted_domain_is_a_scam(tmp_path):
+    blocklist = tmp_path / "blocklist.txt"
+    blocklist.write_text("evil-bank.com\n", encoding="utf-8")
+    prescreener = ScamPrescreener(enabled=True, blocklist_file=str(blocklist), allowlist_file="", kb_dir="")
+    result = prescreener.screen("Check your statement at https://login.evil-bank.com/verify")
+    assert result is not None and result.tier == SCAM
+    assert result.confidence == 0.99
+
+
+def test_stats_count_llm_traffic(prescreener):
+    for text in KEYWORDLESS_SCAMS:
+        prescreener.screen(text)
+    stats = prescreener.stats()
+    assert stats["sent_to_llm"] == len(KEYWORDLESS_SCAMS)
+    assert stats["absorbed_rate"] == 0.0
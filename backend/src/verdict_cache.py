@@ -0,0 +1,122 @@
+"""
+Content-addressed cache for scam-check verdicts.
+
+The same forwarded scam SMS is checked over and over through the text, OCR,
+voice and chat paths. Verdicts are cached under a hash of the normalized input
+text, the scam-check prompt version and the knowledge-base version, so a prompt
+edit or a KB rebuild naturally invalidates old entries. Entries expire after a
+TTL and the cache evicts least-recently-used entries to stay within both an
+entry count and a byte budget.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+# Rough per-entry bookkeeping overhead (key, tuple, OrderedDict node)
+_ENTRY_OVERHEAD_BYTES = 200
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize input so trivially different copies of a message share a key."""
+    text = unicodedata.normalize("NFC", text or "")
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+class VerdictCache:
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 21600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, verdict, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> "VerdictCache":
+        return cls(
+            max_entries=int(os.getenv("SCAM_VERDICT_CACHE_MAX_ENTRIES", "10000")),
+            max_bytes=int(os.getenv("SCAM_VERDICT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("SCAM_VERDICT_CACHE_TTL", "21600")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def make_key(text: str, prompt_version: str, kb_version: str) -> str:
+        raw = "\x1f".join([normalize_text(text), prompt_version, kb_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached verdict for a key, or None on miss/expiry."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, verdict, size = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, key: str, verdict: str):
+        """Store a verdict, evicting least-recently-used entries if needed."""
+        if not self.enabled or not verdict:
+            return
+        size = len(key) + len(verdict.encode("utf-8")) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, verdict, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+verdict_cache = VerdictCache.from_env()
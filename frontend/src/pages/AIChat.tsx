@@ -3,16 +3,25 @@ import { AppSidebar } from "@/components/AppSidebar";
 import { Input } from "@/components/ui/input";
 import { Button } from "@/components/ui/button";
 import { ScrollArea } from "@/components/ui/scroll-area";
-import { Send, Sparkles, User, Mic, Paperclip, X } from "lucide-react";
+import { Badge } from "@/components/ui/badge";
+import { Send, Sparkles, User, Mic, Paperclip, X, ShieldAlert, ShieldCheck } from "lucide-react";
 import { useState, useEffect, useRef } from "react";
 import { useLanguage } from "@/i18n/LanguageContext";
 import { useNavigate } from "react-router-dom";
 
+interface ScamVerdict {
+  verdict: 'scam' | 'not_scam';
+  confidence: number;
+  sources: { source: string; similarity: number }[];
+  cached: boolean;
+}
+
 interface Message {
   role: 'user' | 'assistant';
   content: string;
   timestamp: Date;
   image_data?: string; 
+  scamVerdict?: ScamVerdict;
 }
 
 const ChatInputBar = ({ 
@@ -324,7 +333,24 @@ e
           if (line.startsWith('data: ')) {
             const data = line.substring(6);
             
-            if (data.includes('<<<TRANSFER_DATA>>>')) {
+            if (data.includes('<<<SCAM_VERDICT>>>')) {
+              // Structured verdict arrives before the explanation text
+              const jsonStart = data.indexOf('{');
+              const jsonEnd = data.lastIndexOf('}') + 1;
+              if (jsonStart !== -1 && jsonEnd > jsonStart) {
+                try {
+                  const scamVerdict: ScamVerdict = JSON.parse(data.substring(jsonStart, jsonEnd));
+                  setMessages(prev => {
+                    const newMessages = [...prev];
+                    const lastMessage = newMessages[newMessages.length - 1];
+                    lastMessage.scamVerdict = scamVerdict;
+                    return newMessages;
+                  });
+                } catch (e) {
+                  console.error("Failed to parse scam verdict:", e);
+                }
+              }
+            } else if (data.includes('<<<TRANSFER_DATA>>>')) {
               const jsonStart = data.indexOf('{');
               const jsonEnd = data.lastIndexOf('}') + 1;
               if (jsonStart !== -1 && jsonEnd > jsonStart) {
@@ -450,6 +476,21 @@ e
                               className="w-full h-auto rounded mb-2 max-w-xs"
                             />
                           )}
+                          {/* Early scam verdict, shown before the explanation finishes streaming */}
+                          {message.scamVerdict && (
+                            <Badge
+                              variant={message.scamVerdict.verdict === 'scam' ? 'destructive' : 'secondary'}
+                              className="mb-2 gap-1"
+                            >
+                              {message.scamVerdict.verdict === 'scam' ? (
+                                <ShieldAlert className="h-3 w-3" />
+                              ) : (
+                                <ShieldCheck className="h-3 w-3" />
+                              )}
+                              {message.scamVerdict.verdict === 'scam' ? 'Scam' : 'Not a scam'}
+                              {` · ${Math.round(message.scamVerdict.confidence * 100)}%`}
+                            </Badge>
+                          )}
                           <p className="text-sm whitespace-pre-wrap">{message.content}</p>
                           <p
                             className={`text-xs mt-2 ${
@@ -151,19 +151,35 @@ const SafetyChecking = () => {
       if (!reader) throw new Error("No response body");
       const decoder = new TextDecoder();
       let fullResponse = "";
-      while (true) {
+      let earlyVerdict: string | null = null;
+      while (earlyVerdict === null) {
         const { done, value } = await reader.read();
         if (done) break;
         const chunk = decoder.decode(value);
         const lines = chunk.split('\n\n').filter((line: string) => line.trim() !== '');
         for (const line of lines) {
-          if (line.startsWith('data: ') && !line.includes('[ERROR]')) {
+          if (line.includes('<<<SCAM_VERDICT>>>')) {
+            // The verdict event precedes the explanation, so the transfer can be decided right away
+            const jsonStart = line.indexOf('{');
+            const jsonEnd = line.lastIndexOf('}') + 1;
+            try {
+              earlyVerdict = JSON.parse(line.substring(jsonStart, jsonEnd)).verdict;
+            } catch (e) {
+              console.error("Failed to parse scam verdict:", e);
+            }
+          } else if (line.startsWith('data: ') && !line.includes('[ERROR]')) {
             fullResponse += line.substring(6);
           }
         }
       }
+      if (earlyVerdict !== null) {
+        reader.cancel();
+      }
 
-      if (fullResponse.toLowerCase().includes('scam') || fullResponse.toLowerCase().includes('suspicious') || fullResponse.toLowerCase().includes('fraud')) {
+      const flagged = earlyVerdict !== null
+        ? earlyVerdict === 'scam'
+        : fullResponse.toLowerCase().includes('scam') || fullResponse.toLowerCase().includes('suspicious') || fullResponse.toLowerCase().includes('fraud');
+      if (flagged) {
         await handleScamCheck(userMessage, imageData, toastId);
       } else {
         sonnerToast.success("Analysis complete. Safe to proceed.", { id: toastId });